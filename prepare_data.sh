@@ -1,11 +1,68 @@
 echo "building SQLite databases from orthoDB tables"
 echo "This will probably take a while"
-python ./scripts-gen_SQLite_dbs/make_SQLite_database_fasta.py
+# usage: bash ./prepare_data.sh [-j <n>] [database build arguments]
+# any other arguments (e.g. --optimized_schema) are passed on to each of the database build scripts
+# the five SQLite databases of the orthoDB tables are built at the same time. The
+# indexes are built after them, at most <n> (default 2) at a time, so that the
+# builds don't all compete for the memory and disk of the machine at once
+# the output of each build is written to a log file next to this script
+max_jobs=2
+if [ "$1" = "-j" ]; then
+    max_jobs=$2
+    shift 2
+fi
+mkdir -p ./scripts-gen_SQLite_dbs/logs
+
+run_build() {
+    # usage: run_build <script> [script arguments]
+    local script=$1
+    shift
+    local log_file="./scripts-gen_SQLite_dbs/logs/${script%.py}.log"
+    echo "starting ${script} (log: ${log_file})"
+    python -u "./scripts-gen_SQLite_dbs/${script}" "$@" > "${log_file}" 2>&1
+}
+export -f run_build
+
+status=0
+pids=()
+for script in \
+    make_SQLite_database_fasta.py \
+    make_SQLite_database_genes.py \
+    make_SQLite_database_gene_xrefs.py \
+    make_SQLite_database_OGs.py \
+    make_SQLite_database_OG2genes.py
+do
+    run_build "${script}" "$@" &
+    pids+=($!)
+done
+for pid in "${pids[@]}"; do
+    if ! wait "${pid}"; then
+        status=1
+    fi
+done
+
+# make_SQLite_database_seq_info.py: sequence lengths and digests, read straight from the fasta file
+# make_SQLite_database_gene_search.py: full-text search index of the gene names, ids and descriptions
+# the others: memory-mapped indexes that are built straight from the orthoDB tables
+if ! printf "%s\n" \
+    make_SQLite_database_seq_info.py \
+    make_SQLite_database_gene_search.py \
+    make_OG2genes_index.py \
+    make_OG_level_index.py \
+    make_taxonomy_index.py \
+    make_xref_index.py \
+    make_sequence_store.py \
+    make_kmer_index.py \
+    make_table_cache.py \
+    | xargs -P "${max_jobs}" -I {} bash -c 'run_build "$1"' _ {}
+then
+    status=1
+fi
+
 echo "---"
-python ./scripts-gen_SQLite_dbs/make_SQLite_database_genes.py
-echo "---"
-python ./scripts-gen_SQLite_dbs/make_SQLite_database_gene_xrefs.py
-echo "---"
-python ./scripts-gen_SQLite_dbs/make_SQLite_database_OGs.py
-echo "---"
-python ./scripts-gen_SQLite_dbs/make_SQLite_database_OG2genes.py
+tail -n 2 ./scripts-gen_SQLite_dbs/logs/*.log
+if [ "${status}" -ne 0 ]; then
+    echo "at least one of the databases failed to build, check the log files in ./scripts-gen_SQLite_dbs/logs/"
+    exit 1
+fi
+echo "done"
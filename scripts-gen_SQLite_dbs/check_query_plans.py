@@ -0,0 +1,84 @@
+"""check that none of the pipeline queries fall back to a full table scan
+
+runs `EXPLAIN QUERY PLAN` for every query in
+`local_orthoDB_group_pipeline.sql_queries.PIPELINE_QUERIES` (and the lookup
+that Biopython's `SeqIO.index_db` runs against the sequence index) and exits
+with a non-zero status if any of the plans contain a `SCAN` step.
+
+The set-based uniprot id mapping queries (`sql_queries.BULK_MAP_QUERIES`) are
+checked against the attached gene_refs and gene_xrefs databases. They loop
+over the temp table of the query ids (`SCAN q`), and every other table has to
+be searched with one of the indexes of the database (e.g. idx_Uniprotid and
+idx_xref_id), not with a scan or an automatic index.
+
+The default schema fails this check for `get_all_odb_gene_ids_from_species_id`
+(species_id is not indexed). Databases built with
+`bash prepare_data.sh --optimized_schema` should pass.
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import sql_queries
+
+# the query that `SeqIO.index_db` uses to look up a record
+SEQUENCE_INDEX_QUERY = "SELECT file_number, offset, length FROM offset_data WHERE key=?"
+
+
+def get_query_plan(db_path: str, query: str) -> list[str]:
+    n_parameters = query.count("?") + query.count("{placeholders}")
+    query = query.format(placeholders="?")
+    connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    res = connection.execute(f"EXPLAIN QUERY PLAN {query}", [""] * n_parameters)
+    plan = [row[3] for row in res.fetchall()]
+    connection.close()
+    return plan
+
+
+def get_bulk_map_query_plans() -> dict[str, list[str]]:
+    connection = sql_queries.open_attached_connection(
+        {
+            alias: getattr(env.orthoDB_files, db_attribute)
+            for alias, db_attribute in sql_queries.BULK_MAP_DATABASES.items()
+        }
+    )
+    connection.execute(sql_queries.BULK_MAP_CREATE_QUERY_IDS_SQL)
+    plans = {
+        name: [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()]
+        for name, query in sql_queries.BULK_MAP_QUERIES.items()
+    }
+    connection.close()
+    return plans
+
+
+def main() -> int:
+    queries = {
+        name: (getattr(env.orthoDB_files, db_attribute), query)
+        for name, (db_attribute, query) in sql_queries.PIPELINE_QUERIES.items()
+    }
+    queries["SeqIO.index_db lookup"] = (env.orthoDB_files.all_seqs_sqlite, SEQUENCE_INDEX_QUERY)
+    plans = {name: get_query_plan(db_path, query) for name, (db_path, query) in queries.items()}
+    plans.update(get_bulk_map_query_plans())
+    failures = []
+    for name, plan in plans.items():
+        scans = [
+            step
+            for step in plan
+            if (step.startswith("SCAN") and not (name in sql_queries.BULK_MAP_QUERIES and step == "SCAN q"))
+            or "AUTOMATIC" in step
+        ]
+        status = "FAIL" if scans else "ok"
+        print(f"[{status}] {name}: {' | '.join(plan)}")
+        if scans:
+            failures.append(name)
+    if failures:
+        print(f"{len(failures)} queries fall back to a table scan: {failures}")
+        return 1
+    print("all queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
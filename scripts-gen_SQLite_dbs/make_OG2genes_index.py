@@ -0,0 +1,7 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import og_membership_index
+
+og_membership_index.build_og_membership_index(
+    og2genes_tsv=env.orthoDB_files.OG2genes_tsv,
+    index_dir=env.orthoDB_files.OG2genes_index_dir,
+)
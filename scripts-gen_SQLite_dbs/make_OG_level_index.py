@@ -0,0 +1,8 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import og_level_index
+
+og_level_index.build_og_level_index(
+    og2genes_tsv=env.orthoDB_files.OG2genes_tsv,
+    ogs_tsv=env.orthoDB_files.ogs_tsv,
+    index_dir=env.orthoDB_files.OG_level_index_dir,
+)
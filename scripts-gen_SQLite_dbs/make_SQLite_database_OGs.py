@@ -1,3 +1,4 @@
+import argparse
 import sqlite3
 from pathlib import Path
 
@@ -5,16 +6,35 @@ import sqlite3_db_tools as sqltools
 
 import local_env_variables.env_variables as env
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--optimized_schema",
+    action="store_true",
+    help="build WITHOUT ROWID tables with composite/covering indexes (see sqlite3_db_tools.create_optimized_sqlitedb_from_csv)",
+)
+args = parser.parse_args()
+
 db_file_name = env.orthoDB_files.ogs_sqlite
 Path(db_file_name).touch()
 connection = sqlite3.connect(db_file_name)
 cursor = connection.cursor()
-sqltools.create_sqlitedb_from_csv(
-    cursor,
-    connection,
-    csv_file_name=env.orthoDB_files.ogs_tsv,
-    table_name="OGs",
-    column_names=["OG_id", "level_NCBI_tax_id", "OG_name"],
-    index_column_name="OG_id",
-)
+if args.optimized_schema:
+    sqltools.create_optimized_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name=env.orthoDB_files.ogs_tsv,
+        table_name="OGs",
+        column_names=["OG_id", "level_NCBI_tax_id", "OG_name"],
+        primary_key=["OG_id"],
+        indexes=[["level_NCBI_tax_id", "OG_id"]],
+    )
+else:
+    sqltools.create_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name=env.orthoDB_files.ogs_tsv,
+        table_name="OGs",
+        column_names=["OG_id", "level_NCBI_tax_id", "OG_name"],
+        index_column_name="OG_id",
+    )
 connection.close()
@@ -1,8 +1,26 @@
+import argparse
+import sqlite3
+
 from Bio import Seq, SeqIO
 
 import local_env_variables.env_variables as env
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--optimized_schema",
+    action="store_true",
+    help="gather query planner statistics (ANALYZE) for the sequence index. The table layout is set by Biopython",
+)
+args = parser.parse_args()
+
 seq_file = env.orthoDB_files.all_seqs_fasta
 sqlite_file = env.orthoDB_files.all_seqs_sqlite
 records = SeqIO.index_db(sqlite_file, seq_file, 'fasta')
 records.close()
+
+if args.optimized_schema:
+    connection = sqlite3.connect(sqlite_file)
+    print("ANALYZE")
+    connection.execute("ANALYZE")
+    connection.commit()
+    connection.close()
@@ -0,0 +1,56 @@
+"""build a full-text (FTS5) search index of the gene names, ids and descriptions in the orthoDB genes table
+
+The index is searched with `local_orthoDB_group_pipeline.gene_search.search_genes`
+or `src/local_scripts/search_genes.py`
+"""
+import csv
+import sqlite3
+from pathlib import Path
+
+import sqlite3_db_tools as sqltools
+
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import xref_index
+
+
+def iter_gene_search_rows(gene_refs_tsv: str):
+    with open(gene_refs_tsv, "r", newline="") as csv_file:
+        for row in csv.reader(csv_file, delimiter="\t", quoting=csv.QUOTE_NONE):
+            gene = dict(zip(xref_index.GENE_REFS_COLUMNS, row))
+            gene_names = " ".join(
+                name for name in gene.get("synonyms", "").split(";") + [gene.get("NCBI_id", "")] if name
+            )
+            ids = " ".join(
+                i
+                for i in [gene.get("source_id", ""), gene.get("Uniprotid", "")] + gene.get("Ensemble", "").split(";")
+                if i
+            )
+            yield gene["odb_gene_id"], gene.get("species_id", ""), gene_names, ids, gene.get("description", "")
+
+
+db_file_name = env.orthoDB_files.gene_search_sqlite
+Path(db_file_name).unlink(missing_ok=True)
+connection = sqlite3.connect(db_file_name)
+cursor = connection.cursor()
+sqltools.set_bulk_load_pragmas(cursor)
+print(f"creating sqlite database from: {env.orthoDB_files.gene_refs_tsv}")
+create_table = (
+    "CREATE VIRTUAL TABLE gene_search USING fts5("
+    "odb_gene_id UNINDEXED, species_id, gene_names, ids, description)"
+)
+print(create_table)
+cursor.execute(create_table)
+insert_line = "INSERT INTO gene_search (odb_gene_id, species_id, gene_names, ids, description) VALUES (?,?,?,?,?)"
+print(insert_line)
+sqltools.load_rows_in_batches(
+    cursor,
+    connection,
+    iter_gene_search_rows(env.orthoDB_files.gene_refs_tsv),
+    "gene_search",
+    insert_line,
+)
+# merge the index b-trees into one so that queries read as few pages as possible
+print("INSERT INTO gene_search(gene_search) VALUES('optimize')")
+cursor.execute("INSERT INTO gene_search(gene_search) VALUES('optimize')")
+connection.commit()
+connection.close()
@@ -1,3 +1,4 @@
+import argparse
 import sqlite3
 from pathlib import Path
 
@@ -5,17 +6,36 @@ import sqlite3_db_tools as sqltools
 
 import local_env_variables.env_variables as env
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--optimized_schema",
+    action="store_true",
+    help="build WITHOUT ROWID tables with composite/covering indexes (see sqlite3_db_tools.create_optimized_sqlitedb_from_csv)",
+)
+args = parser.parse_args()
+
 db_file_name = env.orthoDB_files.gene_xrefs_sqlite
 Path(db_file_name).touch()
 connection = sqlite3.connect(db_file_name)
 cursor = connection.cursor()
-sqltools.create_sqlitedb_from_csv(
-    cursor,
-    connection,
-    csv_file_name = env.orthoDB_files.gene_xrefs_tsv,
-    table_name = 'gene_xrefs',
-    column_names = ['odb_gene_id', 'xref_id', 'DB_name'],
-    index_column_name = ['odb_gene_id', 'xref_id', 'DB_name']
-)
+if args.optimized_schema:
+    sqltools.create_optimized_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name = env.orthoDB_files.gene_xrefs_tsv,
+        table_name = 'gene_xrefs',
+        column_names = ['odb_gene_id', 'xref_id', 'DB_name'],
+        primary_key = ['xref_id', 'DB_name', 'odb_gene_id'],
+        indexes = [['odb_gene_id', 'DB_name', 'xref_id']],
+    )
+else:
+    sqltools.create_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name = env.orthoDB_files.gene_xrefs_tsv,
+        table_name = 'gene_xrefs',
+        column_names = ['odb_gene_id', 'xref_id', 'DB_name'],
+        index_column_name = ['odb_gene_id', 'xref_id', 'DB_name']
+    )
 
 connection.close()
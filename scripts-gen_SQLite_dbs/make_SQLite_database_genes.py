@@ -1,3 +1,4 @@
+import argparse
 import sqlite3
 from pathlib import Path
 
@@ -5,26 +6,54 @@ import sqlite3_db_tools as sqltools
 
 import local_env_variables.env_variables as env
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--optimized_schema",
+    action="store_true",
+    help="build WITHOUT ROWID tables with composite/covering indexes (see sqlite3_db_tools.create_optimized_sqlitedb_from_csv)",
+)
+args = parser.parse_args()
+
 db_file_name = env.orthoDB_files.gene_refs_sqlite
 Path(db_file_name).touch()
 connection = sqlite3.connect(db_file_name)
 cursor = connection.cursor()
-sqltools.create_sqlitedb_from_csv(
-    cursor,
-    connection,
-    csv_file_name = env.orthoDB_files.gene_refs_tsv,
-    table_name = 'gene_refs',
-    column_names = [
-        'odb_gene_id',
-        'species_id',
-        'source_id',
-        'synonyms',
-        'Uniprotid',
-        'Ensemble',
-        'NCBI_id',
-        'description',
-    ],
-    index_column_name=['odb_gene_id', 'Uniprotid']
-)
+if args.optimized_schema:
+    sqltools.create_optimized_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name = env.orthoDB_files.gene_refs_tsv,
+        table_name = 'gene_refs',
+        column_names = [
+            'odb_gene_id',
+            'species_id',
+            'source_id',
+            'synonyms',
+            'Uniprotid',
+            'Ensemble',
+            'NCBI_id',
+            'description',
+        ],
+        primary_key=['odb_gene_id'],
+        indexes=[['Uniprotid', 'odb_gene_id'], ['species_id', 'odb_gene_id']],
+    )
+else:
+    sqltools.create_sqlitedb_from_csv(
+        cursor,
+        connection,
+        csv_file_name = env.orthoDB_files.gene_refs_tsv,
+        table_name = 'gene_refs',
+        column_names = [
+            'odb_gene_id',
+            'species_id',
+            'source_id',
+            'synonyms',
+            'Uniprotid',
+            'Ensemble',
+            'NCBI_id',
+            'description',
+        ],
+        index_column_name=['odb_gene_id', 'Uniprotid']
+    )
 
 connection.close()
@@ -0,0 +1,52 @@
+"""build a table of the length and md5 digest of every sequence in the orthoDB fasta file
+
+The table lets the pipeline compare sequence lengths (e.g. to pick the longest
+of several genes that a uniprot id maps to) and find identical sequences with a
+query instead of reading the fasta file. It is always built as a WITHOUT ROWID
+table keyed on odb_gene_id, with an index on the digest.
+"""
+import hashlib
+import sqlite3
+from pathlib import Path
+
+import sqlite3_db_tools as sqltools
+
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import sequence_store
+
+
+def iter_seq_info_rows(fasta_file: str):
+    for header, sequence in sequence_store._iter_fasta(fasta_file):
+        # Biopython uses the first word of the header line as the id
+        odb_gene_id = header.split(None, 1)[0] if header.strip() else ""
+        yield odb_gene_id, len(sequence), hashlib.md5(sequence.encode()).hexdigest()
+
+
+db_file_name = env.orthoDB_files.seq_info_sqlite
+Path(db_file_name).unlink(missing_ok=True)
+connection = sqlite3.connect(db_file_name)
+cursor = connection.cursor()
+sqltools.set_bulk_load_pragmas(cursor)
+print(f"creating sqlite database from: {env.orthoDB_files.all_seqs_fasta}")
+create_table = (
+    "CREATE TABLE seq_info (odb_gene_id TEXT NOT NULL, seq_length INTEGER NOT NULL, "
+    "seq_md5 TEXT NOT NULL, PRIMARY KEY (odb_gene_id)) WITHOUT ROWID"
+)
+print(create_table)
+cursor.execute(create_table)
+insert_line = "INSERT OR IGNORE INTO seq_info (odb_gene_id, seq_length, seq_md5) VALUES (?,?,?)"
+print(insert_line)
+sqltools.load_rows_in_batches(
+    cursor,
+    connection,
+    iter_seq_info_rows(env.orthoDB_files.all_seqs_fasta),
+    "seq_info",
+    insert_line,
+)
+create_index = "CREATE INDEX idx_seq_info_seq_md5_odb_gene_id ON seq_info (seq_md5, odb_gene_id)"
+print(create_index)
+cursor.execute(create_index)
+print("ANALYZE")
+cursor.execute("ANALYZE")
+connection.commit()
+connection.close()
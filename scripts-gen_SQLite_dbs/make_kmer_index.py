@@ -0,0 +1,7 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import sequence_search
+
+sequence_search.build_kmer_index(
+    fasta_file=env.orthoDB_files.all_seqs_fasta,
+    index_dir=env.orthoDB_files.kmer_index_dir,
+)
@@ -0,0 +1,7 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import sequence_store
+
+sequence_store.build_sequence_store(
+    fasta_file=env.orthoDB_files.all_seqs_fasta,
+    store_dir=env.orthoDB_files.all_seqs_store_dir,
+)
@@ -0,0 +1,10 @@
+import local_env_variables.env_variables as env
+
+# reading the tables creates (or refreshes) their binary cache
+for load_table in [
+    env.load_data_species_df,
+    env.load_data_levels_df,
+    env.load_data_level2species_df,
+]:
+    table_df = load_table()
+    print(f"{load_table.__name__}: {len(table_df):,} rows cached in {env.orthoDB_files.table_cache_dir}")
@@ -0,0 +1,8 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import taxonomy_index
+
+taxonomy_index.build_taxonomy_index(
+    level2species_tsv=env.orthoDB_files.levels2species_tsv,
+    levels_tsv=env.orthoDB_files.levels_tsv,
+    index_dir=env.orthoDB_files.taxonomy_index_dir,
+)
@@ -0,0 +1,8 @@
+import local_env_variables.env_variables as env
+from local_orthoDB_group_pipeline import xref_index
+
+xref_index.build_xref_index(
+    gene_refs_tsv=env.orthoDB_files.gene_refs_tsv,
+    gene_xrefs_tsv=env.orthoDB_files.gene_xrefs_tsv,
+    index_dir=env.orthoDB_files.xref_index_dir,
+)
@@ -1,6 +1,87 @@
 import csv
+import itertools
 import sqlite3
+import time
 from pathlib import Path
+from typing import Iterable, Sequence
+
+# pragmas used while the database is being built. They turn off the rollback
+# journal and fsyncs, which is only safe because a failed build is just rerun
+# from scratch.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA locking_mode=EXCLUSIVE",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-1048576",  # 1 GiB
+]
+
+
+def set_bulk_load_pragmas(cursor: sqlite3.Cursor):
+    for pragma in BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
+
+
+def load_rows_in_batches(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    rows: Iterable[Sequence],
+    table_name: str,
+    insert_line: str,
+    batch_size: int = 100_000,
+    report_every_n_batches: int = 10,
+) -> int:
+    """insert rows from an iterable into a table with `executemany`
+
+    All of the rows are inserted in a single transaction. The loading rate is
+    printed every `report_every_n_batches` batches. Returns the number of rows read.
+    """
+    n_rows = 0
+    n_batches = 0
+    start_time = time.perf_counter()
+    cursor.execute("BEGIN")
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(insert_line, batch)
+        n_rows += len(batch)
+        n_batches += 1
+        if n_batches % report_every_n_batches == 0:
+            elapsed = time.perf_counter() - start_time
+            print(f"{table_name}: {n_rows:,} rows loaded ({n_rows / elapsed:,.0f} rows/s)")
+    connection.commit()
+    elapsed = time.perf_counter() - start_time
+    print(f"{table_name}: finished loading {n_rows:,} rows in {elapsed:,.1f} s ({n_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return n_rows
+
+
+def load_csv_in_batches(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    csv_file_name: str | Path,
+    table_name: str,
+    insert_line: str,
+    batch_size: int = 100_000,
+    report_every_n_batches: int = 10,
+) -> int:
+    """stream the rows of a tab separated file into a table with `executemany`
+
+    see `load_rows_in_batches`. Returns the number of rows read.
+    """
+    # import the csv file
+    with open(csv_file_name, "r", newline="") as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter="\t")
+        return load_rows_in_batches(
+            cursor,
+            connection,
+            csv_reader,
+            table_name,
+            insert_line,
+            batch_size=batch_size,
+            report_every_n_batches=report_every_n_batches,
+        )
 
 
 def create_sqlitedb_from_csv(
@@ -10,9 +91,15 @@ def create_sqlitedb_from_csv(
     table_name: str,
     column_names: list[str],
     index_column_name: str | list[str] | None = None,
+    batch_size: int = 100_000,
+    report_every_n_batches: int = 10,
 ):
     """create a sqlite table from a csv file
 
+    The rows are inserted in batches of `batch_size` with `executemany` inside
+    a single transaction, and the indexes are only built once all of the rows
+    are loaded.
+
     Parameters
     ----------
     cursor : sqlite3.Cursor
@@ -27,15 +114,17 @@ def create_sqlitedb_from_csv(
         column names of the table
     index_column_name : str | list[str] | None, optional
         columns to index for faster queries, by default None
-    """    
+    batch_size : int, optional
+        number of rows inserted per `executemany` call, by default 100_000
+    report_every_n_batches : int, optional
+        print the loading rate after this many batches, by default 10
+    """
     print(f"creating sqlite database from: {csv_file_name}")
     print(f"table name: {table_name}")
     print(f"column names: {column_names}")
     print(f"indexed columns: {index_column_name}")
     print(f"text sent to sqlite3:")
-    # import the csv file
-    csv_file = open(csv_file_name, "r")
-    csv_reader = csv.reader(csv_file, delimiter="\t")
+    set_bulk_load_pragmas(cursor)
     # Table Definition
     create_table = f"CREATE TABLE IF NOT EXISTS {table_name} (ind INTEGER PRIMARY KEY AUTOINCREMENT,"
     for column_name in column_names:
@@ -51,9 +140,15 @@ def create_sqlitedb_from_csv(
         insert_line += "?,"
     insert_line = insert_line[:-1] + ")"
     print(insert_line)
-    for line in csv_reader:
-        cursor.execute(insert_line, line)
-    csv_file.close()
+    load_csv_in_batches(
+        cursor,
+        connection,
+        csv_file_name,
+        table_name,
+        insert_line,
+        batch_size=batch_size,
+        report_every_n_batches=report_every_n_batches,
+    )
     if index_column_name is not None:
         # if index_column_name is not a list, make it a list
         if isinstance(index_column_name, str):
@@ -61,5 +156,92 @@ def create_sqlitedb_from_csv(
         for column_name in index_column_name:
             create_index = f"CREATE INDEX IF NOT EXISTS idx_{column_name} ON {table_name} ({column_name})"
             print(create_index)
+            index_start_time = time.perf_counter()
             cursor.execute(create_index)
+            print(f"{table_name}: built idx_{column_name} in {time.perf_counter() - index_start_time:,.1f} s")
+    connection.commit()
+
+
+def create_optimized_sqlitedb_from_csv(
+    cursor: sqlite3.Cursor,
+    connection: sqlite3.Connection,
+    csv_file_name: str | Path,
+    table_name: str,
+    column_names: list[str],
+    primary_key: list[str],
+    indexes: list[list[str]] | None = None,
+    batch_size: int = 100_000,
+    report_every_n_batches: int = 10,
+):
+    """create a WITHOUT ROWID sqlite table from a csv file
+
+    Unlike `create_sqlitedb_from_csv`, the table has no surrogate `ind` column.
+    It is stored as a b-tree keyed on `primary_key`, so a lookup on the leading
+    primary key column(s) returns the whole row without a second search. The
+    extra indexes can be composite and should list every column that a query
+    reads so that they cover the query. `ANALYZE` is run at the end so the
+    query planner has statistics to choose between the indexes.
+
+    Rows with a duplicate primary key are dropped.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        cursor to the database
+    connection : sqlite3.Connection
+        connection to the database
+    csv_file_name : str | Path
+        csv file to import
+    table_name : str
+        name of the table to create
+    column_names : list[str]
+        column names of the table
+    primary_key : list[str]
+        columns that make up the primary key of the table
+    indexes : list[list[str]] | None, optional
+        the columns of each (composite) index to create, by default None
+    batch_size : int, optional
+        number of rows inserted per `executemany` call, by default 100_000
+    report_every_n_batches : int, optional
+        print the loading rate after this many batches, by default 10
+    """
+    print(f"creating optimized sqlite database from: {csv_file_name}")
+    print(f"table name: {table_name}")
+    print(f"column names: {column_names}")
+    print(f"primary key: {primary_key}")
+    print(f"indexes: {indexes}")
+    print(f"text sent to sqlite3:")
+    set_bulk_load_pragmas(cursor)
+    columns = ", ".join(f"{column_name} TEXT NOT NULL" for column_name in column_names)
+    create_table = (
+        f"CREATE TABLE IF NOT EXISTS {table_name} "
+        f"({columns}, PRIMARY KEY ({', '.join(primary_key)})) WITHOUT ROWID"
+    )
+    print(create_table)
+    cursor.execute(create_table)
+    insert_line = (
+        f"INSERT OR IGNORE INTO {table_name} ({','.join(column_names)}) "
+        f"VALUES ({','.join('?' * len(column_names))})"
+    )
+    print(insert_line)
+    load_csv_in_batches(
+        cursor,
+        connection,
+        csv_file_name,
+        table_name,
+        insert_line,
+        batch_size=batch_size,
+        report_every_n_batches=report_every_n_batches,
+    )
+    if indexes is None:
+        indexes = []
+    for index_columns in indexes:
+        index_name = f"idx_{table_name}_{'_'.join(index_columns)}"
+        create_index = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(index_columns)})"
+        print(create_index)
+        index_start_time = time.perf_counter()
+        cursor.execute(create_index)
+        print(f"{table_name}: built {index_name} in {time.perf_counter() - index_start_time:,.1f} s")
+    print("ANALYZE")
+    cursor.execute("ANALYZE")
     connection.commit()
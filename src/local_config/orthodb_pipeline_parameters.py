@@ -20,10 +20,29 @@ class FilterConf:
     `min_fraction_shorter_than_query`: float,
         the minimum fraction of the query sequence length that each orthogroup sequence must be.
         Default: 0.5
+    `species_level_name`: Optional[str],
+        only keep the orthogroup sequences of species under this level (e.g.
+        "Mammalia" when the orthogroup is selected at "Vertebrata"). The group
+        is restricted before any sequences are fetched.
+        Default: None (no restriction)
+    `species_include`: Optional[list[str]],
+        only keep the orthogroup sequences of these species (orthoDB species
+        ids, e.g. "9606_0"). Combined with `species_level_name` if both are given.
+        Default: None (no restriction)
+    `species_exclude`: list[str],
+        drop the orthogroup sequences of these species.
+        Default: []
+
+    The query sequence is always kept.
     """
     min_fraction_shorter_than_query: float = field(
         default=0.5, validator=validators.and_(validators.le(1), validators.ge(0))
     )
+    species_level_name: Optional[str] = field(default=None)
+    species_include: Optional[list[str]] = field(
+        default=None, converter=lambda x: None if x is None else list(x)
+    )
+    species_exclude: list[str] = field(factory=list, converter=list)
 
 
 @define
@@ -108,6 +127,9 @@ class PipelineParams:
     _cd_hit_additional_args: str = field(default=env.CD_HIT_ADDITIONAL_ARGUMENTS)
     main_output_folder: str = field(default="./processed_odb_groups_output")
     write_files: bool = field(default=True)
+    results_sink: Union[str, Literal["json", "sqlite"]] = field(
+        default="json", validator=validators.in_(["json", "sqlite"])
+    )
 
     @classmethod
     def from_dict(cls, d):
@@ -1,13 +1,15 @@
-import copy
+import functools
 import os
 from pathlib import Path
 
 import dotenv
-import pandas as pd
 # from attrs import define, field
 from attrs import frozen
 from Bio import SeqIO
 
+from local_orthoDB_group_pipeline import sequence_store, table_cache
+from local_orthoDB_group_pipeline.sequence_record import SequenceRecord
+
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 dotenv.load_dotenv(dotenv_path)
 orthodb_dir = Path(os.environ['ORTHODB_DATA_DIR'])
@@ -24,17 +26,26 @@ CD_HIT_ADDITIONAL_ARGUMENTS = os.environ['CD_HIT_ADDITIONAL_ARGUMENTS']
 class orthoDB_files_object:
     all_seqs_fasta: str = str(orthodb_dir / "odb11v0_all_og_fasta.tab")
     all_seqs_sqlite: str = str(orthodb_dir / "odb11v0_all_og.sqlite")
+    all_seqs_store_dir: str = str(orthodb_dir / "odb11v0_all_og_seqstore")
+    kmer_index_dir: str = str(orthodb_dir / "odb11v0_all_og_kmer_index")
+    seq_info_sqlite: str = str(orthodb_dir / "odb11v0_seq_info.sqlite")
     gene_refs_tsv: str = str(orthodb_dir / "odb11v0_genes.tab")
     gene_refs_sqlite: str = str(orthodb_dir / "odb11v0_genes.sqlite")
+    gene_search_sqlite: str = str(orthodb_dir / "odb11v0_gene_search.sqlite")
     gene_xrefs_tsv = str(orthodb_dir / "odb11v0_gene_xrefs.tab")
     gene_xrefs_sqlite = str(orthodb_dir / "odb11v0_gene_xrefs.sqlite")
+    xref_index_dir: str = str(orthodb_dir / "odb11v0_xref_index")
     ogs_tsv: str = str(orthodb_dir / "odb11v0_OGs.tab")
     ogs_sqlite: str = str(orthodb_dir / "odb11v0_OGs.sqlite")
     OG2genes_tsv: str = str(orthodb_dir / "odb11v0_OG2genes.tab")
     OG2genes_sqlite: str = str(orthodb_dir / "odb11v0_OG2genes.sqlite")
+    OG2genes_index_dir: str = str(orthodb_dir / "odb11v0_OG2genes_index")
+    OG_level_index_dir: str = str(orthodb_dir / "odb11v0_OG_level_index")
+    taxonomy_index_dir: str = str(orthodb_dir / "odb11v0_taxonomy_index")
     levels_tsv: str = str(orthodb_dir / "odb11v0_levels.tab")
     levels2species_tsv: str = str(orthodb_dir / "odb11v0_level2species.tab")
     species_tsv: str = str(orthodb_dir / "odb11v0_species.tab")
+    table_cache_dir: str = str(orthodb_dir / "odb11v0_table_cache")
 
 orthoDB_files = orthoDB_files_object()
 
@@ -50,76 +61,182 @@ def load_data_all_odb_seqs(database_files: orthoDB_files_object = orthoDB_files)
     return data_all_seqrecords_dict
 
 
+def load_data_sequence_store(
+    database_files: orthoDB_files_object = orthoDB_files,
+) -> sequence_store.SequenceStore | None:
+    """load the packed sequence store if it has been built, otherwise return None"""
+    if not sequence_store.store_exists(database_files.all_seqs_store_dir):
+        return None
+    return sequence_store.SequenceStore(database_files.all_seqs_store_dir)
+
+
+SPECIES_COLUMNS = [
+    "NCBI id",
+    "species ID",
+    "species name",
+    "assembly ID",
+    "n clustered genes",
+    "n OGs",
+    "mapping type",
+]
+LEVELS_COLUMNS = [
+    "level NCBI tax id",
+    "level name",
+    "total non-redundant count of genes in all underneath clustered species",
+    "total count of OGs built on it",
+    "total non-redundant count of species underneath",
+]
+LEVEL2SPECIES_COLUMNS = [
+    "top level NCBI tax id",
+    "species ID",
+    "n hops",
+    "level NCBI tax id path",
+]
+
+
+def _table_cache_file(database_files: orthoDB_files_object, tsv_file: str) -> Path:
+    return Path(database_files.table_cache_dir) / f"{Path(tsv_file).stem}.npz"
+
+
 def load_data_species_df(database_files: orthoDB_files_object = orthoDB_files):
-    species_df = pd.read_csv(
+    species_df = table_cache.read_tsv_cached(
         database_files.species_tsv,
-        sep="\t",
-        header=None,
-        names=[
-            "NCBI id",
-            "species ID",
-            "species name",
-            "assembly ID",
-            "n clustered genes",
-            "n OGs",
-            "mapping type",
-        ],
+        SPECIES_COLUMNS,
+        _table_cache_file(database_files, database_files.species_tsv),
     )
     return species_df
 
 def load_data_levels_df(database_files: orthoDB_files_object = orthoDB_files):
-    levels_df = pd.read_csv(
+    levels_df = table_cache.read_tsv_cached(
         database_files.levels_tsv,
-        sep="\t",
-        header=None,
-        names=[
-            "level NCBI tax id",
-            "level name",
-            "total non-redundant count of genes in all underneath clustered species",
-            "total count of OGs built on it",
-            "total non-redundant count of species underneath",
-        ],
+        LEVELS_COLUMNS,
+        _table_cache_file(database_files, database_files.levels_tsv),
     )
     return levels_df
 
+def load_data_level2species_df(database_files: orthoDB_files_object = orthoDB_files):
+    level2species_df = table_cache.read_tsv_cached(
+        database_files.levels2species_tsv,
+        LEVEL2SPECIES_COLUMNS,
+        _table_cache_file(database_files, database_files.levels2species_tsv),
+    )
+    return level2species_df
+
 
 class orthoDB_database:
     '''
     main class that holds the orthoDB data
+
+    Each component is loaded the first time it is used, so creating the object
+    is free. Use `get_orthoDB_database` to get the instance that is shared by
+    every module in the process instead of creating a new one.
+
+    The object can be inherited through fork (e.g. by multiprocessing pool
+    workers): the loaded tables are shared copy-on-write and the fasta index,
+    which holds a sqlite connection, is reopened by the child process on first
+    use. When pickled (e.g. for spawned workers), only the file paths are
+    kept and the data is loaded again on first use.
     '''    
 
     def __init__(self, database_files: orthoDB_files_object = orthoDB_files):
         self.datafiles = database_files
-        self.data_all_seqrecords_dict = load_data_all_odb_seqs(self.datafiles)
-        self.data_levels_df = load_data_levels_df(self.datafiles)
-        self.data_species_df = load_data_species_df(self.datafiles)
-        # special dictionaries that I want to have available for quick lookup
-        self.data_species_dict = self._load_data_species_dict()
-        self.data_levels_taxid_name_dict = self._load_data_levels_taxid_name_dict()
+        self._data_all_seqrecords_dict = None
+        self._data_all_seqrecords_dict_pid = None
+
+    def __getstate__(self):
+        return {"datafiles": self.datafiles}
+
+    def __setstate__(self, state):
+        self.__init__(state["datafiles"])
+
+    @property
+    def data_all_seqrecords_dict(self):
+        if self._data_all_seqrecords_dict_pid != os.getpid():
+            self._data_all_seqrecords_dict = load_data_all_odb_seqs(self.datafiles)
+            self._data_all_seqrecords_dict_pid = os.getpid()
+        return self._data_all_seqrecords_dict
+
+    @functools.cached_property
+    def data_sequence_store(self):
+        return load_data_sequence_store(self.datafiles)
+
+    @functools.cached_property
+    def data_levels_df(self):
+        return load_data_levels_df(self.datafiles)
+
+    @functools.cached_property
+    def data_species_df(self):
+        return load_data_species_df(self.datafiles)
+
+    @functools.cached_property
+    def data_level2species_df(self):
+        return load_data_level2species_df(self.datafiles)
+
+    # special dictionaries that I want to have available for quick lookup
+    @functools.cached_property
+    def data_species_dict(self):
+        return self._load_data_species_dict()
+
+    @functools.cached_property
+    def data_levels_taxid_name_dict(self):
+        return self._load_data_levels_taxid_name_dict()
 
     def _load_data_species_dict(self):
-        return (
-            self.data_species_df[["species ID", "species name"]]
-            .set_index("species ID")
-            .to_dict()["species name"]
+        return dict(
+            zip(
+                self.data_species_df["species ID"].tolist(),
+                self.data_species_df["species name"].tolist(),
+            )
         )
 
     def _load_data_levels_taxid_name_dict(self):
-        return (
-            self.data_levels_df[["level NCBI tax id", "level name"]]
-            .set_index("level NCBI tax id")
-            .to_dict()["level name"]
+        return dict(
+            zip(
+                self.data_levels_df["level NCBI tax id"].tolist(),
+                self.data_levels_df["level name"].tolist(),
+            )
         )
 
-    def get_sequences_from_list_of_seq_ids(self, sequence_ids: list[str]) -> dict[str, SeqIO.SeqRecord]:
+    def get_sequences_from_list_of_seq_ids(self, sequence_ids: list[str]) -> dict[str, SequenceRecord]:
+        """return a dictionary of (immutable) sequence records for a list of odb_gene_ids
+
+        The records can be shared between the pipeline stages without copying.
+        """
+        if self.data_sequence_store is not None:
+            return self._get_sequences_from_store(sequence_ids)
         og_seq_dict = {}
         for odb_gene_id in sequence_ids:
-            og_seq_dict[odb_gene_id] = self.data_all_seqrecords_dict[odb_gene_id]
-        return copy.deepcopy(og_seq_dict)
+            og_seq_dict[odb_gene_id] = SequenceRecord.from_seqrecord(
+                self.data_all_seqrecords_dict[odb_gene_id]
+            )
+        return og_seq_dict
+
+    def _get_sequences_from_store(self, sequence_ids: list[str]) -> dict[str, SequenceRecord]:
+        seq_str_dict = self.data_sequence_store.get_sequences(sequence_ids)
+        header_dict = self.data_sequence_store.get_headers(sequence_ids)
+        return {
+            odb_gene_id: SequenceRecord(
+                id=odb_gene_id,
+                species_id=odb_gene_id.split(":")[0],
+                seq=seq_str,
+                description=header_dict[odb_gene_id],
+            )
+            for odb_gene_id, seq_str in seq_str_dict.items()
+        }
+
+
+_ORTHODB_DATABASE: orthoDB_database | None = None
+
 
+def get_orthoDB_database() -> orthoDB_database:
+    """return the orthoDB_database instance shared by every module in this process
 
-# make the orthoDB_database object available as a global environment variable
-# ODB_DATABASE = orthoDB_database()
+    The instance is created on the first call. Nothing is loaded until it is used.
+    """
+    global _ORTHODB_DATABASE
+    if _ORTHODB_DATABASE is None:
+        _ORTHODB_DATABASE = orthoDB_database()
+    return _ORTHODB_DATABASE
 
 # Below is an attempt to deal with the fact that the orthoDB file names might change with different versions
 # file_wildcards = {
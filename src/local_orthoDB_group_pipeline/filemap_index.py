@@ -0,0 +1,186 @@
+"""indexed map from (odb_gene_id, level) to the files output by the pipeline
+
+The batch scripts append a record for every finished (gene, level) task to the
+run manifest (see `run_manifest`), including the odb_gene_id of the query and
+the paths of its alignment and info json. `FileMapIndex.update` compacts the
+records that were appended since its last update into an indexed SQLite
+table, `main_output_folder/filemap.sqlite`, so keeping the filemap up to date
+only costs the new records and never reads the info json files. The batch
+scripts (and `queue_worker.py`) update the index at the end of a run.
+
+Only successful tasks are indexed. If a (gene, level) is recorded more than
+once (e.g. a rerun with different parameters), the latest record wins.
+
+Output folders without a manifest (e.g. runs of `odb_group_pipeline.py` on
+single genes) can be indexed from their info json files once, with
+`FileMapIndex.index_info_jsons`.
+"""
+
+import contextlib
+import json
+import sqlite3
+from pathlib import Path
+
+from local_orthoDB_group_pipeline import run_manifest
+
+FILEMAP_INDEX_FILENAME = "filemap.sqlite"
+
+CREATE_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS filemap (
+        odb_gene_id TEXT NOT NULL,
+        og_level TEXT NOT NULL,
+        alignment_file TEXT,
+        info_file TEXT NOT NULL,
+        PRIMARY KEY (odb_gene_id, og_level)
+    ) WITHOUT ROWID""",
+]
+UPSERT_SQL = "INSERT OR REPLACE INTO filemap VALUES (?, ?, ?, ?)"
+
+
+def _entry_from_info_json(info_json_file: str | Path) -> tuple[str, str, str | None, str]:
+    with open(info_json_file, "r") as f:
+        json_data = json.load(f)
+    return (
+        json_data["query_odb_gene_id"],
+        json_data["oglevel"],
+        json_data.get("alignment_clustered_ldos_file"),
+        str(Path(info_json_file).resolve()),
+    )
+
+
+def _entry_from_record(record: dict) -> tuple[str, str, str | None, str] | None:
+    """the filemap entry of a manifest record, or None if the task failed"""
+    if record.get("status") != run_manifest.SUCCESS or "info_json" not in record:
+        return None
+    if "odb_gene_id" not in record:
+        # written before the manifest recorded the files of a task
+        info_json_file = Path(record["info_json"])
+        return _entry_from_info_json(info_json_file) if info_json_file.exists() else None
+    return (
+        record["odb_gene_id"],
+        record["level"],
+        record.get("alignment_file"),
+        record["info_json"],
+    )
+
+
+class FileMapIndex:
+    """the filemap index of an output folder
+
+    Parameters
+    ----------
+    index_file : str | Path
+        the index database file. It is created (with its parent folders) if it doesn't exist
+    manifest_file : str | Path | None, optional
+        the run manifest to index, by default None (only `add_entries` and
+        `index_info_jsons` add to the index)
+    """
+
+    def __init__(self, index_file: str | Path, manifest_file: str | Path | None = None):
+        self.index_file = Path(index_file)
+        self.manifest = None if manifest_file is None else run_manifest.RunManifest(manifest_file)
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.index_file, timeout=120, isolation_level=None)
+        with self._transaction() as connection:
+            for sql in CREATE_TABLES_SQL:
+                connection.execute(sql)
+
+    @classmethod
+    def from_output_folder(cls, main_output_folder: str | Path) -> "FileMapIndex":
+        main_output_folder = Path(main_output_folder)
+        return cls(
+            main_output_folder / FILEMAP_INDEX_FILENAME,
+            main_output_folder / run_manifest.MANIFEST_FILENAME,
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """an exclusive (write) transaction, so concurrent updates don't index a record twice"""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM filemap").fetchone()[0]
+
+    def update(self) -> int:
+        """index the manifest records appended since the last update
+
+        Returns
+        -------
+        int
+            the number of entries added or replaced
+        """
+        if self.manifest is None:
+            return 0
+        with self._transaction() as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'manifest_offset'").fetchone()
+            records, offset = self.manifest.read_new(0 if row is None else row[0])
+            entries = [entry for entry in map(_entry_from_record, records) if entry is not None]
+            connection.executemany(UPSERT_SQL, entries)
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('manifest_offset', ?)", (offset,)
+            )
+        return len(entries)
+
+    def add_entries(self, entries: list[tuple[str, str, str | None, str]]):
+        """add (odb_gene_id, og_level, alignment_file, info_file) entries to the index"""
+        with self._transaction() as connection:
+            connection.executemany(UPSERT_SQL, entries)
+
+    def index_info_jsons(self, json_dir: str | Path) -> int:
+        """index every info json file in `json_dir` (not including the failures)
+
+        Returns
+        -------
+        int
+            the number of entries added or replaced
+        """
+        entries = [_entry_from_info_json(json_file) for json_file in Path(json_dir).glob("*.json")]
+        self.add_entries(entries)
+        return len(entries)
+
+    def get(self, odb_gene_id: str, og_level: str) -> dict[str, str | None] | None:
+        """the "alignment_file" and "info_file" of a gene at a level, or None if it isn't indexed"""
+        row = self._connection.execute(
+            "SELECT alignment_file, info_file FROM filemap WHERE odb_gene_id = ? AND og_level = ?",
+            (odb_gene_id, og_level),
+        ).fetchone()
+        return None if row is None else {"alignment_file": row[0], "info_file": row[1]}
+
+    def get_alignment_file(self, odb_gene_id: str, og_level: str) -> str | None:
+        """the alignment file of a gene at a level, or None if it isn't indexed
+        (or the run didn't write alignments)"""
+        entry = self.get(odb_gene_id, og_level)
+        return None if entry is None else entry["alignment_file"]
+
+    def get_gene_files(self, odb_gene_id: str) -> dict[str, dict[str, str | None]]:
+        """the files of a gene at every indexed level, by level"""
+        rows = self._connection.execute(
+            "SELECT og_level, alignment_file, info_file FROM filemap WHERE odb_gene_id = ?",
+            (odb_gene_id,),
+        ).fetchall()
+        return {
+            og_level: {"alignment_file": alignment_file, "info_file": info_file}
+            for og_level, alignment_file, info_file in rows
+        }
+
+    def to_dict(self) -> dict[str, dict[str, dict[str, str | None]]]:
+        """the whole filemap as {odb_gene_id: {og_level: {"alignment_file": ..., "info_file": ...}}}"""
+        file_map = {}
+        for odb_gene_id, og_level, alignment_file, info_file in self._connection.execute(
+            "SELECT odb_gene_id, og_level, alignment_file, info_file FROM filemap"
+        ):
+            file_map.setdefault(odb_gene_id, {})[og_level] = {
+                "alignment_file": alignment_file,
+                "info_file": info_file,
+            }
+        return file_map
@@ -1,17 +1,18 @@
-import copy
+import numpy as np
 
-import pandas as pd
-from Bio import Seq, SeqIO
+from local_orthoDB_group_pipeline import taxonomy_index
+from local_orthoDB_group_pipeline.sequence_record import SequenceRecord
 
 
 def filter_seqs_with_nonaa_chars(
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    seqrecord_dict: dict[str, SequenceRecord],
     prohibited_chars: list[str] = ["X", "x", "*"],
-) -> dict[str, SeqIO.SeqRecord]:
+) -> dict[str, SequenceRecord]:
     """
     filter sequences with non amino acid characters such as X and *.
 
-    Returns a new dictionary with the filtered sequences
+    Returns a new dictionary with the filtered sequences. The records themselves
+    are immutable, so they are shared with the input dictionary instead of copied
     """
     filtered_og_seq_dict = {}
     for seq_id, seq in seqrecord_dict.items():
@@ -21,17 +22,73 @@ def filter_seqs_with_nonaa_chars(
                 break_flag = True
         if break_flag:
             continue
-        filtered_og_seq_dict[seq_id] = copy.deepcopy(seq)
+        filtered_og_seq_dict[seq_id] = seq
     return filtered_og_seq_dict
 
 
 def filter_shorter_sequences(
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    seqrecord_dict: dict[str, SequenceRecord],
     min_length: int|float,
-) -> dict[str, SeqIO.SeqRecord]:
+) -> dict[str, SequenceRecord]:
     filtered_og_seq_dict = {}
     for seq_id, seq in seqrecord_dict.items():
         if len(seq) < min_length:
             continue        
-        filtered_og_seq_dict[seq_id] = copy.deepcopy(seq)
-    return filtered_og_seq_dict
\ No newline at end of file
+        filtered_og_seq_dict[seq_id] = seq
+    return filtered_og_seq_dict
+
+
+def filter_odb_gene_ids_by_species(
+    odb_gene_ids: list[str],
+    level_name: str | None = None,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    keep: list[str] | None = None,
+) -> list[str]:
+    """restrict a list of odb_gene_ids to some species using the taxonomy
+    index bitsets (see `taxonomy_index`)
+
+    Parameters
+    ----------
+    odb_gene_ids : list[str]
+        the gene ids to filter (e.g. the members of an orthogroup)
+    level_name : str | None, optional
+        only keep the genes of species under this level, by default None
+    include : list[str] | None, optional
+        only keep the genes of these species ids, by default None
+    exclude : list[str] | None, optional
+        drop the genes of these species ids, by default None
+    keep : list[str] | None, optional
+        gene ids that are always kept (e.g. the query), by default None
+
+    Returns
+    -------
+    list[str]
+        the gene ids that pass the filters, in their original order
+
+    Raises
+    ------
+    ValueError
+        if the level name or any of the species ids are not in the orthoDB tables
+    """
+    if level_name is None and include is None and not exclude:
+        return list(odb_gene_ids)
+    taxonomy = taxonomy_index._get_taxonomy_index()
+    species_indices = taxonomy.species_indices([odb_gene_id.split(":")[0] for odb_gene_id in odb_gene_ids])
+    passed = np.ones(len(odb_gene_ids), dtype=bool)
+    if level_name is not None or include is not None:
+        allowed_mask = None
+        if level_name is not None:
+            allowed_mask = taxonomy.level_name_mask(level_name)
+        if include is not None:
+            include_mask = taxonomy.species_mask(include)
+            allowed_mask = include_mask if allowed_mask is None else allowed_mask & include_mask
+        passed &= taxonomy.contains(allowed_mask, species_indices)
+    if exclude:
+        passed &= ~taxonomy.contains(taxonomy.species_mask(exclude), species_indices)
+    keep = set(keep or [])
+    return [
+        odb_gene_id
+        for odb_gene_id, gene_passed in zip(odb_gene_ids, passed.tolist())
+        if gene_passed or odb_gene_id in keep
+    ]
@@ -1,53 +1,29 @@
-import copy
-
 import numpy as np
 import pandas as pd
-from alfpy.utils import distmatrix
-from Bio import SeqIO
 
-import local_orthoDB_group_pipeline.sql_queries as sql_queries
 import local_seqtools.alignment_tools as aln_tools
 import local_seqtools.cli_wrappers as cli
+from local_orthoDB_group_pipeline.sequence_record import SequenceRecord
 
 
-def setup_df(seqrecord_dict_in: dict[str, SeqIO.SeqRecord]) -> pd.DataFrame:
-    seqrecord_dict = copy.deepcopy(seqrecord_dict_in)
-    seqrecord_list = [seq for seq in seqrecord_dict.values()]
-    df = pd.DataFrame(columns=["id"], index=range(len(seqrecord_dict)))
+def setup_df(seqrecord_dict_in: dict[str, SequenceRecord]) -> pd.DataFrame:
+    # the records are immutable, so the dataframe refers to the input records
+    # instead of copies
+    seqrecord_list = [seq for seq in seqrecord_dict_in.values()]
+    df = pd.DataFrame(columns=["id"], index=range(len(seqrecord_dict_in)))
     df["id"] = [seqrecord.id for seqrecord in seqrecord_list]
-    df["organism"] = df["id"].apply(lambda x: sql_queries.odb_gene_id_2_species_id(x))
-    df["sequence"] = df["id"].map(seqrecord_dict)
+    df["organism"] = [seqrecord.species_id for seqrecord in seqrecord_list]
+    df["sequence"] = df["id"].map(seqrecord_dict_in)
     return df
 
 
-def _alfpy_query_matrix(
-    query_seqrecord: SeqIO.SeqRecord, matrix: distmatrix.Matrix
-) -> tuple[list[str], list[float]]:
-    """
-    get the row from the alfpy matrix that corresponds to the query gene
-    """
-    query_row = [c for c, i in enumerate(matrix.id_list) if query_seqrecord.id in i][0]
-    query_row_distance = matrix.data[query_row]
-    query_row_similarity = 1 - query_row_distance
-    return matrix.id_list, query_row_similarity
-
-
-def addpid_by_msa(
+def _addpid_from_msa(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
-    n_align_threads: int = 8,
-    **mafft_kwargs,
+    query_seqrecord: SequenceRecord,
+    msa_seqrecord_dict: dict,
 ) -> pd.DataFrame:
     df = df_in.copy()
-    seqrecord_list = [seq for seq in seqrecord_dict.values()]
-    _, msa_seqrecord_dict = cli.mafft_align_wrapper(
-        seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
-    )
     query_msa_seqrecord = msa_seqrecord_dict[query_seqrecord.id] # type: ignore
-    # query_msa_seqrecord = [i for i in msa_seqrecord_dict if i.id == query_seqrecord.id][ # type: ignore
-        # 0
-    # ]
     # could do this by applying a function to the `id` column but this seems a bit simpler
     pid_map_dict = {
         seq.id: aln_tools.compute_pairwise_percent_id_from_msa(query_msa_seqrecord, seq)
@@ -57,9 +33,23 @@ def addpid_by_msa(
     return df
 
 
+def addpid_by_msa(
+    df_in: pd.DataFrame,
+    query_seqrecord: SequenceRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
+    n_align_threads: int = 8,
+    **mafft_kwargs,
+) -> pd.DataFrame:
+    seqrecord_list = [seq for seq in seqrecord_dict.values()]
+    _, msa_seqrecord_dict = cli.mafft_align_wrapper(
+        seqrecord_list, n_align_threads=n_align_threads, **mafft_kwargs
+    )
+    return _addpid_from_msa(df_in, query_seqrecord, msa_seqrecord_dict)
+
+
 def addpid_by_msa_by_organism(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
+    query_seqrecord: SequenceRecord,
     n_align_threads: int = 8,
     **mafft_kwargs,
 ) -> pd.DataFrame:
@@ -90,35 +80,83 @@ def addpid_by_msa_by_organism(
     return df
 
 
+def word_count_profiles(
+    seqrecord_list: list[SequenceRecord], word_size: int = 2
+) -> tuple[np.ndarray, np.ndarray]:
+    """count the overlapping words of length `word_size` in each sequence
+
+    Returns
+    -------
+    np.ndarray
+        the count of each word (columns) in each sequence (rows). The columns
+        are the words found in any of the sequences, in sorted order
+    np.ndarray
+        the number of words in each sequence (length - word_size + 1)
+    """
+    totals = np.array([len(seqrecord) - word_size + 1 for seqrecord in seqrecord_list], dtype=np.int64)
+    word_code_list = []
+    for seqrecord in seqrecord_list:
+        chars = np.frombuffer(seqrecord.seq.encode(), dtype=np.uint8).astype(np.int64)
+        n_words = max(len(chars) - word_size + 1, 0)
+        codes = np.zeros(n_words, dtype=np.int64)
+        for i in range(word_size):
+            codes = codes * 256 + chars[i : i + n_words]
+        word_code_list.append(codes)
+    word_codes = np.concatenate(word_code_list) if word_code_list else np.zeros(0, dtype=np.int64)
+    seq_index = np.repeat(np.arange(len(seqrecord_list)), [len(codes) for codes in word_code_list])
+    words, word_index = np.unique(word_codes, return_inverse=True)
+    counts = np.bincount(
+        seq_index * len(words) + word_index, minlength=len(seqrecord_list) * len(words)
+    ).reshape(len(seqrecord_list), len(words))
+    return counts.astype(np.int64), totals
+
+
+def google_similarity(
+    counts: np.ndarray, totals: np.ndarray, query_index: int
+) -> np.ndarray:
+    """similarity (1 - normalized google distance) between one sequence and
+    every sequence, from the word counts of `word_count_profiles`
+
+    This is the distance of `alfpy.word_distance.Distance(freqs, "google")` on
+    word frequencies (count / total). The frequencies of a sequence add up to
+    1, so the similarity is sum(min(freq_query, freq)), which is computed
+    exactly as sum(min(count_query * total, count * total_query)) / (total_query * total).
+    Unlike the floating point sums of alfpy, the result doesn't depend on which
+    other sequences are compared at the same time, so the similarity of two
+    sequences is always the same.
+    """
+    query_total = totals[query_index]
+    numerators = np.minimum(counts[query_index] * totals[:, None], counts * query_total).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = numerators / (totals * query_total).astype(float)
+    # sequences without any words (shorter than the word size)
+    similarity[(totals <= 0) | (query_total <= 0)] = np.nan
+    # like the diagonal of an alfpy distance matrix
+    similarity[query_index] = 1.0
+    return similarity
+
+
 def addpid_by_alfpy_google_distance(
-    df_in: pd.DataFrame, query_seqrecord: SeqIO.SeqRecord
+    df_in: pd.DataFrame, query_seqrecord: SequenceRecord
 ) -> pd.DataFrame:
     df = df_in.copy()
     print("comparing sequences using alignment free comparison (alfpy google distance)")
-    org_set = df["organism"].unique()
-    pid_map_dict = {}
-    # counter = 0
-    for org_i in org_set:
-        # counter += 1
-        # get all the sequences for this organism
-        seqs = list(df[df["organism"] == org_i]["sequence"].values)
-        # add the query sequence to the list
-        if query_seqrecord.id not in [seq.id for seq in seqs]:
-            seqs.append(query_seqrecord)
-        matrix = aln_tools.alfpy_distance_matrix(seqs, word_size=2)
-        id_list, query_row_similarity = _alfpy_query_matrix(query_seqrecord, matrix)
-        for seq_id, similarity in zip(id_list, query_row_similarity):
-            pid_map_dict[seq_id] = similarity
-        # if counter % 100 == 0:
-        # print(f'finished {counter} of {len(org_set)} organisms')
-    df["PID"] = df["id"].map(pid_map_dict)
+    # the distance between the query and a paralog only depends on the two
+    # sequences, so every paralog is compared to the query at once instead
+    # of building a distance matrix per organism
+    seqrecord_list = list(df["sequence"].values)
+    if query_seqrecord.id not in df["id"].values:
+        seqrecord_list.append(query_seqrecord)
+    query_index = [seqrecord.id for seqrecord in seqrecord_list].index(query_seqrecord.id)
+    counts, totals = word_count_profiles(seqrecord_list, word_size=2)
+    df["PID"] = google_similarity(counts, totals, query_index)[: len(df)]
     return df
 
 
 def addpid_by_pairwise(
     df_in: pd.DataFrame,
-    query_seqrecord: SeqIO.SeqRecord,
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
+    query_seqrecord: SequenceRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
 ) -> pd.DataFrame:
     df = df_in.copy()
     seqrecord_list = [seq for seq in seqrecord_dict.values()]
@@ -131,20 +169,22 @@ def addpid_by_pairwise(
     return df
 
 
-def get_LDOs_from_pids(df: pd.DataFrame, query_seqrecord: SeqIO.SeqRecord) -> list[str]:
-    query_species_id = sql_queries.odb_gene_id_2_species_id(query_seqrecord.id)
+def get_LDOs_from_pids(df: pd.DataFrame, query_seqrecord: SequenceRecord) -> list[str]:
+    query_species_id = query_seqrecord.species_id
     # remove sequences in the query organism that are not the query sequence
     df = df[(df["organism"] != query_species_id) | (df["id"] == query_seqrecord.id)]
     assert query_seqrecord.id in df["id"].values, "query sequence not found in df"
-    # groupby select the closest sequence for each organism
-    ldo_df = df.loc[df.groupby("organism")["PID"].idxmax()].copy()
-    ldo_df = ldo_df.sort_values("PID", ascending=False)
+    # select the closest sequence for each organism. Ties (e.g. identical
+    # sequences) are broken by id, so the LDOs and their order don't depend
+    # on the order of the input sequences
+    ldo_df = df.sort_values(["PID", "id"], ascending=[False, True], kind="stable")
+    ldo_df = ldo_df.drop_duplicates("organism")
     return list(ldo_df["id"].values)
 
 
 def find_LDOs_main(
-    seqrecord_dict: dict[str, SeqIO.SeqRecord],
-    query_seqrecord: SeqIO.SeqRecord,
+    seqrecord_dict: dict[str, SequenceRecord],
+    query_seqrecord: SequenceRecord,
     pid_method: str = "alfpy_google_distance",
     n_align_threads: int = 8,
     **mafft_kwargs,
@@ -173,3 +213,76 @@ def find_LDOs_main(
             **mafft_kwargs,
         )
     return df, get_LDOs_from_pids(df, query_seqrecord)
+
+
+def find_LDOs_multi_query(
+    query_seqrecord_dicts: dict[str, dict[str, SequenceRecord]],
+    pid_method: str = "alfpy_google_distance",
+    n_align_threads: int = 8,
+    **mafft_kwargs,
+) -> dict[str, tuple[pd.DataFrame, list[str]]]:
+    """find the LDOs of several queries from the same ortholog group
+
+    Gives the same results as calling `find_LDOs_main` once per query, but
+    shares the work that doesn't depend on the query:
+    - `alfpy_google_distance`: the word counts of every sequence are computed
+      once, and each query is compared to all of its sequences at once
+    - `msa`: queries with the same (filtered) sequences, in the same order,
+      share one alignment
+    - `msa_by_organism` and `pairwise` align the query itself, so they are run
+      once per query
+
+    Parameters
+    ----------
+    query_seqrecord_dicts : dict[str, dict[str, SequenceRecord]]
+        for each query id, the sequences to select the LDOs from (the
+        `seqrecord_dict` of `find_LDOs_main`). The query itself must be one of them
+    pid_method, n_align_threads, mafft_kwargs
+        see `find_LDOs_main`
+
+    Returns
+    -------
+    dict[str, tuple[pd.DataFrame, list[str]]]
+        the PID dataframe and the LDOs of each query
+    """
+    assert pid_method in [
+        "msa_by_organism",
+        "alfpy_google_distance",
+        "pairwise",
+        "msa",
+    ], "LDO selection method not recognized. must be one of: msa_by_organism, alfpy_google_distance, pairwise, msa"
+    results = {}
+    if pid_method == "alfpy_google_distance":
+        print(f"comparing sequences of {len(query_seqrecord_dicts)} queries using alignment free comparison (alfpy google distance)")
+        all_seqrecords = {}
+        for seqrecord_dict in query_seqrecord_dicts.values():
+            all_seqrecords.update(seqrecord_dict)
+        seq_index = {seq_id: i for i, seq_id in enumerate(all_seqrecords)}
+        counts, totals = word_count_profiles(list(all_seqrecords.values()), word_size=2)
+        for query_id, seqrecord_dict in query_seqrecord_dicts.items():
+            query_seqrecord = seqrecord_dict[query_id]
+            df = setup_df(seqrecord_dict)
+            similarity = google_similarity(counts, totals, seq_index[query_id])
+            df["PID"] = similarity[[seq_index[seq_id] for seq_id in df["id"]]]
+            results[query_id] = (df, get_LDOs_from_pids(df, query_seqrecord))
+    elif pid_method == "msa":
+        alignments = {}
+        for query_id, seqrecord_dict in query_seqrecord_dicts.items():
+            query_seqrecord = seqrecord_dict[query_id]
+            alignment_key = tuple(seqrecord_dict)
+            if alignment_key not in alignments:
+                _, alignments[alignment_key] = cli.mafft_align_wrapper(
+                    list(seqrecord_dict.values()), n_align_threads=n_align_threads, **mafft_kwargs
+                )
+            df = _addpid_from_msa(setup_df(seqrecord_dict), query_seqrecord, alignments[alignment_key])
+            results[query_id] = (df, get_LDOs_from_pids(df, query_seqrecord))
+    else:
+        for query_id, seqrecord_dict in query_seqrecord_dicts.items():
+            results[query_id] = find_LDOs_main(
+                seqrecord_dict,
+                seqrecord_dict[query_id],
+                pid_method=pid_method,
+                n_align_threads=n_align_threads,
+                **mafft_kwargs,
+            )
+    return results
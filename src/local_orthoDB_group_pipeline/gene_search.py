@@ -0,0 +1,121 @@
+"""full-text search of the orthoDB genes by gene name, id or description
+
+Searches the FTS5 index built by
+`scripts-gen_SQLite_dbs/make_SQLite_database_gene_search.py`, which has one
+row per gene with the columns:
+- `species_id`: the orthoDB species id (e.g. "9606_0")
+- `gene_names`: the gene synonyms and the NCBI gene name/id
+- `ids`: the source id, uniprot id and Ensembl ids
+- `description`: the gene description
+Matches in the gene names rank highest, then ids, then descriptions.
+"""
+
+import re
+
+import pandas as pd
+
+import local_env_variables.env_variables as env
+import local_orthoDB_group_pipeline.sql_queries as sql_queries
+
+SEARCHED_COLUMNS = "{gene_names ids description}"
+
+
+def species_2_species_ids(species: str) -> list[str]:
+    """return the orthoDB species ids that match a species id (e.g. "9606_0"),
+    an NCBI taxonomy id (e.g. "9606") or a species name (e.g. "homo sapiens", case-insensitive)
+
+    Raises
+    ------
+    ValueError
+        if no species match
+    """
+    species_df = env.get_orthoDB_database().data_species_df
+    species = species.strip()
+    if species in env.get_orthoDB_database().data_species_dict:
+        return [species]
+    if species.isdigit():
+        species_ids = species_df.loc[species_df["NCBI id"] == int(species), "species ID"].tolist()
+    else:
+        species_ids = species_df.loc[
+            species_df["species name"].str.lower() == species.lower(), "species ID"
+        ].tolist()
+    if len(species_ids) == 0:
+        raise ValueError(f"no species found for `{species}`")
+    return species_ids
+
+
+def _fts5_string(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_query(query: str, species_ids: list[str] | None = None, prefix: bool = False) -> str:
+    """build an FTS5 query that matches genes with all of the words in `query`
+
+    Each word is quoted, so characters with a meaning in the FTS5 query
+    syntax are searched for literally.
+
+    Parameters
+    ----------
+    query : str
+        words to search for (e.g. "PPT2" or "palmitoyl thioesterase")
+    species_ids : list[str] | None, optional
+        only match genes from these species, by default None
+    prefix : bool, optional
+        match words that start with each of the query words, by default False
+    """
+    terms = [t for t in re.split(r"\s+", query.strip()) if t]
+    if len(terms) == 0:
+        raise ValueError("the search query is empty")
+    suffix = "*" if prefix else ""
+    match = f"{SEARCHED_COLUMNS} : ({' AND '.join(_fts5_string(t) + suffix for t in terms)})"
+    if species_ids is not None:
+        match = f"species_id : ({' OR '.join(_fts5_string(s) for s in species_ids)}) AND {match}"
+    return match
+
+
+def search_genes(
+    query: str,
+    species: str | list[str] | None = None,
+    limit: int = 20,
+    prefix: bool = False,
+    db_path: str = env.orthoDB_files.gene_search_sqlite,
+) -> pd.DataFrame:
+    """search the genes by name, id or description
+
+    Parameters
+    ----------
+    query : str
+        words to search for. Genes must match all of the words (e.g. "PPT2")
+    species : str | list[str] | None, optional
+        restrict the search to one or more species, each given as a species
+        id, NCBI taxonomy id or species name (see `species_2_species_ids`), by default None (all species)
+    limit : int, optional
+        maximum number of genes to return, by default 20
+    prefix : bool, optional
+        match words that start with each of the query words, by default False
+    db_path : str, optional
+        the search index, by default env.orthoDB_files.gene_search_sqlite
+
+    Returns
+    -------
+    pd.DataFrame
+        the best matches first, with the columns:
+        odb_gene_id | species_id | species name | gene_names | ids | description | score
+        (a lower score is a better match)
+    """
+    species_ids = None
+    if species is not None:
+        species = [species] if isinstance(species, str) else species
+        species_ids = [s for sp in species for s in species_2_species_ids(sp)]
+    match = build_match_query(query, species_ids=species_ids, prefix=prefix)
+    cursor = sql_queries.get_connection(db_path).cursor()
+    rows = cursor.execute(sql_queries.GENE_SEARCH_SQL, (match, limit)).fetchall()
+    results_df = pd.DataFrame.from_records(
+        rows, columns=["odb_gene_id", "species_id", "gene_names", "ids", "description", "score"]
+    )
+    results_df.insert(
+        2,
+        "species name",
+        results_df["species_id"].map(env.get_orthoDB_database().data_species_dict),
+    )
+    return results_df
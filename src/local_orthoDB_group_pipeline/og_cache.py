@@ -0,0 +1,240 @@
+"""per-process cache of OG members and OG sequences for batch runs
+
+In a whole-proteome run, many queries (e.g. paralogs) select the same OG, so
+the same member list and the same thousands of sequences would be read again
+for each of them. The pipeline gets OG members and sequences through this
+module instead, which keeps the most recently used OGs in two size-bounded
+LRU caches:
+- OG id -> member odb_gene_ids
+- OG id -> {odb_gene_id: SequenceRecord} of the members that have been read
+
+The size of an entry is estimated from the length of its strings, and the
+least recently used OGs are evicted once a cache is over its limit. The
+records are immutable, so cached records are shared with the pipeline stages
+without copying.
+
+Each process (e.g. each multiprocessing pool worker) has its own caches. The
+hit rate of the caches of the current process is returned by `cache_stats`.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import local_env_variables.env_variables as env
+import local_orthoDB_group_pipeline.sql_queries as sql_queries
+from local_orthoDB_group_pipeline.sequence_record import SequenceRecord
+
+DEFAULT_MAX_MEMBER_BYTES = 32 * 2**20
+DEFAULT_MAX_SEQUENCE_BYTES = 256 * 2**20
+# rough per-object overhead (bytes) of a python string and of a sequence record
+_STR_OVERHEAD = 50
+_RECORD_OVERHEAD = 250
+
+
+class LRUCache:
+    """least recently used cache with a limit on the total (estimated) size of its values
+
+    Parameters
+    ----------
+    max_bytes : int
+        the total size of the cached values is kept at or below this. A value
+        that is larger than the limit on its own is not cached
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default=None):
+        """return the cached value of `key` (and mark it as recently used), or
+        `default` if it isn't cached. Counts as a hit or a miss"""
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: Hashable, value, size_bytes: int):
+        """cache `value` under `key`, evicting the least recently used entries if needed"""
+        if key in self._entries:
+            self.size_bytes -= self._entries.pop(key)[1]
+        if size_bytes > self.max_bytes:
+            return
+        self._entries[key] = (value, size_bytes)
+        self.size_bytes += size_bytes
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+
+    def get_or_load(self, key: Hashable, load: Callable[[], object], size_of: Callable[[object], int]):
+        """return the cached value of `key`, loading and caching it on a miss"""
+        value = self.get(key, default=self)
+        if value is self:
+            value = load()
+            self.put(key, value, size_of(value))
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict:
+        n_lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / n_lookups if n_lookups > 0 else 0.0,
+            "evictions": self.evictions,
+            "n_entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _members_size(odb_gene_ids: list[str]) -> int:
+    return sum(len(odb_gene_id) + _STR_OVERHEAD for odb_gene_id in odb_gene_ids)
+
+
+def _records_size(records: dict[str, SequenceRecord]) -> int:
+    return sum(
+        len(record.seq) + len(record.description) + 2 * len(record.id) + _RECORD_OVERHEAD
+        for record in records.values()
+    )
+
+
+_MEMBER_CACHE = LRUCache(DEFAULT_MAX_MEMBER_BYTES)
+_SEQUENCE_CACHE = LRUCache(DEFAULT_MAX_SEQUENCE_BYTES)
+# number of requested sequence records that were cached and that had to be read
+_RECORD_COUNTS = {"records_cached": 0, "records_read": 0}
+
+
+def configure(max_member_bytes: int | None = None, max_sequence_bytes: int | None = None):
+    """set the size limits of the caches of this process (and clear them)
+
+    Call before starting a multiprocessing pool so that the forked workers
+    inherit the limits.
+    """
+    global _MEMBER_CACHE, _SEQUENCE_CACHE
+    _MEMBER_CACHE = LRUCache(DEFAULT_MAX_MEMBER_BYTES if max_member_bytes is None else max_member_bytes)
+    _SEQUENCE_CACHE = LRUCache(DEFAULT_MAX_SEQUENCE_BYTES if max_sequence_bytes is None else max_sequence_bytes)
+
+
+def get_og_members(ogid: str) -> list[str]:
+    """return the member odb_gene_ids of an OG (see `sql_queries.ogid_2_odb_gene_id_list`)"""
+    return _MEMBER_CACHE.get_or_load(ogid, lambda: sql_queries.ogid_2_odb_gene_id_list(ogid), _members_size)
+
+
+def get_og_members_bulk(ogids: list[str]) -> dict[str, list[str]]:
+    """`get_og_members` for several OGs. The OGs that aren't cached are read in one bulk query"""
+    members = {ogid: _MEMBER_CACHE.get(ogid) for ogid in dict.fromkeys(ogids)}
+    missing = [ogid for ogid, og_members in members.items() if og_members is None]
+    if missing:
+        for ogid, og_members in sql_queries.ogid_list_2_odb_gene_id_list_dict(missing).items():
+            _MEMBER_CACHE.put(ogid, og_members, _members_size(og_members))
+            members[ogid] = og_members
+    return members
+
+
+def get_og_sequences_bulk(og_requests: dict[str, list[str]]) -> dict[str, dict[str, SequenceRecord]]:
+    """return the sequence records of some members of each OG
+
+    The records that aren't cached yet are read for all of the OGs at once
+    with a single `get_sequences_from_list_of_seq_ids` call, and are then
+    added to the cache entry of their OG.
+
+    Parameters
+    ----------
+    og_requests : dict[str, list[str]]
+        the odb_gene_ids to return for each OG id (e.g. all of its members or
+        the members that passed the species filters)
+
+    Returns
+    -------
+    dict[str, dict[str, SequenceRecord]]
+        for each OG, the records of the requested odb_gene_ids, in the order they were requested
+    """
+    cached = {ogid: _SEQUENCE_CACHE.get(ogid, default={}) for ogid in og_requests}
+    missing = list(
+        dict.fromkeys(
+            odb_gene_id
+            for ogid, odb_gene_ids in og_requests.items()
+            for odb_gene_id in odb_gene_ids
+            if odb_gene_id not in cached[ogid]
+        )
+    )
+    fetched = env.get_orthoDB_database().get_sequences_from_list_of_seq_ids(missing) if missing else {}
+    _RECORD_COUNTS["records_read"] += len(missing)
+    _RECORD_COUNTS["records_cached"] += sum(
+        odb_gene_id in cached[ogid] for ogid, odb_gene_ids in og_requests.items() for odb_gene_id in odb_gene_ids
+    )
+    og_sequences = {}
+    for ogid, odb_gene_ids in og_requests.items():
+        records = cached[ogid]
+        new_records = {odb_gene_id: fetched[odb_gene_id] for odb_gene_id in odb_gene_ids if odb_gene_id not in records}
+        if new_records:
+            records = records | new_records
+            _SEQUENCE_CACHE.put(ogid, records, _records_size(records))
+        og_sequences[ogid] = {odb_gene_id: records[odb_gene_id] for odb_gene_id in odb_gene_ids}
+    return og_sequences
+
+
+def get_og_sequences(ogid: str, odb_gene_ids: list[str]) -> dict[str, SequenceRecord]:
+    """return the sequence records of some members of an OG (see `get_og_sequences_bulk`)"""
+    return get_og_sequences_bulk({ogid: odb_gene_ids})[ogid]
+
+
+def cache_stats() -> dict[str, dict]:
+    """hit rate, size and number of entries of the member and sequence caches
+    of this process. The sequence cache stats also count the individual
+    records that were served from the cache and read from the database"""
+    return {"members": _MEMBER_CACHE.stats(), "sequences": _SEQUENCE_CACHE.stats() | _RECORD_COUNTS}
+
+
+def clear():
+    """empty the caches of this process (the statistics are kept)"""
+    _MEMBER_CACHE.clear()
+    _SEQUENCE_CACHE.clear()
+
+
+def combine_stats(stats_list: list[dict[str, dict]]) -> dict[str, dict]:
+    """add up the `cache_stats` of several processes (e.g. the workers of a pool)"""
+    combined = {}
+    for cache_name in ["members", "sequences"]:
+        # every counter starts at 0, so the stats of no processes (e.g. a
+        # resumed run with nothing left to do) can still be formatted
+        totals = {key: 0 for key in ["hits", "misses", "evictions", "size_bytes", "n_entries"]}
+        for stats in stats_list:
+            for key, value in stats[cache_name].items():
+                if key != "hit_rate":
+                    totals[key] = totals.get(key, 0) + value
+        n_lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / n_lookups if n_lookups > 0 else 0.0
+        combined[cache_name] = totals
+    return combined
+
+
+def format_stats(stats: dict[str, dict]) -> str:
+    """one line per cache: hit rate, lookups, evictions and size"""
+    lines = []
+    for cache_name, cache in stats.items():
+        line = (
+            f"OG {cache_name} cache: {cache['hit_rate']:.1%} hit rate "
+            f"({cache['hits']:,} hits, {cache['misses']:,} misses), {cache['evictions']:,} evictions, "
+            f"{cache['size_bytes'] / 2**20:,.1f} MiB in {cache['n_entries']:,} OGs"
+        )
+        if "records_read" in cache:
+            line += f", {cache['records_cached']:,} sequences from the cache, {cache['records_read']:,} read"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,218 @@
+"""precomputed, memory-mapped gene -> level -> OG selection table
+
+Materializes the join of the OG2genes, OGs and levels tables that
+`og_selection.select_OG_by_level_name` otherwise does for every (gene, level)
+pair. For each odb_gene_id, the table holds one entry per OG that the gene
+belongs to, with the NCBI tax id of the OG's level. The entries of a gene are
+contiguous and sorted by level tax id (CSR form):
+    entries of gene j = entry_levels/entry_ogs[gene_offsets[j]:gene_offsets[j + 1]]
+    OG id of entry k = og_ids[entry_ogs[k]]
+
+The odb_gene_ids are sorted, so all of the genes of a species (which share the
+"<species id>:" prefix) are contiguous, which is what makes whole-species
+resolution a single slice.
+
+Like the OG membership index, every array is a `.npy` file opened with
+`mmap_mode="r"`. The table is built with
+`scripts-gen_SQLite_dbs/make_OG_level_index.py`.
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from local_orthoDB_group_pipeline import og_membership_index
+
+INDEX_ARRAYS = [
+    "og_ids",
+    "gene_ids",
+    "gene_offsets",
+    "entry_levels",
+    "entry_ogs",
+]
+
+
+def index_exists(index_dir: str | Path) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+
+def _read_og_levels(ogs_tsv: str | Path) -> tuple[np.ndarray, np.ndarray]:
+    """return the sorted OG ids and the level tax id of each"""
+    ogs_df = pd.read_csv(
+        ogs_tsv,
+        sep="\t",
+        header=None,
+        names=["OG_id", "level_NCBI_tax_id", "name"],
+        usecols=["OG_id", "level_NCBI_tax_id"],
+        dtype={"OG_id": str, "level_NCBI_tax_id": np.int64},
+    )
+    og_ids = ogs_df["OG_id"].to_numpy().astype("S")
+    og_levels = ogs_df["level_NCBI_tax_id"].to_numpy()
+    order = np.argsort(og_ids, kind="stable")
+    og_ids = og_ids[order]
+    og_levels = og_levels[order]
+    # keep the first row of any duplicated OG id
+    keep = np.ones(len(og_ids), dtype=bool)
+    keep[1:] = og_ids[1:] != og_ids[:-1]
+    return og_ids[keep], og_levels[keep]
+
+
+def build_og_level_index(
+    og2genes_tsv: str | Path,
+    ogs_tsv: str | Path,
+    index_dir: str | Path,
+    chunksize: int = 10_000_000,
+):
+    """build the gene -> level -> OG selection table from the orthoDB OG2genes and OGs files
+
+    The OG2genes file is read twice, once to collect the unique odb_gene_ids
+    and once to join each (OG, gene) pair with the level of the OG. Duplicate
+    pairs and pairs whose OG is not in the OGs file are dropped. The arrays are
+    written to a temporary directory that is renamed to `index_dir` once it is
+    complete.
+
+    Parameters
+    ----------
+    og2genes_tsv : str | Path
+        path to the orthoDB OG2genes file (e.g. odb11v0_OG2genes.tab)
+    ogs_tsv : str | Path
+        path to the orthoDB OGs file (e.g. odb11v0_OGs.tab)
+    index_dir : str | Path
+        directory to write the index to. It is replaced if it already exists
+    chunksize : int, optional
+        number of lines read at a time, by default 10_000_000
+    """
+    index_dir = Path(index_dir)
+    start_time = time.perf_counter()
+    print(f"building OG level index from: {og2genes_tsv} and {ogs_tsv}")
+    og_ids, og_levels = _read_og_levels(ogs_tsv)
+    gene_id_chunks = []
+    for _, gene_ids in og_membership_index._read_og2genes_chunks(og2genes_tsv, chunksize):
+        gene_id_chunks.append(np.unique(gene_ids))
+    sorted_gene_ids = np.unique(np.concatenate(gene_id_chunks))
+    del gene_id_chunks
+    print(f"{len(og_ids):,} OGs, {len(sorted_gene_ids):,} genes ({time.perf_counter() - start_time:,.1f} s)")
+
+    og_index_chunks, gene_index_chunks = [], []
+    n_missing_ogs = 0
+    for chunk_og_ids, chunk_gene_ids in og_membership_index._read_og2genes_chunks(og2genes_tsv, chunksize):
+        og_index = np.searchsorted(og_ids, chunk_og_ids)
+        found = og_index < len(og_ids)
+        found[found] = og_ids[og_index[found]] == chunk_og_ids[found]
+        n_missing_ogs += int((~found).sum())
+        og_index_chunks.append(og_index[found].astype(np.int64))
+        gene_index_chunks.append(og_membership_index._intern(sorted_gene_ids, chunk_gene_ids[found]))
+    og_index = np.concatenate(og_index_chunks)
+    gene_index = np.concatenate(gene_index_chunks)
+    del og_index_chunks, gene_index_chunks
+    if n_missing_ogs > 0:
+        print(f"dropped {n_missing_ogs:,} rows whose OG is not in {ogs_tsv}")
+    pair_keys = np.unique(gene_index * len(og_ids) + og_index)
+    gene_index = pair_keys // len(og_ids)
+    og_index = pair_keys % len(og_ids)
+    del pair_keys
+    entry_levels = og_levels[og_index]
+    # sort the entries by gene, then by level
+    order = np.lexsort((og_index, entry_levels, gene_index))
+    gene_offsets = np.zeros(len(sorted_gene_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(gene_index, minlength=len(sorted_gene_ids)), out=gene_offsets[1:])
+    print(f"{len(order):,} (gene, level, OG) entries ({time.perf_counter() - start_time:,.1f} s)")
+
+    index_dtype = np.int32 if len(og_ids) < 2**31 else np.int64
+    arrays = {
+        "og_ids": og_ids,
+        "gene_ids": sorted_gene_ids,
+        "gene_offsets": gene_offsets,
+        "entry_levels": entry_levels[order],
+        "entry_ogs": og_index[order].astype(index_dtype),
+    }
+    temp_dir = index_dir.with_name(f"{index_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    for name, array in arrays.items():
+        np.save(temp_dir / f"{name}.npy", array)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    temp_dir.rename(index_dir)
+    print(f"wrote OG level index to {index_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+class OGLevelIndex:
+    """read-only view of a gene -> level -> OG table built by `build_og_level_index`
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory containing the index arrays
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(self.index_dir / f"{name}.npy", mmap_mode="r"))
+
+    def get_gene_levels(self, odb_gene_id: str) -> list[tuple[int, str]]:
+        """return (level tax id, OG id) for each OG of a gene, sorted by level tax id.
+        Unknown genes have no OGs"""
+        j = og_membership_index.OGMembershipIndex._lookup(self.gene_ids, odb_gene_id)
+        if j is None:
+            return []
+        start, end = self.gene_offsets[j], self.gene_offsets[j + 1]
+        levels = self.entry_levels[start:end].tolist()
+        og_ids = self.og_ids[self.entry_ogs[start:end]]
+        return [(level, og_id.decode()) for level, og_id in zip(levels, og_ids)]
+
+    def select_ogs(self, odb_gene_id: str, level_tax_id: int) -> list[str]:
+        """return the OG ids of a gene at a level (normally zero or one)"""
+        return [og_id for level, og_id in self.get_gene_levels(odb_gene_id) if level == level_tax_id]
+
+    def _select_gene_indices(self, gene_indices: np.ndarray, level_tax_ids: list[int]) -> pd.DataFrame:
+        starts = self.gene_offsets[gene_indices]
+        counts = self.gene_offsets[gene_indices + 1] - starts
+        # the position of every entry of every gene, in gene order
+        entry_gene_indices = np.repeat(gene_indices, counts)
+        entries = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        entries += np.repeat(starts, counts)
+        entry_levels = self.entry_levels[entries]
+        keep = np.isin(entry_levels, np.asarray(level_tax_ids, dtype=np.int64))
+        entries = entries[keep]
+        return pd.DataFrame(
+            {
+                "odb_gene_id": self.gene_ids[entry_gene_indices[keep]].astype(str),
+                "level NCBI tax id": entry_levels[keep],
+                "OG id": self.og_ids[self.entry_ogs[entries]].astype(str),
+            }
+        )
+
+    def select_ogs_bulk(self, odb_gene_ids: list[str], level_tax_ids: list[int]) -> pd.DataFrame:
+        """return the OGs of every gene in `odb_gene_ids` at every level in `level_tax_ids`
+
+        Returns
+        -------
+        pd.DataFrame
+            columns: odb_gene_id | level NCBI tax id | OG id. The genes are in
+            sorted order and the levels of each gene are sorted by tax id. A
+            (gene, level) pair without an OG has no row, and a pair with more
+            than one OG has a row for each. Unknown genes are skipped.
+        """
+        keys = np.unique(np.array(odb_gene_ids, dtype="S"))
+        gene_indices = np.searchsorted(self.gene_ids, keys)
+        found = gene_indices < len(self.gene_ids)
+        found[found] = self.gene_ids[gene_indices[found]] == keys[found]
+        return self._select_gene_indices(gene_indices[found], level_tax_ids)
+
+    def select_ogs_for_species(self, species_id: str, level_tax_ids: list[int]) -> pd.DataFrame:
+        """return the OGs of every gene of a species (e.g. "9606_0") at every level in `level_tax_ids`
+
+        The genes of the species are found with a single slice of the sorted
+        gene ids. See `select_ogs_bulk` for the returned dataframe.
+        """
+        prefix = f"{species_id}:".encode()
+        start = int(np.searchsorted(self.gene_ids, prefix, side="left"))
+        # ";" is the character after ":", so this is the first id past the prefix
+        end = int(np.searchsorted(self.gene_ids, f"{species_id};".encode(), side="left"))
+        return self._select_gene_indices(np.arange(start, end, dtype=np.int64), level_tax_ids)
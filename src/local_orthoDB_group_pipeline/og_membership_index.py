@@ -0,0 +1,173 @@
+"""precomputed, memory-mapped index of OG membership built from the OG2genes table
+
+The OG ids and odb_gene_ids are interned to integers (their position in a
+sorted array of ids) and the OG -> members and gene -> OGs adjacency lists are
+stored in CSR form:
+    members of OG i = gene_ids[og_members[og_member_offsets[i]:og_member_offsets[i + 1]]]
+    OGs of gene j = og_ids[gene_ogs[gene_og_offsets[j]:gene_og_offsets[j + 1]]]
+
+Every array is a `.npy` file that is opened with `mmap_mode="r"`, so nothing is
+parsed on load and the pages are shared through the OS page cache between all
+of the processes (e.g. multiprocessing pool workers) that use the index.
+
+The index is built with `scripts-gen_SQLite_dbs/make_OG2genes_index.py`.
+When it exists, `sql_queries.ogid_2_odb_gene_id_list` and
+`sql_queries.odb_gene_id_2_ogid_list` use it instead of the OG2genes database.
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+INDEX_ARRAYS = [
+    "og_ids",
+    "gene_ids",
+    "og_member_offsets",
+    "og_members",
+    "gene_og_offsets",
+    "gene_ogs",
+]
+
+
+def index_exists(index_dir: str | Path) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+
+def _intern(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """return the position of each of `ids` in `sorted_ids` (all of them must be present)"""
+    return np.searchsorted(sorted_ids, ids).astype(np.int64)
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, n_keys: int) -> tuple[np.ndarray, np.ndarray]:
+    """group `values` by `keys`, keeping the input order within each key"""
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    return offsets, values[order]
+
+
+def _read_og2genes_chunks(og2genes_tsv: str | Path, chunksize: int):
+    for chunk in pd.read_csv(
+        og2genes_tsv,
+        sep="\t",
+        header=None,
+        names=["OG_id", "odb_gene_id"],
+        dtype=str,
+        chunksize=chunksize,
+    ):
+        yield (
+            chunk["OG_id"].to_numpy().astype("S"),
+            chunk["odb_gene_id"].to_numpy().astype("S"),
+        )
+
+
+def build_og_membership_index(
+    og2genes_tsv: str | Path, index_dir: str | Path, chunksize: int = 10_000_000
+):
+    """build the OG membership index from the orthoDB OG2genes file
+
+    The file is read twice, once to collect the unique ids and once to intern
+    the (OG, gene) pairs. Duplicate pairs are dropped and the members of each OG
+    are kept in the order that they appear in the file. The arrays are written
+    to a temporary directory that is renamed to `index_dir` once it is complete.
+
+    Parameters
+    ----------
+    og2genes_tsv : str | Path
+        path to the orthoDB OG2genes file (e.g. odb11v0_OG2genes.tab)
+    index_dir : str | Path
+        directory to write the index to. It is replaced if it already exists
+    chunksize : int, optional
+        number of lines read at a time, by default 10_000_000
+    """
+    index_dir = Path(index_dir)
+    start_time = time.perf_counter()
+    print(f"building OG membership index from: {og2genes_tsv}")
+    og_id_chunks, gene_id_chunks = [], []
+    for og_ids, gene_ids in _read_og2genes_chunks(og2genes_tsv, chunksize):
+        og_id_chunks.append(np.unique(og_ids))
+        gene_id_chunks.append(np.unique(gene_ids))
+    sorted_og_ids = np.unique(np.concatenate(og_id_chunks))
+    sorted_gene_ids = np.unique(np.concatenate(gene_id_chunks))
+    del og_id_chunks, gene_id_chunks
+    print(f"{len(sorted_og_ids):,} OGs, {len(sorted_gene_ids):,} genes ({time.perf_counter() - start_time:,.1f} s)")
+
+    og_index_chunks, gene_index_chunks = [], []
+    for og_ids, gene_ids in _read_og2genes_chunks(og2genes_tsv, chunksize):
+        og_index_chunks.append(_intern(sorted_og_ids, og_ids))
+        gene_index_chunks.append(_intern(sorted_gene_ids, gene_ids))
+    og_index = np.concatenate(og_index_chunks)
+    gene_index = np.concatenate(gene_index_chunks)
+    del og_index_chunks, gene_index_chunks
+    # drop duplicate (OG, gene) pairs, keeping the first occurrence in file order
+    _, first_occurrence = np.unique(
+        og_index * len(sorted_gene_ids) + gene_index, return_index=True
+    )
+    first_occurrence.sort()
+    og_index = og_index[first_occurrence]
+    gene_index = gene_index[first_occurrence]
+    print(f"{len(og_index):,} unique (OG, gene) pairs ({time.perf_counter() - start_time:,.1f} s)")
+
+    index_dtype = np.int32 if len(sorted_gene_ids) < 2**31 and len(sorted_og_ids) < 2**31 else np.int64
+    og_member_offsets, og_members = _csr(og_index, gene_index, len(sorted_og_ids))
+    gene_og_offsets, gene_ogs = _csr(gene_index, og_index, len(sorted_gene_ids))
+    arrays = {
+        "og_ids": sorted_og_ids,
+        "gene_ids": sorted_gene_ids,
+        "og_member_offsets": og_member_offsets,
+        "og_members": og_members.astype(index_dtype),
+        "gene_og_offsets": gene_og_offsets,
+        "gene_ogs": gene_ogs.astype(index_dtype),
+    }
+    temp_dir = index_dir.with_name(f"{index_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    for name, array in arrays.items():
+        np.save(temp_dir / f"{name}.npy", array)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    temp_dir.rename(index_dir)
+    print(f"wrote OG membership index to {index_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+class OGMembershipIndex:
+    """read-only view of an OG membership index built by `build_og_membership_index`
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory containing the index arrays
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(self.index_dir / f"{name}.npy", mmap_mode="r"))
+
+    @staticmethod
+    def _lookup(sorted_ids: np.ndarray, id_str: str) -> int | None:
+        key = id_str.encode()
+        i = int(np.searchsorted(sorted_ids, key))
+        if i < len(sorted_ids) and sorted_ids[i] == key:
+            return i
+        return None
+
+    def ogid_2_odb_gene_id_list(self, ogid: str) -> list[str]:
+        """return the member odb_gene_ids of an OG. Unknown OGs have no members"""
+        i = self._lookup(self.og_ids, ogid)
+        if i is None:
+            return []
+        members = self.og_members[self.og_member_offsets[i] : self.og_member_offsets[i + 1]]
+        return [gene_id.decode() for gene_id in self.gene_ids[members]]
+
+    def odb_gene_id_2_ogid_list(self, odb_gene_id: str) -> list[str]:
+        """return the OGs that an odb_gene_id belongs to. Unknown genes belong to no OGs"""
+        j = self._lookup(self.gene_ids, odb_gene_id)
+        if j is None:
+            return []
+        ogs = self.gene_ogs[self.gene_og_offsets[j] : self.gene_og_offsets[j + 1]]
+        return [og_id.decode() for og_id in self.og_ids[ogs]]
@@ -1,15 +1,49 @@
+import functools
 
 import pandas as pd
 
 import local_env_variables.env_variables as env
 import local_orthoDB_group_pipeline.sql_queries as sql_queries
+from local_orthoDB_group_pipeline import og_level_index
 
-ODB_DATABASE = env.orthoDB_database()
+ODB_DATABASE = env.get_orthoDB_database()
+_OG_LEVEL_INDEX: og_level_index.OGLevelIndex | None = None
+
+
+def _get_og_level_index() -> og_level_index.OGLevelIndex | None:
+    """return the gene -> level -> OG table if it has been built
+    (`scripts-gen_SQLite_dbs/make_OG_level_index.py`), otherwise None"""
+    global _OG_LEVEL_INDEX
+    if _OG_LEVEL_INDEX is None:
+        if not og_level_index.index_exists(env.orthoDB_files.OG_level_index_dir):
+            return None
+        _OG_LEVEL_INDEX = og_level_index.OGLevelIndex(env.orthoDB_files.OG_level_index_dir)
+    return _OG_LEVEL_INDEX
+
+
+@functools.cache
+def _level_name_2_tax_ids() -> dict[str, list[int]]:
+    level_name_2_tax_ids = {}
+    for tax_id, level_name in ODB_DATABASE.data_levels_taxid_name_dict.items():
+        level_name_2_tax_ids.setdefault(level_name, []).append(int(tax_id))
+    return level_name_2_tax_ids
+
+
+@functools.cache
+def _level_tax_id_2_n_species() -> dict[int, int]:
+    levels_df = ODB_DATABASE.data_levels_df
+    return dict(
+        zip(
+            levels_df["level NCBI tax id"].tolist(),
+            levels_df["total non-redundant count of species underneath"].tolist(),
+        )
+    )
 
 def _ogid_list_2_og_info_df(ogid_list: list[str]) -> pd.DataFrame:
+    og_info_dict = sql_queries.ogid_list_2_ogid_info_dict(ogid_list)
     og_query_results = []
     for og_id in ogid_list:
-        og_query_results.append(sql_queries.get_ogid_info(og_id))
+        og_query_results.append((og_id, *og_info_dict[og_id]))
     og_df = pd.DataFrame.from_records(
         og_query_results, columns=["OG id", "level NCBI tax id", "OG name"]
     )
@@ -73,6 +107,9 @@ def select_OG_by_level_name(odb_gene_id: str, level_name: str) -> tuple[str, str
     ValueError
         raised if multiple OGs are found for the `odb_gene_id` with level name `level_name`
     """
+    og_index = _get_og_level_index()
+    if og_index is not None:
+        return _select_OG_by_level_name_from_index(og_index, odb_gene_id, level_name)
     ogs_info_df = get_available_ogs(odb_gene_id)
     selected_OG_info_df = ogs_info_df[ogs_info_df["level name"] == level_name]
     if len(selected_OG_info_df) == 0:
@@ -84,3 +121,181 @@ def select_OG_by_level_name(odb_gene_id: str, level_name: str) -> tuple[str, str
             f"Multiple OGs found for {odb_gene_id} with level name `{level_name}`. duplicate OGs: {selected_OG_info_df}"
         )
     return selected_OG_info_df["OG id"].values[0], selected_OG_info_df["level name"].values[0]
+
+
+def _select_OG_by_level_name_from_index(
+    og_index: og_level_index.OGLevelIndex, odb_gene_id: str, level_name: str
+) -> tuple[str, str]:
+    return select_OG_from_gene_levels(odb_gene_id, og_index.get_gene_levels(odb_gene_id), level_name)
+
+
+def get_gene_levels(odb_gene_id: str) -> list[tuple[int, str]]:
+    """return (level tax id, OG id) for every OG of a gene, sorted by level tax id
+
+    Uses the precomputed gene -> level -> OG table if it has been built,
+    otherwise one query of the OG2genes database and one of the OGs database.
+    The result can be passed to `select_OG_from_gene_levels` for any number of
+    levels without looking the gene up again.
+
+    Raises
+    ------
+    ValueError
+        raised if the gene has no OGs and the OG2genes database is used
+    """
+    og_index = _get_og_level_index()
+    if og_index is not None:
+        return og_index.get_gene_levels(odb_gene_id)
+    ogid_list = sql_queries.odb_gene_id_2_ogid_list(odb_gene_id)
+    og_info_dict = sql_queries.ogid_list_2_ogid_info_dict(ogid_list)
+    return sorted((int(og_info_dict[og_id][0]), og_id) for og_id in ogid_list if og_id in og_info_dict)
+
+
+def select_OG_from_gene_levels(
+    odb_gene_id: str, gene_levels: list[tuple[int, str]], level_name: str
+) -> tuple[str, str]:
+    """select the OG of a gene at a level from the gene's (level tax id, OG id)
+    list (see `get_gene_levels`)
+
+    Returns and raises the same as `select_OG_by_level_name`
+    """
+    level_tax_ids = set(_level_name_2_tax_ids().get(level_name, []))
+    selected_ogids = [og_id for level, og_id in gene_levels if level in level_tax_ids]
+    if len(selected_ogids) == 0:
+        # same order as `get_available_ogs`: by the number of species under the level
+        n_species = _level_tax_id_2_n_species()
+        available_levels = sorted(
+            [level for level, _ in gene_levels if level in n_species],
+            key=lambda level: n_species[level],
+        )
+        available_level_names = list(
+            dict.fromkeys(ODB_DATABASE.data_levels_taxid_name_dict[level] for level in available_levels)
+        )
+        raise ValueError(
+            f"No OGs found for {odb_gene_id} with level name `{level_name}`. available levels are: {available_level_names}"
+        )
+    if len(selected_ogids) > 1:
+        raise ValueError(
+            f"Multiple OGs found for {odb_gene_id} with level name `{level_name}`. duplicate OGs: {selected_ogids}"
+        )
+    return selected_ogids[0], level_name
+
+
+def _select_OGs_from_sql(odb_gene_ids: list[str], level_tax_ids: list[int]) -> pd.DataFrame:
+    gene_ogid_dict = sql_queries.odb_gene_id_list_2_ogid_list_dict(odb_gene_ids)
+    og_info_dict = sql_queries.ogid_list_2_ogid_info_dict(
+        list({og_id for og_ids in gene_ogid_dict.values() for og_id in og_ids})
+    )
+    level_tax_ids = set(level_tax_ids)
+    records = []
+    for odb_gene_id, og_ids in gene_ogid_dict.items():
+        for og_id in og_ids:
+            if og_id not in og_info_dict:
+                continue
+            level = int(og_info_dict[og_id][0])
+            if level in level_tax_ids:
+                records.append((odb_gene_id, level, og_id))
+    og_df = pd.DataFrame.from_records(
+        records, columns=["odb_gene_id", "level NCBI tax id", "OG id"]
+    )
+    og_df["level NCBI tax id"] = og_df["level NCBI tax id"].astype("int64")
+    return og_df.drop_duplicates().sort_values(
+        by=["odb_gene_id", "level NCBI tax id", "OG id"], ignore_index=True
+    )
+
+
+def _add_level_names(og_df: pd.DataFrame) -> pd.DataFrame:
+    og_df.insert(
+        2,
+        "level name",
+        og_df["level NCBI tax id"].map(ODB_DATABASE.data_levels_taxid_name_dict),
+    )
+    return og_df
+
+
+def _level_names_2_tax_ids(level_names: list[str]) -> list[int]:
+    level_name_2_tax_ids = _level_name_2_tax_ids()
+    level_tax_ids = []
+    for level_name in level_names:
+        if level_name not in level_name_2_tax_ids:
+            raise ValueError(f"level name `{level_name}` is not in the orthoDB levels table")
+        level_tax_ids.extend(level_name_2_tax_ids[level_name])
+    return level_tax_ids
+
+
+def select_OGs_by_level_names_bulk(odb_gene_ids: list[str], level_names: list[str]) -> pd.DataFrame:
+    """select the OGs of many genes at many levels in a single pass
+
+    Uses the precomputed gene -> level -> OG table if it has been built,
+    otherwise bulk queries of the OG2genes and OGs databases.
+
+    Parameters
+    ----------
+    odb_gene_ids : list[str]
+        the odb_gene_ids to resolve
+    level_names : list[str]
+        the level names to select OGs at (e.g. ["Eukaryota", "Vertebrata"])
+
+    Returns
+    -------
+    pd.DataFrame
+        columns: odb_gene_id | level NCBI tax id | level name | OG id, sorted by
+        odb_gene_id, then level tax id. A (gene, level) pair without an OG has
+        no row and a pair with more than one OG has a row for each (see
+        `select_OG_by_level_name` for the single gene version, which raises an
+        error in both cases).
+
+    Raises
+    ------
+    ValueError
+        raised if one of the `level_names` is not in the orthoDB levels table
+    """
+    level_tax_ids = _level_names_2_tax_ids(level_names)
+    og_index = _get_og_level_index()
+    if og_index is not None:
+        og_df = og_index.select_ogs_bulk(odb_gene_ids, level_tax_ids)
+    else:
+        og_df = _select_OGs_from_sql(list(dict.fromkeys(odb_gene_ids)), level_tax_ids)
+    return _add_level_names(og_df)
+
+
+def select_OGs_for_species(species_id: str, level_names: list[str]) -> pd.DataFrame:
+    """select the OGs of every gene of a species (e.g. "9606_0") at each of `level_names`
+
+    Returns the same dataframe as `select_OGs_by_level_names_bulk`.
+    """
+    level_tax_ids = _level_names_2_tax_ids(level_names)
+    og_index = _get_og_level_index()
+    if og_index is not None:
+        og_df = og_index.select_ogs_for_species(species_id, level_tax_ids)
+    else:
+        og_df = _select_OGs_from_sql(
+            sql_queries.get_all_odb_gene_ids_from_species_id(species_id), level_tax_ids
+        )
+    return _add_level_names(og_df)
+
+
+def group_genes_by_og(odb_gene_ids: list[str], level_names: list[str]) -> list[list[str]]:
+    """group genes that share an OG, so that a batch run can process them back
+    to back (and reuse the cached OG members and sequences, see `og_cache`)
+
+    Each gene is keyed by its OG at the broadest of `level_names` (the level
+    with the most species underneath) that it has an OG at. Genes without an
+    OG at any of the levels are in a group of their own.
+
+    Returns
+    -------
+    list[list[str]]
+        the groups of (unique) odb_gene_ids. The groups are in the order of
+        their first gene in `odb_gene_ids` and the genes keep their input order
+    """
+    odb_gene_ids = list(dict.fromkeys(odb_gene_ids))
+    og_df = select_OGs_by_level_names_bulk(odb_gene_ids, level_names)
+    og_df["n species"] = og_df["level NCBI tax id"].map(_level_tax_id_2_n_species()).fillna(0)
+    og_df = og_df.sort_values(
+        by=["odb_gene_id", "n species", "level NCBI tax id"], ascending=[True, False, True], kind="stable"
+    )
+    gene_2_og = og_df.drop_duplicates(subset="odb_gene_id").set_index("odb_gene_id")["OG id"].to_dict()
+    groups: dict[str, list[str]] = {}
+    for odb_gene_id in odb_gene_ids:
+        groups.setdefault(gene_2_og.get(odb_gene_id, odb_gene_id), []).append(odb_gene_id)
+    return list(groups.values())
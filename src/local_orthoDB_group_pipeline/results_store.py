@@ -0,0 +1,225 @@
+"""where the pipeline writes its results (the info dictionaries)
+
+The pipeline hands each result to the sink chosen by `config.results_sink`:
+- `json` (default): one indented json file per result in
+  `main_output_folder/info_jsons/` (failures in `info_jsons/failures/`)
+- `sqlite`: one row per result in a single indexed database,
+  `main_output_folder/results.sqlite`. A whole-proteome run at several
+  levels makes 100k results, which as json files fill a single directory and
+  have to be opened and parsed again by every downstream lookup.
+
+The rows of the sqlite sink are buffered by each process and written in one
+transaction when the sink is flushed (the pipeline flushes after each
+`main_pipeline`/`main_pipeline_multi_query` call, i.e. once per group of
+genes in the batch scripts). Concurrent workers wait for each other's
+transactions, so they can all write into the same database.
+
+Each row is keyed by the path of its info json relative to the `info_jsons`
+folder (e.g. `9606_0_001c7b_Vertebrata_1567973at7742_info.json` or
+`failures/Q8TC90_Vertebrata_info.json`) and the lookup columns (gene ids,
+level, OG id) are indexed. `ResultsStore` queries the database, and
+`ResultsStore.export_json` writes the json layout of the `json` sink from it.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from local_config import orthodb_pipeline_parameters
+
+RESULTS_DB_FILENAME = "results.sqlite"
+INFO_JSON_FOLDER = "info_jsons"
+
+CREATE_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS results (
+        name TEXT PRIMARY KEY,
+        query_odb_gene_id TEXT,
+        query_uniprot_id TEXT,
+        og_level TEXT,
+        ogid TEXT,
+        alignment_file TEXT,
+        critical_error TEXT,
+        result TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS results_gene_level ON results (query_odb_gene_id, og_level)",
+    "CREATE INDEX IF NOT EXISTS results_uniprot_id ON results (query_uniprot_id)",
+    "CREATE INDEX IF NOT EXISTS results_ogid ON results (ogid)",
+]
+SUMMARY_COLUMNS = [
+    "name",
+    "query_odb_gene_id",
+    "query_uniprot_id",
+    "og_level",
+    "ogid",
+    "alignment_file",
+    "critical_error",
+]
+
+
+def results_db_file(main_output_folder: str | Path) -> Path:
+    return Path(main_output_folder) / RESULTS_DB_FILENAME
+
+
+def _connect(db_file: str | Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_file, timeout=120, isolation_level=None)
+    connection.execute("BEGIN IMMEDIATE")
+    for sql in CREATE_TABLES_SQL:
+        connection.execute(sql)
+    connection.execute("COMMIT")
+    return connection
+
+
+class JsonSink:
+    """writes each result to its info json file"""
+
+    def __init__(self, main_output_folder: str | Path):
+        self.main_output_folder = Path(main_output_folder)
+
+    def write(self, output_dict: dict, info_json_file: Path, og_level: str | None = None):
+        info_json_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(info_json_file, "w") as f:
+            json.dump(output_dict, f, indent=4)
+
+    def flush(self):
+        pass
+
+
+class SQLiteSink:
+    """buffers results and writes them to the results database when flushed"""
+
+    def __init__(self, main_output_folder: str | Path):
+        self.main_output_folder = Path(main_output_folder)
+        self.db_file = results_db_file(main_output_folder)
+        self._rows: list[tuple] = []
+
+    def write(self, output_dict: dict, info_json_file: Path, og_level: str | None = None):
+        name = info_json_file.relative_to(self.main_output_folder / INFO_JSON_FOLDER).as_posix()
+        self._rows.append(
+            (
+                name,
+                output_dict.get("query_odb_gene_id"),
+                output_dict.get("query_uniprot_id"),
+                og_level,
+                output_dict.get("ogid"),
+                output_dict.get("alignment_clustered_ldos_file"),
+                output_dict.get("critical error"),
+                json.dumps(output_dict),
+            )
+        )
+
+    def flush(self):
+        if not self._rows:
+            return
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        connection = _connect(self.db_file)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._rows
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        self._rows = []
+
+
+SINKS = {"json": JsonSink, "sqlite": SQLiteSink}
+# the sinks of this process, by (process id, sink type, output folder). A
+# forked worker gets its own sinks instead of the (unflushed) ones of its parent
+_SINKS: dict[tuple[int, str, str], JsonSink | SQLiteSink] = {}
+
+
+def get_sink(config: orthodb_pipeline_parameters.PipelineParams) -> JsonSink | SQLiteSink:
+    """the sink of this process for `config.results_sink` and `config.main_output_folder`"""
+    key = (os.getpid(), config.results_sink, str(config.main_output_folder))
+    if key not in _SINKS:
+        _SINKS[key] = SINKS[config.results_sink](config.main_output_folder)
+    return _SINKS[key]
+
+
+def flush():
+    """write the buffered results of the sinks of this process"""
+    for (pid, _, _), sink in _SINKS.items():
+        if pid == os.getpid():
+            sink.flush()
+
+
+class ResultsStore:
+    """query the results database written by the `sqlite` sink
+
+    Parameters
+    ----------
+    main_output_folder : str | Path
+        the `main_output_folder` of the run(s)
+    """
+
+    def __init__(self, main_output_folder: str | Path):
+        self.main_output_folder = Path(main_output_folder)
+        self.db_file = results_db_file(main_output_folder)
+        if not self.db_file.exists():
+            raise FileNotFoundError(f"results database not found: {self.db_file}")
+        self._connection = sqlite3.connect(f"{self.db_file.resolve().as_uri()}?mode=ro", uri=True)
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, odb_gene_id: str, og_level: str) -> dict | None:
+        """the result of a gene at a level, or None if it isn't in the database"""
+        row = self._connection.execute(
+            "SELECT result FROM results WHERE query_odb_gene_id = ? AND og_level = ?",
+            (odb_gene_id, og_level),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_gene_results(self, odb_gene_id: str) -> dict[str, dict]:
+        """the results of a gene at every level it was run at, by level"""
+        rows = self._connection.execute(
+            "SELECT og_level, result FROM results WHERE query_odb_gene_id = ?", (odb_gene_id,)
+        ).fetchall()
+        return {og_level: json.loads(result) for og_level, result in rows}
+
+    def get_by_uniprot_id(self, uniprot_id: str) -> dict[str, dict]:
+        """the results of the query with a uniprot id at every level, by level.
+        A failure to map the uniprot id to an orthoDB gene (from a multi-level
+        run) doesn't belong to a level and is under the level None"""
+        rows = self._connection.execute(
+            "SELECT og_level, result FROM results WHERE query_uniprot_id = ?", (uniprot_id,)
+        ).fetchall()
+        return {og_level: json.loads(result) for og_level, result in rows}
+
+    def get_og_results(self, ogid: str) -> list[dict]:
+        """the results of every query that selected the OG `ogid`"""
+        rows = self._connection.execute("SELECT result FROM results WHERE ogid = ?", (ogid,)).fetchall()
+        return [json.loads(result) for result, in rows]
+
+    def summary_df(self) -> pd.DataFrame:
+        """the lookup columns of every result (without the full results), one row per result"""
+        return pd.read_sql_query(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM results", self._connection)
+
+    def export_json(self, main_output_folder: str | Path | None = None) -> int:
+        """write every result to its info json file, in the layout of the `json` sink
+
+        Parameters
+        ----------
+        main_output_folder : str | Path | None, optional
+            the folder to write `info_jsons/` into, by default None (the
+            folder of the database)
+
+        Returns
+        -------
+        int
+            the number of json files written
+        """
+        info_json_folder = Path(main_output_folder or self.main_output_folder) / INFO_JSON_FOLDER
+        sink = JsonSink(info_json_folder.parent)
+        n_files = 0
+        for name, result in self._connection.execute("SELECT name, result FROM results"):
+            sink.write(json.loads(result), info_json_folder / name)
+            n_files += 1
+        return n_files
@@ -0,0 +1,211 @@
+"""append-only completion manifest for batch runs
+
+The batch scripts (`pipeline_all_genes_in_species.py` and
+`pipeline_input_table.py`) record the outcome of every (gene, level) task in a
+manifest file in the main output folder, so that an interrupted run can be
+resumed (`--resume`) without redoing the work that already finished.
+
+The manifest is a json lines file with one record per finished task:
+`{"gene": ..., "level": ..., "config_hash": ..., "status": "success" | "failure", ...}`.
+Records are only ever appended. The last record of a (gene, level, config_hash)
+key is its current state, so a failure that succeeds on a later attempt is
+complete. Each batch of records is written with a single `write` call on a file
+opened in append mode, under an exclusive lock, so records of concurrent
+workers never interleave. A process that is killed mid-write can at most leave
+a truncated last line, which is ignored when the manifest is read.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from attrs import asdict
+
+from local_config import orthodb_pipeline_parameters
+
+MANIFEST_FILENAME = "manifest.jsonl"
+SUCCESS = "success"
+FAILURE = "failure"
+
+
+def config_hash(config: orthodb_pipeline_parameters.PipelineParams) -> str:
+    """hash of the processing parameters of a batch run
+
+    The OG level name (set per task by the batch scripts) and the output
+    folder/`results_sink` settings don't change the results, so they are not
+    part of the hash. `write_files` is, so that the tasks of a run that didn't
+    write its results are run again by a `--resume` that does
+    """
+    config_dict = asdict(config)
+    config_dict["og_select_params"].pop("OG_level_name", None)
+    config_dict.pop("main_output_folder", None)
+    config_dict.pop("results_sink", None)
+    config_json = json.dumps(config_dict, sort_keys=True, default=str)
+    return hashlib.sha256(config_json.encode()).hexdigest()[:16]
+
+
+class RunManifest:
+    """the completion manifest of a batch run
+
+    Parameters
+    ----------
+    manifest_file : str | Path
+        the manifest file. It is created (with its parent folders) on the first write
+    """
+
+    def __init__(self, manifest_file: str | Path):
+        self.manifest_file = Path(manifest_file)
+
+    @classmethod
+    def from_output_folder(cls, main_output_folder: str | Path) -> "RunManifest":
+        return cls(Path(main_output_folder) / MANIFEST_FILENAME)
+
+    def record(self, records: list[dict]):
+        """append task records to the manifest atomically
+
+        Parameters
+        ----------
+        records : list[dict]
+            the records to append. Each one must have the "gene", "level",
+            "config_hash" and "status" keys. A "time" is added if it's missing
+        """
+        if not records:
+            return
+        now = time.time()
+        lines = "".join(
+            json.dumps({"time": now, **record}, default=str) + "\n" for record in records
+        )
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.manifest_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                # a truncated last line (from a killed writer) would be joined
+                # with the first new record, so start on a new line
+                if os.fstat(fd).st_size > 0 and not self._ends_with_newline():
+                    lines = "\n" + lines
+                os.write(fd, lines.encode())
+                os.fsync(fd)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.manifest_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def read(self) -> dict[tuple[str, str, str], dict]:
+        """the current (last) record of each (gene, level, config_hash) key.
+        Lines that can't be parsed (e.g. truncated by a killed writer) are skipped
+        """
+        task_records = {}
+        if not self.manifest_file.exists():
+            return task_records
+        with open(self.manifest_file, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    key = (record["gene"], record["level"], record["config_hash"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                task_records[key] = record
+        return task_records
+
+    def read_new(self, offset: int = 0) -> tuple[list[dict], int]:
+        """the records appended after the byte `offset` of the manifest, in order
+
+        Only complete lines are read, so a record that is being written is
+        left for the next call. If the manifest is shorter than `offset` (it
+        was replaced), it is read from the start
+
+        Returns
+        -------
+        tuple[list[dict], int]
+            the new records and the offset to read the next records from
+        """
+        if not self.manifest_file.exists():
+            return [], 0
+        with open(self.manifest_file, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                if os.fstat(f.fileno()).st_size < offset:
+                    offset = 0
+                f.seek(offset)
+                data = f.read()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        complete = data[: data.rfind(b"\n") + 1]
+        records = []
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+        return records, offset + len(complete)
+
+    def completed(self, config: orthodb_pipeline_parameters.PipelineParams) -> set[tuple[str, str]]:
+        """the (gene, level) tasks that succeeded with the parameters of `config`"""
+        run_hash = config_hash(config)
+        return {
+            (gene, level)
+            for (gene, level, task_hash), record in self.read().items()
+            if task_hash == run_hash and record["status"] == SUCCESS
+        }
+
+    def pending_levels(
+        self,
+        config: orthodb_pipeline_parameters.PipelineParams,
+        gene_ids: list[str],
+        og_levels: list[str],
+    ) -> dict[str, list[str]]:
+        """the levels of each gene that haven't succeeded yet with the
+        parameters of `config` (never run, or failed). Genes that are
+        complete at every level are left out
+        """
+        completed = self.completed(config)
+        gene_levels = {}
+        for gene_id in gene_ids:
+            levels = [og_level for og_level in og_levels if (gene_id, og_level) not in completed]
+            if levels:
+                gene_levels[gene_id] = levels
+        return gene_levels
+
+
+def task_records(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    gene_ids: list[str],
+    gene_results: list[dict[str, tuple[Path, dict]]],
+) -> list[dict]:
+    """the manifest records of the results of `odb_group_pipeline.main_pipeline_multi_query`
+
+    Parameters
+    ----------
+    gene_ids : list[str]
+        the id of each query, as given to the batch script
+    gene_results : list[dict[str, tuple[Path, dict]]]
+        for each query, the info json file and the results of each level
+    """
+    run_hash = config_hash(config)
+    records = []
+    for gene_id, level_results in zip(gene_ids, gene_results):
+        for og_level, (og_info_json_file, output_dict) in level_results.items():
+            record = {
+                "gene": gene_id,
+                "level": og_level,
+                "config_hash": run_hash,
+                "status": FAILURE if "critical error" in output_dict else SUCCESS,
+                "info_json": str(Path(og_info_json_file).resolve()),
+                "odb_gene_id": output_dict.get("query_odb_gene_id"),
+                "alignment_file": output_dict.get("alignment_clustered_ldos_file"),
+            }
+            if "critical error" in output_dict:
+                record["error"] = output_dict["critical error"]
+            records.append(record)
+    return records
@@ -0,0 +1,59 @@
+from attrs import field, frozen
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+
+@frozen
+class SequenceRecord:
+    """lightweight, immutable sequence record that is passed through the pipeline
+
+    The pipeline stages only need the id, species and sequence string of each
+    sequence, so they share these records by reference instead of copying
+    Biopython SeqRecords. Records are converted to SeqRecords only where they
+    are written to fasta files (see `local_seqtools.general_utils.to_seqrecord_list`).
+
+    Attributes:
+    `id`: str
+        the odb_gene_id of the sequence
+    `species_id`: str
+        the orthoDB species id of the sequence
+    `seq`: str
+        the sequence
+    `description`: str
+        the fasta header line of the sequence, kept so that the fasta files
+        written by the pipeline match the orthoDB fasta file. Default: the id
+    """
+
+    id: str
+    species_id: str
+    seq: str
+    description: str = field()
+
+    @description.default
+    def _description_default(self):
+        return self.id
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def __contains__(self, char: str) -> bool:
+        return char in self.seq
+
+    def to_seqrecord(self) -> SeqRecord:
+        return SeqRecord(Seq(self.seq), id=self.id, name=self.id, description=self.description)
+
+    @classmethod
+    def from_seqrecord(cls, seqrecord: SeqRecord, species_id: str | None = None):
+        """create a record from a Biopython SeqRecord
+
+        if `species_id` is not provided, it is taken from the odb_gene_id
+        (e.g. "9606_0" for "9606_0:001c7b")
+        """
+        if species_id is None:
+            species_id = seqrecord.id.split(":")[0]
+        return cls(
+            id=seqrecord.id,
+            species_id=species_id,
+            seq=str(seqrecord.seq),
+            description=seqrecord.description,
+        )
@@ -0,0 +1,375 @@
+"""find the orthoDB genes of a protein from its sequence
+
+Two lookups:
+- exact: the md5 digest of the sequence is looked up in the seq_info database
+  (`scripts-gen_SQLite_dbs/make_SQLite_database_seq_info.py`)
+- approximate: a k-mer inverted index of all of the orthoDB sequences
+  (`scripts-gen_SQLite_dbs/make_kmer_index.py`) returns the sequences that
+  share the most k-mers with the query. Only the minimizers of each sequence
+  (the k-mer with the smallest hash in every window of `w` consecutive k-mers)
+  are indexed, which keeps the index to a fraction of the size of one with
+  every k-mer, while two sequences that share a stretch of at least `w + k - 1`
+  residues still share a minimizer.
+  The candidates are verified by the fraction of the query's k-mers (all of
+  them, not just the minimizers) that are found in the candidate sequence.
+
+The k-mer index layout (every array is a `.npy` file opened with `mmap_mode="r"`):
+- `gene_ids`: the odb_gene_id of each indexed sequence, in fasta file order
+- `kmer_offsets`/`postings`: the indices of the sequences that contain each
+  minimizer, in CSR form. A k-mer is encoded as a base-20 integer of its residues
+- `params`: [k, w]
+"""
+
+import hashlib
+import os
+import shutil
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import local_env_variables.env_variables as env
+import local_orthoDB_group_pipeline.sql_queries as sql_queries
+from local_orthoDB_group_pipeline import sequence_store
+
+INDEX_ARRAYS = ["gene_ids", "kmer_offsets", "postings", "params"]
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+DEFAULT_K = 5
+DEFAULT_W = 8
+# residue -> code (0-19). Anything that isn't one of the 20 standard amino
+# acids is 255 and k-mers that contain it are skipped
+_RESIDUE_CODES = np.full(256, 255, dtype=np.uint8)
+for _code, _residue in enumerate(AMINO_ACIDS):
+    _RESIDUE_CODES[ord(_residue)] = _code
+    _RESIDUE_CODES[ord(_residue.lower())] = _code
+# odd constant used to scramble the k-mer codes before picking minimizers, so
+# that the minimizers aren't biased towards k-mers that start with "A"
+_MINIMIZER_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+EXACT_MATCH = "exact"
+KMER_MATCH = "kmer"
+
+
+def index_exists(index_dir: str | Path) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+
+def normalize_sequence(sequence: str) -> str:
+    """remove whitespace and a trailing stop codon ("*") and convert to upper case"""
+    return "".join(sequence.split()).upper().rstrip("*")
+
+
+def sequence_md5(sequence: str) -> str:
+    """the md5 digest of a sequence, as stored in the seq_info database"""
+    return hashlib.md5(sequence.encode()).hexdigest()
+
+
+def kmer_codes(sequence: str, k: int) -> np.ndarray:
+    """return the code of every k-mer of `sequence` (-1 for k-mers with a non-standard residue)"""
+    residues = _RESIDUE_CODES[np.frombuffer(sequence.encode(), dtype=np.uint8)]
+    if len(residues) < k:
+        return np.zeros(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(residues, k)
+    codes = (windows.astype(np.int64) * (20 ** np.arange(k - 1, -1, -1, dtype=np.int64))).sum(axis=1)
+    codes[(windows == 255).any(axis=1)] = -1
+    return codes
+
+
+def minimizers(sequence: str, k: int, w: int) -> np.ndarray:
+    """return the unique minimizer codes of a sequence (sorted)"""
+    codes = kmer_codes(sequence, k)
+    codes = codes[codes >= 0]
+    if len(codes) == 0:
+        return codes
+    hashes = codes.astype(np.uint64) * _MINIMIZER_HASH_MULTIPLIER
+    if len(codes) <= w:
+        return codes[[int(np.argmin(hashes))]]
+    window_argmin = np.lib.stride_tricks.sliding_window_view(hashes, w).argmin(axis=1)
+    return np.unique(codes[window_argmin + np.arange(len(window_argmin))])
+
+
+def _iter_minimizer_chunks(fasta_file: str | Path, k: int, w: int, chunk_size: int):
+    """yield (header list, minimizer codes, sequence number of each code) for every `chunk_size` sequences"""
+    headers, code_chunks, sequence_number_chunks = [], [], []
+    n_sequences = 0
+    for header, sequence in sequence_store._iter_fasta(fasta_file):
+        sequence_minimizers = minimizers(sequence.upper(), k, w)
+        code_chunks.append(sequence_minimizers)
+        sequence_number_chunks.append(np.full(len(sequence_minimizers), n_sequences, dtype=np.uint32))
+        headers.append(header)
+        n_sequences += 1
+        if len(headers) == chunk_size:
+            yield headers, np.concatenate(code_chunks), np.concatenate(sequence_number_chunks)
+            headers, code_chunks, sequence_number_chunks = [], [], []
+    if headers:
+        yield headers, np.concatenate(code_chunks), np.concatenate(sequence_number_chunks)
+
+
+def build_kmer_index(
+    fasta_file: str | Path,
+    index_dir: str | Path,
+    k: int = DEFAULT_K,
+    w: int = DEFAULT_W,
+    chunk_size: int = 100_000,
+):
+    """build the k-mer (minimizer) inverted index from a fasta file
+
+    The fasta file is read twice, once to count the sequences that contain
+    each minimizer and once to write the postings straight into their place
+    in a memory-mapped array, so the postings never have to fit in memory.
+    The arrays are written to a temporary directory that is renamed to
+    `index_dir` once it is complete.
+
+    Parameters
+    ----------
+    fasta_file : str | Path
+        fasta file with the sequences (e.g. odb11v0_all_og_fasta.tab)
+    index_dir : str | Path
+        directory to write the index to. It is replaced if it already exists
+    k : int, optional
+        k-mer length, by default 5
+    w : int, optional
+        minimizer window (number of consecutive k-mers), by default 8
+    chunk_size : int, optional
+        number of sequences processed at a time, by default 100_000
+    """
+    index_dir = Path(index_dir)
+    start_time = time.perf_counter()
+    print(f"building k-mer index (k={k}, w={w}) from: {fasta_file}")
+    gene_ids = []
+    kmer_counts = np.zeros(20**k, dtype=np.int64)
+    for headers, codes, _ in _iter_minimizer_chunks(fasta_file, k, w, chunk_size):
+        # Biopython uses the first word of the header line as the id
+        gene_ids.extend(header.split(None, 1)[0] if header.strip() else "" for header in headers)
+        kmer_counts += np.bincount(codes, minlength=20**k)
+        print(f"counted {len(gene_ids):,} sequences ({time.perf_counter() - start_time:,.1f} s)")
+    if len(gene_ids) >= 2**32:
+        raise ValueError(f"too many sequences for the uint32 postings: {len(gene_ids):,}")
+    kmer_offsets = np.zeros(20**k + 1, dtype=np.int64)
+    np.cumsum(kmer_counts, out=kmer_offsets[1:])
+    print(f"{len(gene_ids):,} sequences, {kmer_offsets[-1]:,} postings ({time.perf_counter() - start_time:,.1f} s)")
+
+    temp_dir = index_dir.with_name(f"{index_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    postings = np.lib.format.open_memmap(
+        temp_dir / "postings.npy", mode="w+", dtype=np.uint32, shape=(int(kmer_offsets[-1]),)
+    )
+    # the next free position of each k-mer. The postings of each k-mer are
+    # written in fasta file order
+    next_position = kmer_offsets[:-1].copy()
+    n_filled = 0
+    for headers, codes, sequence_numbers in _iter_minimizer_chunks(fasta_file, k, w, chunk_size):
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        unique_codes, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        rank = np.arange(len(codes)) - np.repeat(first, counts)
+        postings[next_position[codes] + rank] = sequence_numbers[order]
+        next_position[unique_codes] += counts
+        n_filled += len(headers)
+        print(f"indexed {n_filled:,} sequences ({time.perf_counter() - start_time:,.1f} s)")
+    postings.flush()
+    del postings
+    arrays = {
+        "gene_ids": np.array(gene_ids, dtype="S"),
+        "kmer_offsets": kmer_offsets,
+        "params": np.array([k, w], dtype=np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(temp_dir / f"{name}.npy", array)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    temp_dir.rename(index_dir)
+    print(f"wrote k-mer index to {index_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+class KmerIndex:
+    """read-only view of a k-mer index built by `build_kmer_index`
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory containing the index arrays
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(self.index_dir / f"{name}.npy", mmap_mode="r"))
+        self.k, self.w = (int(i) for i in self.params)
+
+    def search(self, sequence: str, n_candidates: int = 10, max_postings: int = 100_000) -> list[tuple[str, int]]:
+        """return the sequences that share the most minimizers with `sequence`
+
+        Parameters
+        ----------
+        sequence : str
+            the query sequence
+        n_candidates : int, optional
+            number of sequences to return, by default 10
+        max_postings : int, optional
+            minimizers that are in more than this many sequences carry
+            little information and are skipped, by default 100_000
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            (odb_gene_id, number of shared minimizers), most shared first
+        """
+        query_minimizers = minimizers(normalize_sequence(sequence), self.k, self.w)
+        starts = self.kmer_offsets[query_minimizers]
+        ends = self.kmer_offsets[query_minimizers + 1]
+        keep = (ends - starts) <= max_postings
+        if not keep.any():
+            return []
+        hits = np.concatenate([self.postings[s:e] for s, e in zip(starts[keep], ends[keep])])
+        if len(hits) == 0:
+            return []
+        sequence_indices, counts = np.unique(hits, return_counts=True)
+        top = np.argsort(-counts, kind="stable")[:n_candidates]
+        return [
+            (self.gene_ids[sequence_indices[i]].decode(), int(counts[i]))
+            for i in top
+        ]
+
+
+_KMER_INDEX: KmerIndex | None = None
+
+
+def _get_kmer_index() -> KmerIndex | None:
+    """return the k-mer index if it has been built, otherwise None"""
+    global _KMER_INDEX
+    if _KMER_INDEX is None:
+        if not index_exists(env.orthoDB_files.kmer_index_dir):
+            return None
+        _KMER_INDEX = KmerIndex(env.orthoDB_files.kmer_index_dir)
+    return _KMER_INDEX
+
+
+def kmer_containment(query_sequence: str, target_sequence: str, k: int = DEFAULT_K) -> float:
+    """fraction of the (unique, valid) k-mers of the query that are also in the target"""
+    query_kmers = np.unique(kmer_codes(query_sequence, k))
+    query_kmers = query_kmers[query_kmers >= 0]
+    if len(query_kmers) == 0:
+        return 0.0
+    target_kmers = kmer_codes(target_sequence, k)
+    return float(np.isin(query_kmers, target_kmers).mean())
+
+
+def _species_id(odb_gene_id: str) -> str:
+    return odb_gene_id.split(":")[0]
+
+
+def search_sequence(sequence: str, n_hits: int = 10, species_id: str | None = None) -> pd.DataFrame:
+    """find the orthoDB genes with a sequence that is identical or similar to `sequence`
+
+    Identical sequences are found by digest. Only if there are none (or, with
+    `species_id`, none in that species) are similar sequences looked up in the
+    k-mer index (if it has been built) and verified by k-mer containment.
+
+    Parameters
+    ----------
+    sequence : str
+        the query protein sequence
+    n_hits : int, optional
+        maximum number of approximate hits to return, by default 10
+    species_id : str | None, optional
+        orthoDB species id of the query (e.g. "9606_0"). Exact hits in this
+        species are listed before the exact hits in other species, by default None
+
+    Returns
+    -------
+    pd.DataFrame
+        columns: odb_gene_id | match | shared_minimizers | score, best hit first.
+        `match` is "exact" or "kmer". `score` is the fraction of the query's
+        k-mers that are in the hit (1.0 for exact matches). Exact hits are
+        sorted by odb_gene_id (the ones in `species_id` first)
+    """
+    sequence = normalize_sequence(sequence)
+    columns = ["odb_gene_id", "match", "shared_minimizers", "score"]
+    exact_hits = []
+    if Path(env.orthoDB_files.seq_info_sqlite).exists():
+        exact_hits = sql_queries.seq_md5_2_odb_gene_id_list(sequence_md5(sequence))
+        if species_id is not None:
+            exact_hits = sorted(exact_hits, key=lambda odb_gene_id: _species_id(odb_gene_id) != species_id)
+        if len(exact_hits) > 0 and (
+            species_id is None or _species_id(exact_hits[0]) == species_id
+        ):
+            return pd.DataFrame.from_records(
+                [(odb_gene_id, EXACT_MATCH, None, 1.0) for odb_gene_id in exact_hits], columns=columns
+            )
+    records = [(odb_gene_id, EXACT_MATCH, None, 1.0) for odb_gene_id in exact_hits]
+    index = _get_kmer_index()
+    if index is None:
+        return pd.DataFrame.from_records(records, columns=columns)
+    candidates = [
+        candidate for candidate in index.search(sequence, n_candidates=n_hits) if candidate[0] not in exact_hits
+    ]
+    candidate_records = env.get_orthoDB_database().get_sequences_from_list_of_seq_ids(
+        [odb_gene_id for odb_gene_id, _ in candidates]
+    )
+    for odb_gene_id, shared_minimizers in candidates:
+        target_sequence = candidate_records[odb_gene_id].seq.upper()
+        if target_sequence == sequence:
+            match, score = EXACT_MATCH, 1.0
+        else:
+            match, score = KMER_MATCH, kmer_containment(sequence, target_sequence, index.k)
+        records.append((odb_gene_id, match, shared_minimizers, score))
+    hits_df = pd.DataFrame.from_records(records, columns=columns)
+    return hits_df.sort_values(by=["score", "shared_minimizers"], ascending=False, kind="stable", ignore_index=True)
+
+
+def sequence_2_odb_gene_id(
+    sequence: str, min_score: float = 0.5, species_id: str | None = None
+) -> tuple[str, str, float, list[str]]:
+    """return the best orthoDB gene for a protein sequence (see `search_sequence`)
+
+    If several genes have the sequence, the exact hit in `species_id` is
+    preferred. Without `species_id`, the first exact hit (by odb_gene_id) is
+    returned, with a warning if the exact hits are from more than one species.
+
+    Parameters
+    ----------
+    sequence : str
+        the query protein sequence
+    min_score : float, optional
+        minimum fraction of the query's k-mers that an approximate hit must
+        contain, by default 0.5
+    species_id : str | None, optional
+        orthoDB species id of the query (e.g. "9606_0"). Only genes of this
+        species are returned, by default None (any species)
+
+    Returns
+    -------
+    tuple[str, str, float, list[str]]
+        the odb_gene_id, the match type ("exact" or "kmer"), the score and
+        the odb_gene_ids of every gene with an identical sequence (in any species)
+
+    Raises
+    ------
+    ValueError
+        if no gene (of `species_id`) has an identical sequence or a similar
+        one with a score of at least `min_score`
+    """
+    hits_df = search_sequence(sequence, n_hits=10, species_id=species_id)
+    exact_hits = hits_df.loc[hits_df["match"] == EXACT_MATCH, "odb_gene_id"].tolist()
+    if species_id is not None:
+        other_species_hits = hits_df[hits_df["odb_gene_id"].map(_species_id) != species_id]
+        hits_df = hits_df[hits_df["odb_gene_id"].map(_species_id) == species_id].reset_index(drop=True)
+    if len(hits_df) == 0 or hits_df.loc[0, "score"] < min_score:
+        best = "" if len(hits_df) == 0 else f" (best hit: {hits_df.loc[0, 'odb_gene_id']}, score {hits_df.loc[0, 'score']:.2f})"
+        in_species = ""
+        if species_id is not None:
+            in_species = f" in species {species_id}"
+            if len(other_species_hits) > 0:
+                best += f" (best hit in another species: {other_species_hits.iloc[0]['odb_gene_id']}, score {other_species_hits.iloc[0]['score']:.2f})"
+        raise ValueError(f"no orthoDB sequence{in_species} matches the query sequence with a score of at least {min_score}{best}")
+    hit_species = sorted({_species_id(odb_gene_id) for odb_gene_id in exact_hits})
+    if species_id is None and len(hit_species) > 1:
+        warnings.warn(
+            f"the query sequence is identical to {len(exact_hits)} orthoDB genes from {len(hit_species)} species "
+            f"({', '.join(hit_species)}). Using {hits_df.loc[0, 'odb_gene_id']}. Give the species id of the query to choose"
+        )
+    return hits_df.loc[0, "odb_gene_id"], hits_df.loc[0, "match"], float(hits_df.loc[0, "score"]), exact_hits
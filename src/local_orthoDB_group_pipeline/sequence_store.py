@@ -0,0 +1,227 @@
+"""packed, memory-mapped store of the orthoDB sequences
+
+Replaces the Biopython `SeqIO.index_db` lookup of the all-OG fasta file, where
+every sequence costs a sqlite query, a seek into the text fasta file and a full
+fasta parse. The store keeps:
+- `residues.bin`: all of the sequences concatenated into one blob, in fasta file order
+- `headers.bin`: all of the fasta header lines (without the ">") concatenated into one blob
+- `gene_ids.npy`: the sorted sequence ids (odb_gene_ids). A gene's position in
+  this array is its interned index
+- `seq_offsets.npy`/`seq_lengths.npy` and `header_offsets.npy`/`header_lengths.npy`:
+  where each gene's sequence/header is in the blobs, indexed by interned index
+
+Everything is opened read-only with numpy memory maps, so a sequence is just a
+slice of `residues.bin` and nothing is parsed on retrieval.
+
+The store is built with `scripts-gen_SQLite_dbs/make_sequence_store.py`.
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+INDEX_ARRAYS = [
+    "gene_ids",
+    "seq_offsets",
+    "seq_lengths",
+    "header_offsets",
+    "header_lengths",
+]
+BLOBS = ["residues", "headers"]
+
+
+def store_exists(store_dir: str | Path) -> bool:
+    store_dir = Path(store_dir)
+    return all((store_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS) and all(
+        (store_dir / f"{name}.bin").exists() for name in BLOBS
+    )
+
+
+def _iter_fasta(fasta_file: str | Path):
+    """yield (header, sequence) for each record in a fasta file
+
+    The sequence is built the same way as in Biopython's fasta parser (lines
+    joined with spaces and carriage returns removed)
+    """
+    header = None
+    seq_lines = []
+    with open(fasta_file, "r") as handle:
+        for line in handle:
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(seq_lines).replace(" ", "").replace("\r", "")
+                header = line[1:].rstrip()
+                seq_lines = []
+            elif header is not None:
+                seq_lines.append(line.rstrip())
+    if header is not None:
+        yield header, "".join(seq_lines).replace(" ", "").replace("\r", "")
+
+
+def build_sequence_store(fasta_file: str | Path, store_dir: str | Path, report_every: int = 1_000_000):
+    """build a sequence store from a fasta file (e.g. odb11v0_all_og_fasta.tab)
+
+    The store is written to a temporary directory that is renamed to
+    `store_dir` once it is complete.
+
+    Parameters
+    ----------
+    fasta_file : str | Path
+        fasta file with the sequences
+    store_dir : str | Path
+        directory to write the store to. It is replaced if it already exists
+    report_every : int, optional
+        print progress after this many sequences, by default 1_000_000
+
+    Raises
+    ------
+    ValueError
+        if a sequence id appears more than once in the fasta file
+    """
+    store_dir = Path(store_dir)
+    start_time = time.perf_counter()
+    print(f"building sequence store from: {fasta_file}")
+    temp_dir = store_dir.with_name(f"{store_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    gene_ids = []
+    seq_lengths = []
+    header_lengths = []
+    with open(temp_dir / "residues.bin", "wb") as residues_file, open(
+        temp_dir / "headers.bin", "wb"
+    ) as headers_file:
+        for header, sequence in _iter_fasta(fasta_file):
+            # Biopython uses the first word of the header line as the id
+            gene_ids.append(header.split(None, 1)[0] if header.strip() else "")
+            header_bytes = header.encode()
+            residues_file.write(sequence.encode())
+            headers_file.write(header_bytes)
+            seq_lengths.append(len(sequence))
+            header_lengths.append(len(header_bytes))
+            if len(gene_ids) % report_every == 0:
+                elapsed = time.perf_counter() - start_time
+                print(f"{len(gene_ids):,} sequences ({len(gene_ids) / elapsed:,.0f} sequences/s)")
+    seq_lengths = np.array(seq_lengths, dtype=np.int64)
+    header_lengths = np.array(header_lengths, dtype=np.int64)
+    # offsets into the blobs, in fasta file order
+    seq_offsets = np.concatenate([[0], np.cumsum(seq_lengths)[:-1]]).astype(np.int64)
+    header_offsets = np.concatenate([[0], np.cumsum(header_lengths)[:-1]]).astype(np.int64)
+    gene_ids = np.array(gene_ids, dtype="S")
+    order = np.argsort(gene_ids, kind="stable")
+    gene_ids = gene_ids[order]
+    duplicated = gene_ids[1:] == gene_ids[:-1]
+    if duplicated.any():
+        shutil.rmtree(temp_dir)
+        raise ValueError(
+            f"duplicate sequence ids in {fasta_file}: {gene_ids[1:][duplicated][:10]}"
+        )
+    arrays = {
+        "gene_ids": gene_ids,
+        "seq_offsets": seq_offsets[order],
+        "seq_lengths": seq_lengths[order],
+        "header_offsets": header_offsets[order],
+        "header_lengths": header_lengths[order],
+    }
+    for name, array in arrays.items():
+        np.save(temp_dir / f"{name}.npy", array)
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    temp_dir.rename(store_dir)
+    print(f"wrote {len(gene_ids):,} sequences to {store_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+def _open_blob(path: Path) -> np.ndarray:
+    # np.memmap can't map an empty file
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class SequenceStore:
+    """read-only view of a sequence store built by `build_sequence_store`
+
+    Parameters
+    ----------
+    store_dir : str | Path
+        directory containing the store
+    """
+
+    def __init__(self, store_dir: str | Path):
+        self.store_dir = Path(store_dir)
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(self.store_dir / f"{name}.npy", mmap_mode="r"))
+        self.residues = _open_blob(self.store_dir / "residues.bin")
+        self.headers = _open_blob(self.store_dir / "headers.bin")
+
+    def __len__(self) -> int:
+        return len(self.gene_ids)
+
+    def __contains__(self, gene_id: str) -> bool:
+        return self.get_index(gene_id) is not None
+
+    def get_index(self, gene_id: str) -> int | None:
+        """return the interned index of `gene_id`, or None if it is not in the store"""
+        key = gene_id.encode()
+        i = int(np.searchsorted(self.gene_ids, key))
+        if i < len(self.gene_ids) and self.gene_ids[i] == key:
+            return i
+        return None
+
+    def get_indices(self, gene_ids: list[str]) -> np.ndarray:
+        """return the interned indices of `gene_ids`
+
+        Raises
+        ------
+        KeyError
+            if any of the ids are not in the store
+        """
+        keys = np.array(gene_ids, dtype="S")
+        indices = np.searchsorted(self.gene_ids, keys)
+        found = indices < len(self.gene_ids)
+        found[found] = self.gene_ids[indices[found]] == keys[found]
+        if not found.all():
+            missing = [gene_id for gene_id, f in zip(gene_ids, found) if not f]
+            raise KeyError(f"sequence ids not found in the sequence store: {missing[:10]}")
+        return indices
+
+    def _slice(self, blob: np.ndarray, offset: int, length: int) -> str:
+        return blob[offset : offset + length].tobytes().decode()
+
+    def get_sequence(self, gene_id: str) -> str:
+        i = self.get_index(gene_id)
+        if i is None:
+            raise KeyError(f"sequence id not found in the sequence store: {gene_id}")
+        return self._slice(self.residues, self.seq_offsets[i], self.seq_lengths[i])
+
+    def get_sequences(self, gene_ids: list[str]) -> dict[str, str]:
+        """return a dictionary of sequence strings for a list of sequence ids"""
+        if len(gene_ids) == 0:
+            return {}
+        indices = self.get_indices(gene_ids)
+        offsets = self.seq_offsets[indices]
+        lengths = self.seq_lengths[indices]
+        return {
+            gene_id: self._slice(self.residues, offset, length)
+            for gene_id, offset, length in zip(gene_ids, offsets, lengths)
+        }
+
+    def get_headers(self, gene_ids: list[str]) -> dict[str, str]:
+        """return a dictionary of fasta header lines (without the ">") for a list of sequence ids"""
+        if len(gene_ids) == 0:
+            return {}
+        indices = self.get_indices(gene_ids)
+        offsets = self.header_offsets[indices]
+        lengths = self.header_lengths[indices]
+        return {
+            gene_id: self._slice(self.headers, offset, length)
+            for gene_id, offset, length in zip(gene_ids, offsets, lengths)
+        }
+
+    def get_lengths(self, gene_ids: list[str]) -> dict[str, int]:
+        """return a dictionary of sequence lengths for a list of sequence ids"""
+        if len(gene_ids) == 0:
+            return {}
+        indices = self.get_indices(gene_ids)
+        return dict(zip(gene_ids, self.seq_lengths[indices].tolist()))
@@ -1,21 +1,204 @@
+import os
 import sqlite3
 from pathlib import Path
 
 from local_env_variables import env_variables as env
+from local_orthoDB_group_pipeline import og_membership_index
+
+# ==============================================================================
+# // query statements
+# ==============================================================================
+# The columns are always selected by name so that the queries work with both
+# the default schema and the optimized schema built by `scripts-gen_SQLite_dbs`
+UNIPROTID_2_ODB_GENE_ID_REFS_SQL = "SELECT odb_gene_id FROM gene_refs WHERE Uniprotid=?"
+UNIPROTID_2_ODB_GENE_ID_XREFS_SQL = "SELECT odb_gene_id, DB_name FROM gene_xrefs WHERE xref_id=?"
+ODB_GENE_ID_2_SPECIES_ID_SQL = "SELECT species_id FROM gene_refs WHERE odb_gene_id=?"
+ODB_GENE_ID_2_OGID_LIST_SQL = "SELECT OG_id FROM OG2genes WHERE odb_gene_id=?"
+GET_OGID_INFO_SQL = "SELECT OG_id, level_NCBI_tax_id, OG_name FROM OGs WHERE OG_id=?"
+ODB_GENE_ID_2_UNIPROTID_SQL = "SELECT Uniprotid FROM gene_refs WHERE odb_gene_id=?"
+OGID_2_ODB_GENE_ID_LIST_SQL = "SELECT odb_gene_id FROM OG2genes WHERE OG_id=?"
+ALL_ODB_GENE_IDS_FROM_SPECIES_ID_SQL = "SELECT odb_gene_id FROM gene_refs WHERE species_id=?"
+SEQ_MD5_2_ODB_GENE_ID_LIST_SQL = "SELECT odb_gene_id FROM seq_info WHERE seq_md5=? ORDER BY odb_gene_id"
+# bulk queries, `{placeholders}` is filled in with one `?` per id
+UNIPROTID_LIST_2_ODB_GENE_ID_REFS_SQL = "SELECT Uniprotid, odb_gene_id FROM gene_refs WHERE Uniprotid IN ({placeholders})"
+UNIPROTID_LIST_2_ODB_GENE_ID_XREFS_SQL = "SELECT xref_id, odb_gene_id, DB_name FROM gene_xrefs WHERE xref_id IN ({placeholders})"
+ODB_GENE_ID_LIST_2_UNIPROTID_SQL = "SELECT odb_gene_id, Uniprotid FROM gene_refs WHERE odb_gene_id IN ({placeholders})"
+ODB_GENE_ID_LIST_2_OGID_LIST_SQL = "SELECT odb_gene_id, OG_id FROM OG2genes WHERE odb_gene_id IN ({placeholders})"
+OGID_LIST_2_ODB_GENE_ID_LIST_SQL = "SELECT OG_id, odb_gene_id FROM OG2genes WHERE OG_id IN ({placeholders})"
+OGID_LIST_2_OGID_INFO_SQL = "SELECT OG_id, level_NCBI_tax_id, OG_name FROM OGs WHERE OG_id IN ({placeholders})"
+# full-text gene search (`gene_search.search_genes`). The first parameter is
+# the FTS5 query. bm25 weights: odb_gene_id, species_id, gene_names, ids, description
+GENE_SEARCH_SQL = (
+    "SELECT odb_gene_id, species_id, gene_names, ids, description, "
+    "bm25(gene_search, 0.0, 0.0, 10.0, 5.0, 1.0) AS score "
+    "FROM gene_search WHERE gene_search MATCH ? ORDER BY score LIMIT ?"
+)
+# set-based uniprot id mapping (`uniprotid_search.map_uniprotids_bulk`). The
+# ids are loaded into `temp.query_ids` and joined against the gene_refs and
+# gene_xrefs databases, attached as `refs` and `xrefs`. CROSS JOIN makes sqlite
+# loop over the query ids and look each one up with the xref_id/Uniprotid
+# index, and the unary + keeps it from using the DB_name index instead
+BULK_MAP_CREATE_QUERY_IDS_SQL = "CREATE TEMP TABLE query_ids (uniprot_id TEXT PRIMARY KEY) WITHOUT ROWID"
+BULK_MAP_INSERT_QUERY_IDS_SQL = "INSERT OR IGNORE INTO temp.query_ids (uniprot_id) VALUES (?)"
+BULK_MAP_DROP_QUERY_IDS_SQL = "DROP TABLE temp.query_ids"
+BULK_MAP_REFS_SQL = (
+    "SELECT q.uniprot_id, g.odb_gene_id FROM temp.query_ids AS q "
+    "CROSS JOIN refs.gene_refs AS g ON g.Uniprotid = q.uniprot_id"
+)
+BULK_MAP_XREFS_SQL = (
+    "SELECT q.uniprot_id, x.odb_gene_id FROM temp.query_ids AS q "
+    "CROSS JOIN xrefs.gene_xrefs AS x ON x.xref_id = q.uniprot_id "
+    "WHERE +x.DB_name = 'UniProt' "
+    "AND NOT EXISTS (SELECT 1 FROM refs.gene_refs AS g WHERE g.Uniprotid = q.uniprot_id)"
+)
+# the databases that the set-based mapping attaches (schema alias ->
+# `orthoDB_files_object` attribute) and its queries, which are checked apart
+# from `PIPELINE_QUERIES` because they join the temp table of the query ids
+BULK_MAP_DATABASES: dict[str, str] = {"refs": "gene_refs_sqlite", "xrefs": "gene_xrefs_sqlite"}
+BULK_MAP_QUERIES: dict[str, str] = {
+    "bulk_map_refs": BULK_MAP_REFS_SQL,
+    "bulk_map_xrefs": BULK_MAP_XREFS_SQL,
+}
+ODB_GENE_ID_LIST_2_SEQ_LENGTH_SQL = "SELECT odb_gene_id, seq_length FROM seq_info WHERE odb_gene_id IN ({placeholders})"
+
+# every query used by the pipeline and the `orthoDB_files_object` attribute of
+# the database it runs against. Used to check the query plans of a database
+# build (`scripts-gen_SQLite_dbs/check_query_plans.py`)
+PIPELINE_QUERIES: dict[str, tuple[str, str]] = {
+    "uniprotid_2_odb_gene_id_refs": ("gene_refs_sqlite", UNIPROTID_2_ODB_GENE_ID_REFS_SQL),
+    "uniprotid_2_odb_gene_id_xrefs": ("gene_xrefs_sqlite", UNIPROTID_2_ODB_GENE_ID_XREFS_SQL),
+    "odb_gene_id_2_species_id": ("gene_refs_sqlite", ODB_GENE_ID_2_SPECIES_ID_SQL),
+    "odb_gene_id_2_ogid_list": ("OG2genes_sqlite", ODB_GENE_ID_2_OGID_LIST_SQL),
+    "get_ogid_info": ("ogs_sqlite", GET_OGID_INFO_SQL),
+    "odb_gene_id_2_uniprotid": ("gene_refs_sqlite", ODB_GENE_ID_2_UNIPROTID_SQL),
+    "ogid_2_odb_gene_id_list": ("OG2genes_sqlite", OGID_2_ODB_GENE_ID_LIST_SQL),
+    "get_all_odb_gene_ids_from_species_id": ("gene_refs_sqlite", ALL_ODB_GENE_IDS_FROM_SPECIES_ID_SQL),
+    "seq_md5_2_odb_gene_id_list": ("seq_info_sqlite", SEQ_MD5_2_ODB_GENE_ID_LIST_SQL),
+    "uniprotid_list_2_odb_gene_id_refs_dict": ("gene_refs_sqlite", UNIPROTID_LIST_2_ODB_GENE_ID_REFS_SQL),
+    "uniprotid_list_2_odb_gene_id_xrefs_dict": ("gene_xrefs_sqlite", UNIPROTID_LIST_2_ODB_GENE_ID_XREFS_SQL),
+    "odb_gene_id_list_2_uniprotid_dict": ("gene_refs_sqlite", ODB_GENE_ID_LIST_2_UNIPROTID_SQL),
+    "odb_gene_id_list_2_ogid_list_dict": ("OG2genes_sqlite", ODB_GENE_ID_LIST_2_OGID_LIST_SQL),
+    "ogid_list_2_odb_gene_id_list_dict": ("OG2genes_sqlite", OGID_LIST_2_ODB_GENE_ID_LIST_SQL),
+    "ogid_list_2_ogid_info_dict": ("ogs_sqlite", OGID_LIST_2_OGID_INFO_SQL),
+    "odb_gene_id_list_2_seq_length_dict": ("seq_info_sqlite", ODB_GENE_ID_LIST_2_SEQ_LENGTH_SQL),
+}
+
+# connection settings for the read-only orthoDB databases
+SQLITE_MMAP_SIZE = 2**30  # bytes
+SQLITE_CACHE_SIZE_KIB = 65536
+SQLITE_CACHED_STATEMENTS = 256
+
+# one connection per database file, per process. The connections are keyed by
+# the process id so that a forked child (e.g. a multiprocessing.Pool worker)
+# never reuses a connection that it inherited from its parent
+_CONNECTIONS: dict[str, sqlite3.Connection] = {}
+_CONNECTIONS_PID: int | None = None
+_OG_MEMBERSHIP_INDEX: og_membership_index.OGMembershipIndex | None = None
+
+
+def _open_readonly_connection(db_path: str | Path) -> sqlite3.Connection:
+    """open a read-only connection to a sqlite database file
+
+    The databases are never written to after they are built by the scripts in
+    `scripts-gen_SQLite_dbs`, so they are opened as immutable, which lets sqlite
+    skip file locking and change detection entirely.
+    """
+    db_path = Path(db_path)
+    if not db_path.exists():
+        raise FileNotFoundError(f"sqlite database not found: {db_path}")
+    uri = f"{db_path.resolve().as_uri()}?mode=ro&immutable=1"
+    connection = sqlite3.connect(
+        uri, uri=True, cached_statements=SQLITE_CACHED_STATEMENTS
+    )
+    connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    connection.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    connection.execute("PRAGMA query_only=1")
+    return connection
+
+
+def open_attached_connection(databases: dict[str, str | Path]) -> sqlite3.Connection:
+    """open a new in-memory connection with each database attached read-only under its alias
+
+    Used for set-based queries that load a list of ids into a temp table and
+    join it against tables in one or more of the databases (e.g.
+    `uniprotid_search.map_uniprotids_bulk`). The caller owns the connection and
+    should close it when done.
+
+    Parameters
+    ----------
+    databases : dict[str, str | Path]
+        maps the schema alias to attach each database as (e.g. "refs") to its file
+    """
+    connection = sqlite3.connect(":memory:", uri=True, cached_statements=SQLITE_CACHED_STATEMENTS)
+    connection.execute("PRAGMA temp_store=MEMORY")
+    for alias, db_path in databases.items():
+        db_path = Path(db_path)
+        if not db_path.exists():
+            raise FileNotFoundError(f"sqlite database not found: {db_path}")
+        uri = f"{db_path.resolve().as_uri()}?mode=ro&immutable=1"
+        connection.execute("ATTACH DATABASE ? AS ?", (uri, alias))
+        connection.execute(f"PRAGMA {alias}.mmap_size={SQLITE_MMAP_SIZE}")
+        connection.execute(f"PRAGMA {alias}.cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    return connection
+
+
+def get_connection(db_path: str | Path) -> sqlite3.Connection:
+    """return this process's shared read-only connection to `db_path`
+
+    The connection is opened on first use and reused by every later query, so
+    prepared statements stay cached between calls. Don't close the returned
+    connection, use `close_connections` instead.
+    """
+    global _CONNECTIONS_PID
+    if _CONNECTIONS_PID != os.getpid():
+        # connections inherited through fork are dropped without being closed,
+        # they still belong to the parent process
+        _CONNECTIONS.clear()
+        _CONNECTIONS_PID = os.getpid()
+    key = str(db_path)
+    if key not in _CONNECTIONS:
+        _CONNECTIONS[key] = _open_readonly_connection(db_path)
+    return _CONNECTIONS[key]
+
+
+def _get_og_membership_index(
+    db_path: str | Path,
+) -> og_membership_index.OGMembershipIndex | None:
+    """return the memory-mapped OG membership index if it should replace `db_path`
+
+    The index is only used in place of the default OG2genes database, and only
+    if it has been built (`scripts-gen_SQLite_dbs/make_OG2genes_index.py`).
+    The memory maps are safe to share with forked processes, so unlike the
+    connections, the index is not reopened after a fork.
+    """
+    global _OG_MEMBERSHIP_INDEX
+    if str(db_path) != env.orthoDB_files.OG2genes_sqlite:
+        return None
+    if _OG_MEMBERSHIP_INDEX is None:
+        if not og_membership_index.index_exists(env.orthoDB_files.OG2genes_index_dir):
+            return None
+        _OG_MEMBERSHIP_INDEX = og_membership_index.OGMembershipIndex(
+            env.orthoDB_files.OG2genes_index_dir
+        )
+    return _OG_MEMBERSHIP_INDEX
+
+
+def close_connections():
+    """close all of the connections opened by this process"""
+    if _CONNECTIONS_PID == os.getpid():
+        for connection in _CONNECTIONS.values():
+            connection.close()
+    _CONNECTIONS.clear()
 
 
 def uniprotid_2_odb_gene_id_refs(
     uniprotid, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> list[str]:
     """return the odb_gene_id from a uniprot ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT odb_gene_id FROM gene_refs WHERE Uniprotid='{uniprotid}'"
-    )
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(UNIPROTID_2_ODB_GENE_ID_REFS_SQL, (uniprotid,))
     odb_gene_ids = res.fetchall()
     odb_gene_ids = [x[0] for x in odb_gene_ids]
-    connection.close()
     return odb_gene_ids
 
 
@@ -23,14 +206,14 @@ def uniprotid_2_odb_gene_id_xrefs(
     uniprotid, db_path: str | Path = env.orthoDB_files.gene_xrefs_sqlite
 ) -> list[str]:
     """return the odb_gene_id from a uniprot ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    # res = cursor.execute(f"SELECT odb_gene_id FROM gene_xrefs WHERE xref_id='{uniprotid}' AND DB_name='UniProt'")
-    # This is much faster if you don't specify the DB_name and then filter the results
-    res = cursor.execute(f"SELECT * FROM gene_xrefs WHERE xref_id='{uniprotid}'")
+    cursor = get_connection(db_path).cursor()
+    # the DB_name is filtered in python rather than in the query. With the
+    # default schema (single column indexes), adding `AND DB_name='UniProt'`
+    # can make sqlite use the DB_name index, which is much slower. The
+    # optimized schema has an (xref_id, DB_name) key so either way is fast there
+    res = cursor.execute(UNIPROTID_2_ODB_GENE_ID_XREFS_SQL, (uniprotid,))
     odb_gene_ids = res.fetchall()
-    odb_gene_ids = [x[1] for x in odb_gene_ids if x[3] == "UniProt"]
-    connection.close()
+    odb_gene_ids = [x[0] for x in odb_gene_ids if x[1] == "UniProt"]
     return odb_gene_ids
 
 
@@ -38,13 +221,9 @@ def odb_gene_id_2_species_id(
     odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> str:
     """return the species ID from an orthodb ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT species_id FROM gene_refs WHERE odb_gene_id='{odb_gene_id}'"
-    )
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(ODB_GENE_ID_2_SPECIES_ID_SQL, (odb_gene_id,))
     species_id = res.fetchall()[0][0]
-    connection.close()
     return species_id
 
 
@@ -53,6 +232,9 @@ def odb_gene_id_2_ogid_list(
 ) -> list[str]:
     """Given a odb_gene_id, return the list of OGs it belongs to
 
+    Uses the memory-mapped OG membership index instead of the database if it
+    has been built (see `og_membership_index`)
+
     Parameters
     ----------
     odb_gene_id : str
@@ -65,15 +247,15 @@ def odb_gene_id_2_ogid_list(
     list[str]
         list of OGs the gene id (orthodb id) belongs to
     """
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT OG_id FROM OG2genes WHERE odb_gene_id='{odb_gene_id}'"
-    )
-    og_ids = res.fetchall()
-    og_ids = [og_id[0] for og_id in og_ids]
-    og_ids = list(set(og_ids))
-    connection.close()
+    og_index = _get_og_membership_index(db_path)
+    if og_index is not None:
+        og_ids = og_index.odb_gene_id_2_ogid_list(odb_gene_id)
+    else:
+        cursor = get_connection(db_path).cursor()
+        res = cursor.execute(ODB_GENE_ID_2_OGID_LIST_SQL, (odb_gene_id,))
+        og_ids = res.fetchall()
+        og_ids = [og_id[0] for og_id in og_ids]
+        og_ids = list(set(og_ids))
     if len(og_ids) == 0:
         raise ValueError(f"no OGs found for gene id {odb_gene_id}")
     return og_ids
@@ -89,26 +271,20 @@ def get_ogid_info(
     tuple[str]
         returns a tuple composed of (ogid, level NCBI tax id, and OG name)
     """
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT * FROM OGs WHERE OG_id='{ogid}'")
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(GET_OGID_INFO_SQL, (ogid,))
     og_info = res.fetchall()[0]
     # raise error if no results found?
-    connection.close()
-    return og_info[1:]
+    return og_info
 
 
 def odb_gene_id_2_uniprotid(
     odb_gene_id, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> str:
     """return the uniprot ID from an orthodb ID"""
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(
-        f"SELECT Uniprotid FROM gene_refs WHERE odb_gene_id='{odb_gene_id}'"
-    )
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(ODB_GENE_ID_2_UNIPROTID_SQL, (odb_gene_id,))
     result = res.fetchall()
-    connection.close()
     if len(result) == 0:
         # raise ValueError(f"no uniprot id found for gene id {odb_gene_id}")
         return ""
@@ -119,22 +295,209 @@ def odb_gene_id_2_uniprotid(
 def ogid_2_odb_gene_id_list(
     ogid, db_path: str | Path = env.orthoDB_files.OG2genes_sqlite
 ) -> list[str]:
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT odb_gene_id FROM OG2genes WHERE OG_id='{ogid}'")
+    """return the member odb_gene_ids of an OG
+
+    Uses the memory-mapped OG membership index instead of the database if it
+    has been built (see `og_membership_index`)
+    """
+    og_index = _get_og_membership_index(db_path)
+    if og_index is not None:
+        return og_index.ogid_2_odb_gene_id_list(ogid)
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(OGID_2_ODB_GENE_ID_LIST_SQL, (ogid,))
     odb_gene_ids = res.fetchall()
     odb_gene_ids = [x[0] for x in odb_gene_ids]
-    connection.close()
     return odb_gene_ids
 
 
 def get_all_odb_gene_ids_from_species_id(
     species_id: str, db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
 ) -> list[str]:
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    res = cursor.execute(f"SELECT * FROM gene_refs WHERE species_id='{species_id}'")
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(ALL_ODB_GENE_IDS_FROM_SPECIES_ID_SQL, (species_id,))
     results = res.fetchall()
-    gene_list = list(set([i[1] for i in results]))
-    connection.close()
+    gene_list = list(set([i[0] for i in results]))
     return gene_list
+
+
+def seq_md5_2_odb_gene_id_list(
+    seq_md5: str, db_path: str | Path = env.orthoDB_files.seq_info_sqlite
+) -> list[str]:
+    """return the odb_gene_ids of the sequences with the given md5 hexdigest (sorted)"""
+    cursor = get_connection(db_path).cursor()
+    res = cursor.execute(SEQ_MD5_2_ODB_GENE_ID_LIST_SQL, (seq_md5,))
+    return [x[0] for x in res.fetchall()]
+
+
+# ==============================================================================
+# // bulk queries
+# ==============================================================================
+# The bulk versions of the queries take a list of ids and return a dictionary,
+# resolving the whole list with a few `IN (...)` queries instead of one query
+# per id. The lists are split into chunks to stay under sqlite's limit on the
+# number of variables in a single statement.
+SQLITE_MAX_VARIABLES = 900
+
+
+def _bulk_select(
+    db_path: str | Path, query_template: str, ids: list[str]
+) -> list[tuple]:
+    """run `query_template` for chunks of `ids` and return all of the result rows
+
+    `query_template` should contain a `{placeholders}` field in its `IN (...)`
+    clause, e.g. `OGID_LIST_2_ODB_GENE_ID_LIST_SQL`
+    """
+    cursor = get_connection(db_path).cursor()
+    unique_ids = list(dict.fromkeys(ids))
+    rows = []
+    for i in range(0, len(unique_ids), SQLITE_MAX_VARIABLES):
+        chunk = unique_ids[i : i + SQLITE_MAX_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        res = cursor.execute(query_template.format(placeholders=placeholders), chunk)
+        rows.extend(res.fetchall())
+    return rows
+
+
+def odb_gene_id_2_species_id_from_str(odb_gene_id: str) -> str:
+    """return the species ID from an orthodb ID without querying the database
+
+    The species ID is the prefix of the odb_gene_id (e.g. "9606_0" for "9606_0:001c7b")
+    """
+    return odb_gene_id.split(":")[0]
+
+
+def odb_gene_id_list_2_species_id_dict(odb_gene_ids: list[str]) -> dict[str, str]:
+    """return a dictionary mapping each orthodb ID to its species ID"""
+    return {
+        odb_gene_id: odb_gene_id_2_species_id_from_str(odb_gene_id)
+        for odb_gene_id in odb_gene_ids
+    }
+
+
+def uniprotid_list_2_odb_gene_id_refs_dict(
+    uniprotids: list[str], db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
+) -> dict[str, list[str]]:
+    """return a dictionary mapping each uniprot ID to its odb_gene_ids in the gene_refs table
+
+    uniprot IDs that are not found are left out of the dictionary
+    """
+    rows = _bulk_select(
+        db_path,
+        UNIPROTID_LIST_2_ODB_GENE_ID_REFS_SQL,
+        uniprotids,
+    )
+    id_map = {}
+    for uniprotid, odb_gene_id in rows:
+        id_map.setdefault(uniprotid, []).append(odb_gene_id)
+    return id_map
+
+
+def uniprotid_list_2_odb_gene_id_xrefs_dict(
+    uniprotids: list[str], db_path: str | Path = env.orthoDB_files.gene_xrefs_sqlite
+) -> dict[str, list[str]]:
+    """return a dictionary mapping each uniprot ID to its odb_gene_ids in the gene_xrefs table
+
+    uniprot IDs that are not found are left out of the dictionary
+    """
+    rows = _bulk_select(
+        db_path,
+        UNIPROTID_LIST_2_ODB_GENE_ID_XREFS_SQL,
+        uniprotids,
+    )
+    id_map = {}
+    for uniprotid, odb_gene_id, db_name in rows:
+        if db_name == "UniProt":
+            id_map.setdefault(uniprotid, []).append(odb_gene_id)
+    return id_map
+
+
+def odb_gene_id_list_2_uniprotid_dict(
+    odb_gene_ids: list[str], db_path: str | Path = env.orthoDB_files.gene_refs_sqlite
+) -> dict[str, str]:
+    """return a dictionary mapping each orthodb ID to its uniprot ID
+
+    orthodb IDs without a uniprot ID are mapped to an empty string, like in `odb_gene_id_2_uniprotid`
+    """
+    rows = _bulk_select(
+        db_path,
+        ODB_GENE_ID_LIST_2_UNIPROTID_SQL,
+        odb_gene_ids,
+    )
+    id_map = {odb_gene_id: "" for odb_gene_id in odb_gene_ids}
+    for odb_gene_id, uniprotid in rows:
+        id_map[odb_gene_id] = uniprotid
+    return id_map
+
+
+def odb_gene_id_list_2_ogid_list_dict(
+    odb_gene_ids: list[str], db_path: str | Path = env.orthoDB_files.OG2genes_sqlite
+) -> dict[str, list[str]]:
+    """return a dictionary mapping each orthodb ID to the list of OGs it belongs to
+
+    orthodb IDs that don't belong to any OG are mapped to an empty list
+    """
+    og_index = _get_og_membership_index(db_path)
+    if og_index is not None:
+        return {
+            odb_gene_id: og_index.odb_gene_id_2_ogid_list(odb_gene_id)
+            for odb_gene_id in odb_gene_ids
+        }
+    rows = _bulk_select(
+        db_path,
+        ODB_GENE_ID_LIST_2_OGID_LIST_SQL,
+        odb_gene_ids,
+    )
+    og_map = {odb_gene_id: [] for odb_gene_id in odb_gene_ids}
+    for odb_gene_id, og_id in rows:
+        if og_id not in og_map[odb_gene_id]:
+            og_map[odb_gene_id].append(og_id)
+    return og_map
+
+
+def ogid_list_2_odb_gene_id_list_dict(
+    ogids: list[str], db_path: str | Path = env.orthoDB_files.OG2genes_sqlite
+) -> dict[str, list[str]]:
+    """return a dictionary mapping each OG id to the list of its member orthodb IDs"""
+    og_index = _get_og_membership_index(db_path)
+    if og_index is not None:
+        return {ogid: og_index.ogid_2_odb_gene_id_list(ogid) for ogid in ogids}
+    rows = _bulk_select(
+        db_path,
+        OGID_LIST_2_ODB_GENE_ID_LIST_SQL,
+        ogids,
+    )
+    member_map = {ogid: [] for ogid in ogids}
+    for ogid, odb_gene_id in rows:
+        member_map[ogid].append(odb_gene_id)
+    return member_map
+
+
+def ogid_list_2_ogid_info_dict(
+    ogids: list[str], db_path: str | Path = env.orthoDB_files.ogs_sqlite
+) -> dict[str, tuple[str, str]]:
+    """return a dictionary mapping each OG id to its (level NCBI tax id, OG name)
+
+    OG ids that are not found are left out of the dictionary
+    """
+    rows = _bulk_select(
+        db_path,
+        OGID_LIST_2_OGID_INFO_SQL,
+        ogids,
+    )
+    return {ogid: (level_tax_id, og_name) for ogid, level_tax_id, og_name in rows}
+
+
+def odb_gene_id_list_2_seq_length_dict(
+    odb_gene_ids: list[str], db_path: str | Path = env.orthoDB_files.seq_info_sqlite
+) -> dict[str, int]:
+    """return a dictionary mapping each orthodb ID to the length of its sequence
+
+    orthodb IDs that are not in the fasta file (e.g. genes without an OG) are
+    left out of the dictionary
+    """
+    rows = _bulk_select(
+        db_path,
+        ODB_GENE_ID_LIST_2_SEQ_LENGTH_SQL,
+        odb_gene_ids,
+    )
+    return {odb_gene_id: seq_length for odb_gene_id, seq_length in rows}
@@ -0,0 +1,172 @@
+"""binary cache of the small orthoDB reference tables (species, levels, level2species)
+
+Parsing the tab separated files with pandas is a noticeable part of the startup
+of every process that uses them. Each table is compiled once into a `.npz` file
+that holds one numpy array per column, so loading it is just reading the arrays
+back. Nothing is pickled. A text column is stored as a single utf-8 blob of its
+values joined by newlines (which can't appear in a field of a tab separated
+line), and is split back into strings in one call when it is loaded.
+
+The cache records the size, modification time and sha256 hash of the source
+file. The cache is used as long as the size and modification time match. If they
+don't, the hash is compared: an unchanged file (e.g. one that was copied or
+touched) just gets its stamp updated, and a changed file is parsed again and
+the cache is rebuilt.
+
+If the cache can't be written (e.g. the data directory is read-only), the table
+is still returned, it is just parsed every time.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# bump this if the layout of the cache files changes
+CACHE_VERSION = 1
+_NULL_MASK_PREFIX = "__null__"
+_TEXT_PREFIX = "__text__"
+_TEXT_SEPARATOR = "\n"
+_STAMP_KEYS = ["__cache_version__", "__source_size__", "__source_mtime_ns__", "__source_sha256__"]
+
+
+def _file_sha256(file_path: Path, block_size: int = 2**20) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def _source_stamp(source_file: Path, sha256: str) -> dict[str, np.ndarray]:
+    stat = source_file.stat()
+    return {
+        "__cache_version__": np.array(CACHE_VERSION, dtype=np.int64),
+        "__source_size__": np.array(stat.st_size, dtype=np.int64),
+        "__source_mtime_ns__": np.array(stat.st_mtime_ns, dtype=np.int64),
+        "__source_sha256__": np.array(sha256),
+    }
+
+
+def _df_2_arrays(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    arrays = {"__n_rows__": np.array(len(df), dtype=np.int64)}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            null_mask = values.isna().to_numpy()
+            if null_mask.any():
+                arrays[f"{_NULL_MASK_PREFIX}{column}"] = null_mask
+                values = values.where(~null_mask, "")
+            arrays[f"{_TEXT_PREFIX}{column}"] = np.frombuffer(
+                _TEXT_SEPARATOR.join(values.tolist()).encode(), dtype=np.uint8
+            )
+        else:
+            arrays[column] = values.to_numpy()
+    return arrays
+
+
+def _contains_separator(df: pd.DataFrame) -> bool:
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            if values.str.contains(_TEXT_SEPARATOR, regex=False).any():
+                return True
+    return False
+
+
+def _arrays_2_df(arrays: dict[str, np.ndarray], names: list[str], n_rows: int) -> pd.DataFrame:
+    columns = {}
+    for column in names:
+        if column in arrays:
+            columns[column] = arrays[column]
+            continue
+        values = np.empty(n_rows, dtype=object)
+        if n_rows > 0:
+            values[:] = arrays[f"{_TEXT_PREFIX}{column}"].tobytes().decode().split(_TEXT_SEPARATOR)
+        null_mask_key = f"{_NULL_MASK_PREFIX}{column}"
+        if null_mask_key in arrays:
+            values[arrays[null_mask_key]] = np.nan
+        columns[column] = values
+    return pd.DataFrame(columns, columns=names)
+
+
+def _has_columns(arrays: dict[str, np.ndarray], names: list[str]) -> bool:
+    return all(key in arrays for key in _STAMP_KEYS + ["__n_rows__"]) and all(
+        column in arrays or f"{_TEXT_PREFIX}{column}" in arrays for column in names
+    )
+
+
+def _write_cache(cache_file: Path, arrays: dict[str, np.ndarray]):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # np.savez adds ".npz" to names that don't end with it
+    temp_file = cache_file.with_name(f"{cache_file.stem}.tmp{os.getpid()}.npz")
+    np.savez(temp_file, **arrays)
+    os.replace(temp_file, cache_file)
+
+
+def _read_cache(cache_file: Path) -> dict[str, np.ndarray] | None:
+    try:
+        with np.load(cache_file, allow_pickle=False) as npz:
+            return {key: npz[key] for key in npz.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_tsv_cached(
+    tsv_file: str | Path, names: list[str], cache_file: str | Path, **read_csv_kwargs
+) -> pd.DataFrame:
+    """read a headerless tab separated file into a dataframe, using a binary cache
+
+    Parameters
+    ----------
+    tsv_file : str | Path
+        the tab separated file to read
+    names : list[str]
+        column names of the file
+    cache_file : str | Path
+        the `.npz` cache file. It is created or rebuilt if it is missing or out of date
+    **read_csv_kwargs
+        additional arguments passed to `pd.read_csv` when the file is parsed
+
+    Returns
+    -------
+    pd.DataFrame
+        the same dataframe that `pd.read_csv(tsv_file, sep="\\t", header=None, names=names)` returns
+    """
+    tsv_file = Path(tsv_file)
+    cache_file = Path(cache_file)
+    stat = tsv_file.stat()
+    arrays = _read_cache(cache_file) if cache_file.exists() else None
+    if arrays is not None and (
+        not _has_columns(arrays, names)
+        or int(arrays["__cache_version__"]) != CACHE_VERSION
+    ):
+        arrays = None
+    if arrays is not None and (
+        int(arrays["__source_size__"]) != stat.st_size
+        or int(arrays["__source_mtime_ns__"]) != stat.st_mtime_ns
+    ):
+        sha256 = _file_sha256(tsv_file)
+        if str(arrays["__source_sha256__"]) == sha256:
+            arrays.update(_source_stamp(tsv_file, sha256))
+            try:
+                _write_cache(cache_file, arrays)
+            except OSError:
+                pass
+        else:
+            arrays = None
+    if arrays is not None:
+        return _arrays_2_df(arrays, names, int(arrays["__n_rows__"]))
+
+    sha256 = _file_sha256(tsv_file)
+    df = pd.read_csv(tsv_file, sep="\t", header=None, names=names, **read_csv_kwargs)
+    if _contains_separator(df):
+        # can't be stored as a joined blob (only possible with quoted fields)
+        return df
+    try:
+        _write_cache(cache_file, _source_stamp(tsv_file, sha256) | _df_2_arrays(df))
+    except OSError:
+        pass
+    return df
@@ -0,0 +1,187 @@
+"""cost-aware scheduling of the tasks of the batch scripts
+
+The tasks of a batch run (groups of genes that share an OG, see
+`og_selection.group_genes_by_og`) vary enormously in cost: a group with a
+Eukaryota level OG of thousands of members can take longer than hundreds of
+small groups. If the tasks are dispatched in input order, such a group that
+starts late keeps one worker busy long after the others have run out of work.
+
+Here, the cost of each task is estimated before any work starts, from the
+size of the OGs of its genes and the lengths of their member sequences (read
+from the OG membership index and the seq_info database / sequence store).
+The tasks are then dispatched largest first, one at a time
+(`imap_unordered` with chunksize 1), so that the expensive tasks start
+early and the cheap ones fill in the gaps at the end. Workers are recycled
+after `max_tasks_per_child` tasks to bound their memory growth (e.g. the
+per-process OG caches, see `og_cache`).
+
+The cost is a heuristic, only used to order the tasks:
+- `alfpy_google_distance`: the words of every member are counted, so the
+  cost of a (gene, level) is the total length of the OG members
+- `pairwise` and `msa_by_organism`: the query is aligned to the members, so the
+  total length of the members times the length of the query
+- `msa`: the whole OG is aligned once for all of the queries of a group that
+  select it, so the total length of the members times the number of members,
+  counted once per OG and level
+"""
+
+import multiprocessing
+import os
+import time
+from typing import Callable
+
+import local_orthoDB_group_pipeline.og_selection as og_selection
+import local_orthoDB_group_pipeline.sql_queries as sql_queries
+import local_orthoDB_group_pipeline.uniprotid_search as uniprotid_search
+
+DEFAULT_MAX_TASKS_PER_CHILD = 100
+
+
+def _og_sizes(ogids: list[str]) -> dict[str, tuple[int, int]]:
+    """the number of members and the total length of their sequences of each OG"""
+    og_members = sql_queries.ogid_list_2_odb_gene_id_list_dict(ogids)
+    seq_lengths = uniprotid_search.get_sequence_lengths(
+        list({odb_gene_id for members in og_members.values() for odb_gene_id in members})
+    )
+    return {
+        ogid: (len(members), sum(seq_lengths.get(odb_gene_id, 0) for odb_gene_id in members))
+        for ogid, members in og_members.items()
+    }
+
+
+def estimate_task_costs(
+    tasks: list[dict[str, list[str]]],
+    ldo_selection_method: str = "alfpy_google_distance",
+    odb_gene_id_map: dict[str, str] | None = None,
+) -> list[float]:
+    """estimate the relative cost of each task of a batch run (see the module docstring)
+
+    Parameters
+    ----------
+    tasks : list[dict[str, list[str]]]
+        the genes of each task and the levels to run each gene at
+    ldo_selection_method : str, optional
+        the LDO selection method of the run (`config.ldo_select_params.LDO_selection_method`)
+    odb_gene_id_map : dict[str, str] | None, optional
+        the odb_gene_id of each gene, if the genes aren't odb_gene_ids (e.g.
+        uniprot ids). Genes that aren't in the map cost nothing. By default
+        None (the genes are odb_gene_ids)
+
+    Returns
+    -------
+    list[float]
+        the estimated cost of each task. (gene, level) pairs without a
+        unique OG (which fail in the pipeline) cost nothing
+    """
+    if odb_gene_id_map is None:
+        odb_gene_id_map = {gene_id: gene_id for task in tasks for gene_id in task}
+    odb_gene_ids = list(
+        dict.fromkeys(odb_gene_id_map[gene_id] for task in tasks for gene_id in task if gene_id in odb_gene_id_map)
+    )
+    og_levels = list(dict.fromkeys(og_level for task in tasks for levels in task.values() for og_level in levels))
+    if not odb_gene_ids or not og_levels:
+        return [0.0] * len(tasks)
+    og_df = og_selection.select_OGs_by_level_names_bulk(odb_gene_ids, og_levels)
+    og_df = og_df.drop_duplicates(subset=["odb_gene_id", "level name"], keep=False)
+    gene_level_ogs = dict(zip(zip(og_df["odb_gene_id"], og_df["level name"]), og_df["OG id"]))
+    og_sizes = _og_sizes(list(og_df["OG id"].unique()))
+    query_lengths = uniprotid_search.get_sequence_lengths(odb_gene_ids)
+
+    costs = []
+    for task in tasks:
+        cost = 0.0
+        aligned_ogs = set()
+        for gene_id, levels in task.items():
+            odb_gene_id = odb_gene_id_map.get(gene_id)
+            for og_level in levels:
+                ogid = gene_level_ogs.get((odb_gene_id, og_level))
+                if ogid is None:
+                    continue
+                n_members, total_length = og_sizes[ogid]
+                if ldo_selection_method == "msa":
+                    if (og_level, ogid) not in aligned_ogs:
+                        aligned_ogs.add((og_level, ogid))
+                        cost += total_length * n_members
+                elif ldo_selection_method in ["pairwise", "msa_by_organism"]:
+                    cost += total_length * query_lengths.get(odb_gene_id, 0)
+                else:
+                    cost += total_length
+        costs.append(cost)
+    return costs
+
+
+def largest_first(costs: list[float]) -> list[int]:
+    """the indices of the tasks, from the most to the least expensive"""
+    return sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+
+
+def _timed_call(func_args: tuple[Callable, tuple]) -> tuple[int, float, float, object]:
+    func, args = func_args
+    start = time.time()
+    result = func(*args)
+    return os.getpid(), start, time.time(), result
+
+
+def run_tasks(
+    func: Callable,
+    task_args: list[tuple],
+    costs: list[float],
+    n_cores: int,
+    max_tasks_per_child: int | None = DEFAULT_MAX_TASKS_PER_CHILD,
+    multiprocess: bool = True,
+) -> list:
+    """run `func(*args)` for each of `task_args`, the most expensive first
+
+    With `multiprocess`, the tasks are dispatched one at a time to a pool of
+    `n_cores` workers that are replaced after `max_tasks_per_child` tasks.
+    The wall-clock time and the utilization of the workers are printed at
+    the end (see `format_report`).
+
+    Returns
+    -------
+    list
+        the results of the tasks, in the order they finished
+    """
+    order = largest_first(costs)
+    start = time.time()
+    if multiprocess:
+        with multiprocessing.Pool(n_cores, maxtasksperchild=max_tasks_per_child) as p:
+            timed_results = list(
+                p.imap_unordered(_timed_call, [(func, task_args[i]) for i in order], chunksize=1)
+            )
+    else:
+        n_cores = 1
+        timed_results = [_timed_call((func, task_args[i])) for i in order]
+    wall_time = time.time() - start
+    print(format_report([(pid, t0, t1) for pid, t0, t1, _ in timed_results], wall_time, n_cores))
+    return [result for _, _, _, result in timed_results]
+
+
+def format_report(task_times: list[tuple[int, float, float]], wall_time: float, n_cores: int) -> str:
+    """the wall-clock time of a run, the overall utilization of the workers
+    and one line per worker process with its tasks and busy time
+
+    Parameters
+    ----------
+    task_times : list[tuple[int, float, float]]
+        the worker process id and the start and end time of each task
+    wall_time : float
+        the wall-clock time of the run (s)
+    n_cores : int
+        the number of workers of the pool
+    """
+    worker_tasks: dict[int, list[float]] = {}
+    for pid, t0, t1 in task_times:
+        worker_tasks.setdefault(pid, []).append(t1 - t0)
+    busy_time = sum(sum(durations) for durations in worker_tasks.values())
+    utilization = busy_time / (wall_time * n_cores) if wall_time > 0 else 0.0
+    lines = [
+        f"ran {len(task_times):,} tasks largest-first on {n_cores} workers in {wall_time:,.1f} s "
+        f"(wall-clock), {utilization:.1%} worker utilization"
+    ]
+    for pid, durations in worker_tasks.items():
+        lines.append(
+            f"worker {pid}: {len(durations):,} tasks, {sum(durations):,.1f} s busy "
+            f"({sum(durations) / wall_time if wall_time > 0 else 0.0:.1%} of the wall-clock time)"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,266 @@
+"""compact taxonomy index compiled from the orthoDB level2species table
+
+Every species gets a fixed position (its index in the sorted species ids), so
+a set of species is a bitset of `n_words` uint64 words: bit `i % 64` of word
+`i // 64` is set if species `i` is in the set. The index holds:
+- `level_bitsets`: one bitset per level with the species underneath it
+- `species_level_offsets`/`species_levels`: the levels above each species
+  (root first) in CSR form, taken from the level tax id path of the species
+
+so restricting a set of genes to the species under a level, or to an
+include/exclude list of species, is a few array lookups and bitwise
+operations rather than a merge of the level2species table.
+
+Like the other indexes, every array is a `.npy` file opened with
+`mmap_mode="r"`. The index is built with
+`scripts-gen_SQLite_dbs/make_taxonomy_index.py`. If it hasn't been built,
+`_get_taxonomy_index` compiles it in memory from the (cached) level2species
+and levels tables instead.
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import local_env_variables.env_variables as env
+
+INDEX_ARRAYS = [
+    "species_ids",
+    "level_tax_ids",
+    "level_names",
+    "level_bitsets",
+    "species_level_offsets",
+    "species_levels",
+]
+
+
+def index_exists(index_dir: str | Path) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+
+def _taxonomy_arrays(level2species_df: pd.DataFrame, levels_df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """compile the index arrays from the level2species and levels tables
+
+    The level tax id path of each species runs from the root to the species
+    itself. Only the tax ids in the path that are orthoDB levels are kept.
+    """
+    levels_df = levels_df.drop_duplicates(subset="level NCBI tax id").sort_values(by="level NCBI tax id")
+    level_tax_ids = levels_df["level NCBI tax id"].to_numpy().astype(np.int64)
+    level_names = levels_df["level name"].to_numpy().astype(str)
+    species_ids = np.unique(level2species_df["species ID"].to_numpy().astype("S"))
+
+    paths = level2species_df[["species ID", "level NCBI tax id path"]].copy()
+    paths["level NCBI tax id path"] = paths["level NCBI tax id path"].str.strip("{}").str.split(",")
+    # keep the position in the path so that the levels of each species stay in root -> species order
+    paths = paths.explode("level NCBI tax id path", ignore_index=False)
+    paths = paths[paths["level NCBI tax id path"].str.strip() != ""]
+    path_species = np.searchsorted(species_ids, paths["species ID"].to_numpy().astype("S"))
+    path_tax_ids = paths["level NCBI tax id path"].to_numpy().astype(np.int64)
+    level_index = np.searchsorted(level_tax_ids, path_tax_ids)
+    is_level = level_index < len(level_tax_ids)
+    is_level[is_level] = level_tax_ids[level_index[is_level]] == path_tax_ids[is_level]
+    path_species = path_species[is_level]
+    level_index = level_index[is_level]
+    # drop repeated (species, level) pairs (a species listed more than once)
+    pair_keys = path_species.astype(np.int64) * len(level_tax_ids) + level_index
+    _, first = np.unique(pair_keys, return_index=True)
+    first = np.sort(first)
+    path_species = path_species[first]
+    level_index = level_index[first]
+
+    order = np.argsort(path_species, kind="stable")
+    species_level_offsets = np.zeros(len(species_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(path_species, minlength=len(species_ids)), out=species_level_offsets[1:])
+    n_words = (len(species_ids) + 63) // 64
+    level_bitsets = np.zeros((len(level_tax_ids), n_words), dtype=np.uint64)
+    np.bitwise_or.at(
+        level_bitsets,
+        (level_index, path_species // 64),
+        np.left_shift(np.uint64(1), (path_species % 64).astype(np.uint64)),
+    )
+    return {
+        "species_ids": species_ids,
+        "level_tax_ids": level_tax_ids,
+        "level_names": level_names,
+        "level_bitsets": level_bitsets,
+        "species_level_offsets": species_level_offsets,
+        "species_levels": level_tax_ids[level_index[order]],
+    }
+
+
+def build_taxonomy_index(level2species_tsv: str | Path, levels_tsv: str | Path, index_dir: str | Path):
+    """build the taxonomy index from the orthoDB level2species and levels files
+
+    The arrays are written to a temporary directory that is renamed to
+    `index_dir` once it is complete.
+
+    Parameters
+    ----------
+    level2species_tsv : str | Path
+        path to the orthoDB level2species file (e.g. odb11v0_level2species.tab)
+    levels_tsv : str | Path
+        path to the orthoDB levels file (e.g. odb11v0_levels.tab)
+    index_dir : str | Path
+        directory to write the index to. It is replaced if it already exists
+    """
+    index_dir = Path(index_dir)
+    start_time = time.perf_counter()
+    print(f"building taxonomy index from: {level2species_tsv} and {levels_tsv}")
+    level2species_df = pd.read_csv(level2species_tsv, sep="\t", header=None, names=env.LEVEL2SPECIES_COLUMNS)
+    levels_df = pd.read_csv(levels_tsv, sep="\t", header=None, names=env.LEVELS_COLUMNS)
+    arrays = _taxonomy_arrays(level2species_df, levels_df)
+    print(
+        f"{len(arrays['species_ids']):,} species, {len(arrays['level_tax_ids']):,} levels, "
+        f"{len(arrays['species_levels']):,} (species, level) pairs ({time.perf_counter() - start_time:,.1f} s)"
+    )
+    temp_dir = index_dir.with_name(f"{index_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    for name, array in arrays.items():
+        np.save(temp_dir / f"{name}.npy", array)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    temp_dir.rename(index_dir)
+    print(f"wrote taxonomy index to {index_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+class TaxonomyIndex:
+    """read-only view of the taxonomy index
+
+    Parameters
+    ----------
+    arrays : dict[str, np.ndarray]
+        the index arrays (see `load` and `from_tables`)
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_species = len(self.species_ids)
+        self.n_words = self.level_bitsets.shape[1]
+        self._level_names = [str(level_name) for level_name in self.level_names]
+
+    @classmethod
+    def load(cls, index_dir: str | Path):
+        """open an index built by `build_taxonomy_index`"""
+        index_dir = Path(index_dir)
+        return cls({name: np.load(index_dir / f"{name}.npy", mmap_mode="r") for name in INDEX_ARRAYS})
+
+    @classmethod
+    def from_tables(cls, level2species_df: pd.DataFrame, levels_df: pd.DataFrame):
+        """compile the index in memory from the level2species and levels dataframes"""
+        return cls(_taxonomy_arrays(level2species_df, levels_df))
+
+    def empty_mask(self) -> np.ndarray:
+        return np.zeros(self.n_words, dtype=np.uint64)
+
+    def species_indices(self, species_ids: list[str]) -> np.ndarray:
+        """return the position of each species in the bitsets, or -1 for species that are not in the index"""
+        keys = np.array(species_ids, dtype="S")
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        indices = np.searchsorted(self.species_ids, keys)
+        found = indices < self.n_species
+        found[found] = self.species_ids[indices[found]] == keys[found]
+        return np.where(found, indices, -1)
+
+    def species_mask(self, species_ids: list[str]) -> np.ndarray:
+        """return the bitset of a list of species ids (e.g. ["9606_0", "10090_0"])
+
+        Raises
+        ------
+        ValueError
+            if any of the species are not in the index
+        """
+        indices = self.species_indices(species_ids)
+        if (indices == -1).any():
+            unknown = [species_id for species_id, i in zip(species_ids, indices) if i == -1]
+            raise ValueError(f"species not found in the orthoDB level2species table: {unknown}")
+        mask = self.empty_mask()
+        np.bitwise_or.at(mask, indices // 64, np.left_shift(np.uint64(1), (indices % 64).astype(np.uint64)))
+        return mask
+
+    def _level_index(self, level_tax_id: int) -> int:
+        i = int(np.searchsorted(self.level_tax_ids, level_tax_id))
+        if i == len(self.level_tax_ids) or self.level_tax_ids[i] != level_tax_id:
+            raise ValueError(f"level tax id {level_tax_id} not found in the orthoDB levels table")
+        return i
+
+    def level_mask(self, level_tax_id: int) -> np.ndarray:
+        """return the bitset of the species under a level"""
+        return np.array(self.level_bitsets[self._level_index(level_tax_id)])
+
+    def level_name_mask(self, level_name: str) -> np.ndarray:
+        """return the bitset of the species under a level name (the union of
+        the levels with that name, if there is more than one)"""
+        level_indices = [i for i, name in enumerate(self._level_names) if name == level_name]
+        if len(level_indices) == 0:
+            raise ValueError(f"level name {level_name} not found in the orthoDB levels table")
+        return np.bitwise_or.reduce(self.level_bitsets[level_indices], axis=0)
+
+    def contains(self, mask: np.ndarray, species_indices: np.ndarray) -> np.ndarray:
+        """return whether each species (by position, see `species_indices`) is in a bitset.
+        Species that are not in the index (-1) never are"""
+        species_indices = np.asarray(species_indices, dtype=np.int64)
+        found = species_indices >= 0
+        in_mask = np.zeros(len(species_indices), dtype=bool)
+        indices = species_indices[found]
+        bits = np.right_shift(mask[indices // 64], (indices % 64).astype(np.uint64)) & np.uint64(1)
+        in_mask[found] = bits.astype(bool)
+        return in_mask
+
+    def mask_2_species_ids(self, mask: np.ndarray) -> list[str]:
+        """return the species ids in a bitset (sorted)"""
+        bits = np.unpackbits(np.asarray(mask, dtype="<u8").view(np.uint8), bitorder="little")
+        return self.species_ids[np.flatnonzero(bits[: self.n_species])].astype(str).tolist()
+
+    def get_species_levels(self, species_id: str) -> list[tuple[int, str]]:
+        """return (level tax id, level name) for every level that contains a species, root first"""
+        i = int(self.species_indices([species_id])[0])
+        if i == -1:
+            return []
+        level_tax_ids = self.species_levels[self.species_level_offsets[i] : self.species_level_offsets[i + 1]]
+        level_indices = np.searchsorted(self.level_tax_ids, level_tax_ids)
+        return [
+            (int(level_tax_id), self._level_names[level_index])
+            for level_tax_id, level_index in zip(level_tax_ids, level_indices)
+        ]
+
+    def levels_containing(self, species_ids: list[str]) -> list[int]:
+        """return the tax ids of the levels that contain all of the species (sorted)"""
+        mask = self.species_mask(species_ids)
+        covered = (self.level_bitsets & mask) == mask
+        return self.level_tax_ids[covered.all(axis=1)].tolist()
+
+
+_TAXONOMY_INDEX: TaxonomyIndex | None = None
+
+
+def _get_taxonomy_index() -> TaxonomyIndex:
+    """return the taxonomy index. If it hasn't been built, it is compiled from
+    the level2species and levels tables"""
+    global _TAXONOMY_INDEX
+    if _TAXONOMY_INDEX is None:
+        if index_exists(env.orthoDB_files.taxonomy_index_dir):
+            _TAXONOMY_INDEX = TaxonomyIndex.load(env.orthoDB_files.taxonomy_index_dir)
+        else:
+            odb_database = env.get_orthoDB_database()
+            _TAXONOMY_INDEX = TaxonomyIndex.from_tables(
+                odb_database.data_level2species_df, odb_database.data_levels_df
+            )
+    return _TAXONOMY_INDEX
+
+
+def level_name_2_species_ids(level_name: str) -> list[str]:
+    """return the species ids under a level name (e.g. "Mammalia")"""
+    taxonomy = _get_taxonomy_index()
+    return taxonomy.mask_2_species_ids(taxonomy.level_name_mask(level_name))
+
+
+def species_id_2_levels(species_id: str) -> list[tuple[int, str]]:
+    """return (level tax id, level name) for every level that contains a species (e.g. "9606_0"), root first"""
+    return _get_taxonomy_index().get_species_levels(species_id)
@@ -0,0 +1,182 @@
+"""machine-wide budget of threads for the external tools (mafft and cd-hit)
+
+In a batch run, every pool worker runs mafft with `--thread
+LDO_mafft_threads`/`n_align_threads` (default 8), so `cpu_count() - 2` workers
+can start hundreds of runnable threads and thrash the machine. The batch
+scripts set up a budget of threads (by default one per CPU) that is shared by
+all of their workers (see `shared_budget`), and every external tool
+invocation takes its threads from the budget (see `threads`).
+
+The budget is a directory of slot files, one per thread. A process holds a
+thread while it holds an exclusive lock (`flock`) on a slot file, so the
+number of threads that are granted at once never exceeds the budget, and the
+threads of a process that dies are returned by the kernel. A request is
+granted as many of the free slots as it asks for (sized to the number of
+sequences, see `wanted_threads`), but at least one, so a tool gets fewer
+threads when the machine is busy instead of waiting for the full count.
+
+The worker processes find the budget through the `ODB_PIPELINE_THREAD_BUDGET`
+environment variable, so it works with both forked and spawned workers. If
+there is no budget (e.g. a single gene run), the requested thread counts are
+used as is.
+
+Optionally, the process is pinned to the CPUs of its slots (one CPU per slot)
+while the threads are held, so that the external tool (which inherits the
+CPU affinity) runs on its own CPUs. Pinning is only available on Linux.
+"""
+
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+ENV_VARIABLE = "ODB_PIPELINE_THREAD_BUDGET"
+# mafft and cd-hit gain little from more than one thread per this many sequences
+SEQUENCES_PER_THREAD = 50
+# threads requested for cd-hit (which has no thread parameter in the config)
+CD_HIT_THREADS = 4
+
+
+def wanted_threads(requested: int, n_sequences: int | None = None) -> int:
+    """the number of threads to ask the budget for: `requested`, reduced to
+    one thread per `SEQUENCES_PER_THREAD` sequences for small groups"""
+    if n_sequences is None:
+        return max(requested, 1)
+    return max(min(requested, -(-n_sequences // SEQUENCES_PER_THREAD)), 1)
+
+
+def _available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadBudget:
+    """a budget of `n_threads` threads in `budget_dir`, shared by the processes that open it
+
+    Parameters
+    ----------
+    budget_dir : str | Path
+        the directory of the slot files. The missing slot files are created
+    n_threads : int
+        the number of threads in the budget
+    pin : bool, optional
+        pin the process to the CPUs of its slots while it holds them, by default False
+    """
+
+    def __init__(self, budget_dir: str | Path, n_threads: int, pin: bool = False):
+        self.budget_dir = Path(budget_dir)
+        self.n_threads = max(int(n_threads), 1)
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.budget_dir.mkdir(parents=True, exist_ok=True)
+        for slot in range(self.n_threads):
+            self._slot_file(slot).touch(exist_ok=True)
+        self._cpus = _available_cpus()
+
+    def _slot_file(self, slot: int) -> Path:
+        return self.budget_dir / f"slot_{slot}"
+
+    def to_env(self) -> str:
+        return f"{self.n_threads}:{int(self.pin)}:{self.budget_dir}"
+
+    @classmethod
+    def from_env(cls, value: str) -> "ThreadBudget":
+        n_threads, pin, budget_dir = value.split(":", 2)
+        return cls(budget_dir, int(n_threads), pin=bool(int(pin)))
+
+    @contextmanager
+    def acquire(self, n_wanted: int):
+        """hold up to `n_wanted` free threads of the budget (at least one,
+        waiting for one if all of them are taken). Yields the number of threads granted"""
+        n_wanted = min(max(n_wanted, 1), self.n_threads)
+        held: dict[int, int] = {}
+        # start at a different slot in each process, so that they don't all
+        # compete for the first slots
+        first = os.getpid() % self.n_threads
+        try:
+            for i in range(self.n_threads):
+                if len(held) == n_wanted:
+                    break
+                slot = (first + i) % self.n_threads
+                fd = os.open(self._slot_file(slot), os.O_RDWR)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                held[slot] = fd
+            if not held:
+                fd = os.open(self._slot_file(first), os.O_RDWR)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                held[first] = fd
+            previous_cpus = None
+            if self.pin:
+                previous_cpus = os.sched_getaffinity(0)
+                os.sched_setaffinity(0, {self._cpus[slot % len(self._cpus)] for slot in held})
+            try:
+                yield len(held)
+            finally:
+                if previous_cpus is not None:
+                    os.sched_setaffinity(0, previous_cpus)
+        finally:
+            for fd in held.values():
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+_BUDGET: ThreadBudget | None = None
+
+
+def get_budget() -> ThreadBudget | None:
+    """the thread budget of this process (see `shared_budget`), or None if there isn't one"""
+    global _BUDGET
+    value = os.environ.get(ENV_VARIABLE)
+    if value is None:
+        return None
+    if _BUDGET is None or _BUDGET.to_env() != value:
+        _BUDGET = ThreadBudget.from_env(value)
+    return _BUDGET
+
+
+@contextmanager
+def threads(requested: int, n_sequences: int | None = None):
+    """hold threads for an external tool invocation (see `wanted_threads`)
+
+    Yields the number of threads to run the tool with. Without a budget, this
+    is `requested`
+    """
+    budget = get_budget()
+    if budget is None:
+        yield requested
+        return
+    with budget.acquire(wanted_threads(requested, n_sequences)) as n_threads:
+        yield n_threads
+
+
+@contextmanager
+def shared_budget(n_threads: int | None = None, pin: bool = False):
+    """set up a thread budget for this process and the pool workers that are
+    started inside the context. It is removed at the end of the context
+
+    Parameters
+    ----------
+    n_threads : int | None, optional
+        the number of threads in the budget, by default None (the number of CPUs)
+    pin : bool, optional
+        pin the external tools to the CPUs of their threads (Linux only), by default False
+    """
+    if n_threads is None:
+        n_threads = len(_available_cpus())
+    budget_dir = tempfile.mkdtemp(prefix="odb_thread_budget_")
+    previous = os.environ.get(ENV_VARIABLE)
+    os.environ[ENV_VARIABLE] = ThreadBudget(budget_dir, n_threads, pin=pin).to_env()
+    try:
+        yield get_budget()
+    finally:
+        if previous is None:
+            os.environ.pop(ENV_VARIABLE, None)
+        else:
+            os.environ[ENV_VARIABLE] = previous
+        shutil.rmtree(budget_dir, ignore_errors=True)
@@ -1,5 +1,32 @@
+from pathlib import Path
+
+import pandas as pd
+
 import local_env_variables.env_variables as env
 import local_orthoDB_group_pipeline.sql_queries as sql_queries
+from local_orthoDB_group_pipeline import xref_index
+
+
+def get_sequence_lengths(odb_gene_ids: list[str]) -> dict[str, int]:
+    """return the sequence length of each of `odb_gene_ids`, without reading the fasta file if possible
+
+    The lengths are read from the seq_info database
+    (`scripts-gen_SQLite_dbs/make_SQLite_database_seq_info.py`) if it has been
+    built, otherwise from the sequence store, and only as a last resort from
+    the fasta file. Genes that are not in the fasta file are left out.
+    """
+    if Path(env.orthoDB_files.seq_info_sqlite).exists():
+        return sql_queries.odb_gene_id_list_2_seq_length_dict(odb_gene_ids)
+    odb_database = env.get_orthoDB_database()
+    if odb_database.data_sequence_store is not None:
+        seq_store = odb_database.data_sequence_store
+        return seq_store.get_lengths([i for i in odb_gene_ids if i in seq_store])
+    data_all_seqrecords_dict = odb_database.data_all_seqrecords_dict
+    return {
+        odb_gene_id: len(data_all_seqrecords_dict[odb_gene_id].seq)
+        for odb_gene_id in odb_gene_ids
+        if odb_gene_id in data_all_seqrecords_dict
+    }
 
 
 def uniprotid_2_odb_gene_id(
@@ -28,6 +55,8 @@ def uniprotid_2_odb_gene_id(
         if duplicate_action is not "first" or "longest"
     ValueError
         if the uniprot id is not found in the database
+    ValueError
+        if `duplicate_action` is "longest" and none of the matches are in the fasta file
     """    
     if duplicate_action not in ["first", "longest"]:
         raise ValueError(
@@ -52,21 +81,305 @@ def uniprotid_2_odb_gene_id(
             query_odb_gene_id = odb_gene_ids[0]
             return query_odb_gene_id
         else:
-            data_all_seqrecords_dict = env.load_data_all_odb_seqs()
-            seq_list = []
+            seq_length_dict = get_sequence_lengths(odb_gene_ids)
             for odb_gene_id in odb_gene_ids:
-                if odb_gene_id not in data_all_seqrecords_dict:
+                if odb_gene_id not in seq_length_dict:
                     print(f"{odb_gene_id} not found in fasta file. Probably doesn't have an orthogroup. Skipping.")
-                    continue
-                seq = data_all_seqrecords_dict[odb_gene_id]
-                seq_list.append(seq)
-            sorted_seq_list = sorted(
-                seq_list, key=lambda x: len(x.seq), reverse=True
+            if len(seq_length_dict) == 0:
+                raise ValueError(
+                    f"none of the matches for Uniprot id `{uniprotid}` are in the fasta file"
+                )
+            # the first of the longest sequences, in database order
+            query_odb_gene_id = max(
+                [i for i in odb_gene_ids if i in seq_length_dict],
+                key=lambda odb_gene_id: seq_length_dict[odb_gene_id],
             )
-            query_odb_gene_id = sorted_seq_list[0].id
             print(f"choosing {query_odb_gene_id} as the longest sequence")
             return query_odb_gene_id
     else:
         query_odb_gene_id = odb_gene_ids[0]
         return query_odb_gene_id
 
+
+# reasons that an id is not mapped by `map_uniprotids_bulk` or `map_query_ids_bulk`
+UNMAPPED_MISSING_ID = "missing id"
+UNMAPPED_NOT_FOUND = "not found in gene_refs or gene_xrefs"
+UNMAPPED_NO_SEQUENCE = "none of the matching genes are in the fasta file"
+UNMAPPED_EXCLUDED_NAMESPACE = "namespace excluded from the xref index"
+
+
+def _bulk_uniprotid_matches(uniprotids: list[str]) -> tuple[dict[str, list[str]], dict[str, str]]:
+    """return the matching odb_gene_ids of each uniprot id and the table they were found in
+
+    Every id is looked up in gene_refs and the ids that aren't found there are
+    looked up in gene_xrefs, each with a single join against a temp table of the ids.
+    """
+    connection = sql_queries.open_attached_connection(
+        {
+            alias: getattr(env.orthoDB_files, db_attribute)
+            for alias, db_attribute in sql_queries.BULK_MAP_DATABASES.items()
+        }
+    )
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql_queries.BULK_MAP_CREATE_QUERY_IDS_SQL)
+        cursor.executemany(
+            sql_queries.BULK_MAP_INSERT_QUERY_IDS_SQL, [(uniprotid,) for uniprotid in uniprotids]
+        )
+        matches = {}
+        sources = {}
+        for source, query in [
+            ("gene_refs", sql_queries.BULK_MAP_REFS_SQL),
+            ("gene_xrefs", sql_queries.BULK_MAP_XREFS_SQL),
+        ]:
+            for uniprotid, odb_gene_id in cursor.execute(query):
+                matches.setdefault(uniprotid, []).append(odb_gene_id)
+                sources[uniprotid] = source
+        cursor.execute(sql_queries.BULK_MAP_DROP_QUERY_IDS_SQL)
+    finally:
+        connection.close()
+    return matches, sources
+
+
+def map_uniprotids_bulk(uniprotids: list[str], duplicate_action: str = "longest") -> pd.DataFrame:
+    """map a list of uniprot ids to odb_gene_ids in bulk
+
+    Gives the same result as calling `uniprotid_2_odb_gene_id` for each id,
+    but resolves all of the ids with set-based joins against the gene_refs
+    and gene_xrefs tables (gene_xrefs only for the ids not in gene_refs) and
+    applies the duplicate policy to all of the ids at once, with a single
+    bulk lookup of the sequence lengths.
+
+    Parameters
+    ----------
+    uniprotids : list[str]
+        uniprot ids to map. Duplicates are mapped once
+    duplicate_action : str, optional
+        What to do when multiple gene ids (orthodb ids) are found for a given uniprot id, by default "longest"
+            if "longest", return the gene id with the longest sequence
+            if "first", return the first gene id found in the database
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per unique uniprot id, in input order, with the columns:
+        uniprot_id | odb_gene_id | source | n_matches | unmapped_reason
+        `source` is the table that the id was found in. `odb_gene_id` is None
+        for ids that could not be mapped, and `unmapped_reason` says why
+
+    Raises
+    ------
+    ValueError
+        if duplicate_action is not "first" or "longest"
+    """
+    _check_duplicate_action(duplicate_action)
+    uniprotids = list(dict.fromkeys(uniprotids))
+    valid_uniprotids = [i for i in uniprotids if isinstance(i, str) and i != ""]
+    matches, sources = _bulk_uniprotid_matches(valid_uniprotids)
+    choices = _choose_odb_gene_ids(uniprotids, matches, duplicate_action)
+    records = []
+    for uniprotid in uniprotids:
+        odb_gene_id, reason = choices[uniprotid]
+        records.append(
+            (uniprotid, odb_gene_id, sources.get(uniprotid), len(matches.get(uniprotid, [])), reason)
+        )
+    return pd.DataFrame.from_records(
+        records, columns=["uniprot_id", "odb_gene_id", "source", "n_matches", "unmapped_reason"]
+    )
+
+
+def _check_duplicate_action(duplicate_action: str):
+    if duplicate_action not in ["first", "longest"]:
+        raise ValueError(
+            f"duplicate_action must be 'first' or 'longest', not {duplicate_action}"
+        )
+
+
+def _choose_odb_gene_ids(
+    query_ids: list, matches: dict[str, list[str]], duplicate_action: str
+) -> dict:
+    """apply the duplicate policy to the matching odb_gene_ids of each query id
+
+    Returns a dictionary mapping each query id to (odb_gene_id, unmapped reason),
+    where one of the two is None. The sequence lengths that the "longest"
+    policy needs are looked up once for all of the ids.
+    """
+    seq_length_dict = {}
+    if duplicate_action == "longest":
+        seq_length_dict = get_sequence_lengths(
+            list({i for odb_gene_ids in matches.values() if len(odb_gene_ids) > 1 for i in odb_gene_ids})
+        )
+    choices = {}
+    for query_id in query_ids:
+        odb_gene_ids = matches.get(query_id, [])
+        odb_gene_id, reason = None, None
+        if not isinstance(query_id, str) or query_id == "":
+            reason = UNMAPPED_MISSING_ID
+        elif len(odb_gene_ids) == 0:
+            reason = UNMAPPED_NOT_FOUND
+        elif len(odb_gene_ids) == 1 or duplicate_action == "first":
+            odb_gene_id = odb_gene_ids[0]
+        else:
+            with_sequence = [i for i in odb_gene_ids if i in seq_length_dict]
+            if len(with_sequence) == 0:
+                reason = UNMAPPED_NO_SEQUENCE
+            else:
+                # the first of the longest sequences, in database order
+                odb_gene_id = max(with_sequence, key=lambda i: seq_length_dict[i])
+        choices[query_id] = (odb_gene_id, reason)
+    return choices
+
+
+# ==============================================================================
+# // any id type
+# ==============================================================================
+_XREF_INDEX: xref_index.XrefIndex | None = None
+
+
+def _get_xref_index() -> xref_index.XrefIndex | None:
+    """return the external id index if it has been built
+    (`scripts-gen_SQLite_dbs/make_xref_index.py`), otherwise None"""
+    global _XREF_INDEX
+    if _XREF_INDEX is None:
+        if not xref_index.index_exists(env.orthoDB_files.xref_index_dir):
+            return None
+        _XREF_INDEX = xref_index.XrefIndex(env.orthoDB_files.xref_index_dir)
+    return _XREF_INDEX
+
+
+def _query_id_entries_from_sql(query_ids: list[str]) -> dict[str, list[tuple[str, str]]]:
+    """(namespace, odb_gene_id) entries of each id from the gene_refs uniprot ids
+    and the gene_xrefs table, for when the external id index hasn't been built"""
+    entries = {query_id: [] for query_id in query_ids}
+    for uniprotid, odb_gene_ids in sql_queries.uniprotid_list_2_odb_gene_id_refs_dict(query_ids).items():
+        entries[uniprotid].extend(("UniProt", odb_gene_id) for odb_gene_id in odb_gene_ids)
+    for xref_id, odb_gene_id, db_name in sql_queries._bulk_select(
+        env.orthoDB_files.gene_xrefs_sqlite,
+        sql_queries.UNIPROTID_LIST_2_ODB_GENE_ID_XREFS_SQL,
+        query_ids,
+    ):
+        if (db_name, odb_gene_id) not in entries[xref_id]:
+            entries[xref_id].append((db_name, odb_gene_id))
+    return entries
+
+
+def _excluded_namespace_ids(query_ids: list[str]) -> set[str]:
+    """the ids that are in gene_xrefs in a namespace that the external id index
+    leaves out (`xref_index.DEFAULT_EXCLUDED_NAMESPACES`, e.g. GOterm ids)"""
+    if len(query_ids) == 0 or _get_xref_index() is None:
+        return set()
+    return {
+        xref_id
+        for xref_id, _, db_name in sql_queries._bulk_select(
+            env.orthoDB_files.gene_xrefs_sqlite,
+            sql_queries.UNIPROTID_LIST_2_ODB_GENE_ID_XREFS_SQL,
+            query_ids,
+        )
+        if db_name in xref_index.DEFAULT_EXCLUDED_NAMESPACES
+    }
+
+
+def get_query_id_entries(
+    query_ids: list[str], namespaces: list[str] | None = None
+) -> dict[str, list[tuple[str, str]]]:
+    """return the (namespace, odb_gene_id) entries of each of a list of ids of any type
+
+    Uses the external id index if it has been built. Otherwise only the
+    uniprot ids of the genes table and the ids in the gene_xrefs table can be
+    resolved, with bulk queries.
+
+    Parameters
+    ----------
+    query_ids : list[str]
+        the ids to look up (e.g. uniprot ids, NCBI protein accessions, gene names)
+    namespaces : list[str] | None, optional
+        only return entries from these namespaces (e.g. ["UniProt", "NCBIproteinAcc"]), by default None (all namespaces)
+    """
+    query_ids = list(dict.fromkeys(query_ids))
+    index = _get_xref_index()
+    if index is not None:
+        return index.lookup_bulk(query_ids, namespaces)
+    entries = _query_id_entries_from_sql(query_ids)
+    if namespaces is not None:
+        entries = {
+            query_id: [entry for entry in query_entries if entry[0] in namespaces]
+            for query_id, query_entries in entries.items()
+        }
+    return entries
+
+
+def map_query_ids_bulk(
+    query_ids: list[str],
+    namespaces: list[str] | None = None,
+    duplicate_action: str = "longest",
+) -> pd.DataFrame:
+    """map a list of ids of any type (see `get_query_id_entries`) to odb_gene_ids
+
+    Parameters
+    ----------
+    query_ids : list[str]
+        the ids to map. Duplicates are mapped once
+    namespaces : list[str] | None, optional
+        only match ids in these namespaces, by default None (all namespaces)
+    duplicate_action : str, optional
+        what to do when an id matches more than one gene, "longest" or "first"
+        (see `uniprotid_2_odb_gene_id`), by default "longest"
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per unique id, in input order, with the columns:
+        query_id | odb_gene_id | namespaces | n_matches | unmapped_reason
+        `namespaces` lists the namespaces that the id matched in (";" separated).
+        `odb_gene_id` is None for ids that could not be mapped, and
+        `unmapped_reason` says why
+
+    Raises
+    ------
+    ValueError
+        if duplicate_action is not "first" or "longest"
+    """
+    _check_duplicate_action(duplicate_action)
+    query_ids = list(dict.fromkeys(query_ids))
+    entries = get_query_id_entries(
+        [i for i in query_ids if isinstance(i, str) and i != ""], namespaces
+    )
+    matches = {
+        query_id: list(dict.fromkeys(odb_gene_id for _, odb_gene_id in query_entries))
+        for query_id, query_entries in entries.items()
+    }
+    choices = _choose_odb_gene_ids(query_ids, matches, duplicate_action)
+    excluded_ids = _excluded_namespace_ids(
+        [query_id for query_id, (_, reason) in choices.items() if reason == UNMAPPED_NOT_FOUND]
+    )
+    records = []
+    for query_id in query_ids:
+        odb_gene_id, reason = choices[query_id]
+        if query_id in excluded_ids:
+            reason = UNMAPPED_EXCLUDED_NAMESPACE
+        matched_namespaces = ";".join(dict.fromkeys(ns for ns, _ in entries.get(query_id, [])))
+        records.append(
+            (query_id, odb_gene_id, matched_namespaces, len(matches.get(query_id, [])), reason)
+        )
+    return pd.DataFrame.from_records(
+        records, columns=["query_id", "odb_gene_id", "namespaces", "n_matches", "unmapped_reason"]
+    )
+
+
+def query_id_2_odb_gene_id(
+    query_id: str,
+    namespaces: list[str] | None = None,
+    duplicate_action: str = "longest",
+) -> str:
+    """map a single id of any type to an odb_gene_id (see `map_query_ids_bulk`)
+
+    Raises
+    ------
+    ValueError
+        if the id can't be mapped or duplicate_action is not "first" or "longest"
+    """
+    map_df = map_query_ids_bulk([query_id], namespaces, duplicate_action)
+    odb_gene_id, reason = map_df.loc[0, ["odb_gene_id", "unmapped_reason"]]
+    if pd.isna(odb_gene_id):
+        raise ValueError(f"id `{query_id}` could not be mapped to an odb_gene_id: {reason}")
+    return odb_gene_id
@@ -0,0 +1,317 @@
+"""shared work queue for batch runs on several machines
+
+The batch scripts (`pipeline_all_genes_in_species.py` and
+`pipeline_input_table.py`) can write their work list into a queue instead of
+running it on a local pool (`--queue <file>`). The queue is a SQLite database
+on a filesystem that every machine can reach (a local directory for a
+single machine), with one row per (gene, level) task. Any number of workers
+(`local_scripts/queue_worker.py`), on any host, then claim and run the tasks
+until the queue is empty. They all write into the same `main_output_folder`
+(and run manifest, see `run_manifest`), so the results end up in one output
+tree.
+
+- The tasks of a gene group (genes that share an OG, see
+  `og_selection.group_genes_by_og`) are claimed together, so that a worker
+  still runs OG-mates together. Groups are claimed most expensive first (see
+  `task_scheduler`).
+- A claim is a lease that expires after `lease_seconds`. While a worker runs
+  a group it renews its leases (heartbeat, see `WorkQueue.heartbeat`). The
+  tasks of a worker that dies or hangs are claimed again by another worker
+  once their lease has expired, up to `max_attempts` times.
+- Every change is made in a single `BEGIN IMMEDIATE` transaction, so two
+  workers never claim the same task. The database uses the default rollback
+  journal, which (unlike WAL) works on network filesystems.
+
+The pipeline parameters and the type of the gene ids are stored in the queue
+by the coordinator, so that all of the workers run with the same config.
+"""
+
+import contextlib
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from local_config import orthodb_pipeline_parameters
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+CREATE_TABLES_SQL = [
+    """CREATE TABLE meta (key TEXT PRIMARY KEY, value BLOB)""",
+    """CREATE TABLE tasks (
+        task_id INTEGER PRIMARY KEY,
+        group_id INTEGER NOT NULL,
+        gene TEXT NOT NULL,
+        level TEXT NOT NULL,
+        cost REAL NOT NULL,
+        status TEXT NOT NULL,
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        UNIQUE (gene, level)
+    )""",
+    """CREATE INDEX tasks_status_cost ON tasks (status, cost DESC, group_id)""",
+    """CREATE INDEX tasks_group ON tasks (group_id)""",
+]
+# the most expensive group with a task that is pending, or whose lease has expired
+CLAIMABLE_GROUP_SQL = """
+SELECT group_id FROM tasks
+WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ?
+ORDER BY cost DESC, group_id
+LIMIT 1
+"""
+
+
+def worker_id() -> str:
+    """an id for this process that is unique across hosts"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_queue(
+    queue_file: str | Path,
+    config: orthodb_pipeline_parameters.PipelineParams,
+    id_type: str,
+    gene_groups: list[dict[str, list[str]]],
+    costs: list[float],
+    overwrite: bool = False,
+) -> "WorkQueue":
+    """write the work list of a batch run into a new queue
+
+    Parameters
+    ----------
+    queue_file : str | Path
+        the queue database file, on a filesystem shared by the workers
+    config : orthodb_pipeline_parameters.PipelineParams
+        the pipeline parameters the workers will run with
+    id_type : str
+        the type of the gene ids ("odb_gene_id" or "uniprot_id")
+    gene_groups : list[dict[str, list[str]]]
+        the genes of each group and the levels to run each gene at
+    costs : list[float]
+        the estimated cost of each group (see `task_scheduler.estimate_task_costs`)
+    overwrite : bool, optional
+        replace the queue file if it exists, by default False
+
+    Raises
+    ------
+    FileExistsError
+        if the queue file exists and `overwrite` is False
+    """
+    queue_file = Path(queue_file)
+    if queue_file.exists():
+        if not overwrite:
+            raise FileExistsError(f"queue already exists: {queue_file}")
+        queue_file.unlink()
+    queue_file.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(queue_file)
+    with connection:
+        for sql in CREATE_TABLES_SQL:
+            connection.execute(sql)
+        connection.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("config", pickle.dumps(config)), ("id_type", id_type)],
+        )
+        connection.executemany(
+            "INSERT INTO tasks (group_id, gene, level, cost, status) VALUES (?, ?, ?, ?, ?)",
+            (
+                (group_id, gene_id, og_level, cost, PENDING)
+                for group_id, (gene_levels, cost) in enumerate(zip(gene_groups, costs))
+                for gene_id, og_levels in gene_levels.items()
+                for og_level in og_levels
+            ),
+        )
+    connection.close()
+    return WorkQueue(queue_file)
+
+
+class WorkQueue:
+    """a queue of (gene, level) tasks created by `create_queue`
+
+    Parameters
+    ----------
+    queue_file : str | Path
+        the queue database file
+    lease_seconds : float, optional
+        how long a claim lasts without a heartbeat, by default DEFAULT_LEASE_SECONDS
+    max_attempts : int, optional
+        the number of times a task is claimed before it's given up on, by default DEFAULT_MAX_ATTEMPTS
+    """
+
+    def __init__(
+        self,
+        queue_file: str | Path,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.queue_file = Path(queue_file)
+        if not self.queue_file.exists():
+            raise FileNotFoundError(f"queue not found: {self.queue_file}")
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """an exclusive (write) transaction on a new connection"""
+        connection = sqlite3.connect(self.queue_file, timeout=60, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def _get_meta(self, key: str):
+        with self._transaction() as connection:
+            return connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def get_config(self) -> orthodb_pipeline_parameters.PipelineParams:
+        """the pipeline parameters of the run"""
+        return pickle.loads(self._get_meta("config"))
+
+    def get_id_type(self) -> str:
+        """the type of the gene ids of the run ("odb_gene_id" or "uniprot_id")"""
+        return self._get_meta("id_type")
+
+    def claim(self, worker: str) -> dict[str, list[str]] | None:
+        """lease the claimable tasks of the most expensive group with claimable tasks
+
+        Returns
+        -------
+        dict[str, list[str]] | None
+            the claimed genes and their levels, or None if there is nothing to
+            claim right now (see `n_unfinished` to tell if the run is over)
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            # expired leases of tasks that have used up their attempts are given up on
+            connection.execute(
+                """UPDATE tasks SET status = ?, error = ?
+                WHERE status = ? AND lease_expires < ? AND attempts >= ?""",
+                (FAILED, "lease expired", LEASED, now, self.max_attempts),
+            )
+            row = connection.execute(
+                CLAIMABLE_GROUP_SQL, (PENDING, LEASED, now, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                return None
+            task_rows = connection.execute(
+                """SELECT task_id, gene, level FROM tasks
+                WHERE group_id = ? AND (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ?
+                ORDER BY task_id""",
+                (row[0], PENDING, LEASED, now, self.max_attempts),
+            ).fetchall()
+            connection.executemany(
+                """UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE task_id = ?""",
+                [(LEASED, worker, now + self.lease_seconds, task_id) for task_id, _, _ in task_rows],
+            )
+        gene_levels: dict[str, list[str]] = {}
+        for _, gene_id, og_level in task_rows:
+            gene_levels.setdefault(gene_id, []).append(og_level)
+        return gene_levels
+
+    def renew(self, worker: str):
+        """extend the leases of the tasks that `worker` holds"""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = ?",
+                (time.time() + self.lease_seconds, worker, LEASED),
+            )
+
+    @contextlib.contextmanager
+    def heartbeat(self, worker: str, interval: float | None = None):
+        """renew the leases of `worker` in a background thread while inside the context
+
+        Parameters
+        ----------
+        interval : float | None, optional
+            seconds between renewals, by default a third of the lease
+        """
+        if interval is None:
+            interval = self.lease_seconds / 3
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    self.renew(worker)
+                except sqlite3.OperationalError:
+                    # the database was busy, try again on the next beat
+                    pass
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, worker: str, records: list[dict]):
+        """mark the tasks of a finished group as done or failed
+
+        Parameters
+        ----------
+        records : list[dict]
+            the "gene", "level", "status" and "error" of each task (see
+            `run_manifest.task_records`). Tasks that are no longer leased by
+            `worker` (e.g. its lease expired and another worker claimed them)
+            are left as they are
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                """UPDATE tasks SET status = ?, error = ?, lease_expires = NULL
+                WHERE gene = ? AND level = ? AND worker = ? AND status = ?""",
+                [
+                    (
+                        DONE if record["status"] == "success" else FAILED,
+                        record.get("error"),
+                        record["gene"],
+                        record["level"],
+                        worker,
+                        LEASED,
+                    )
+                    for record in records
+                ],
+            )
+
+    def release(self, worker: str, gene_levels: dict[str, list[str]], error: str):
+        """return the claimed tasks of a group that raised an error to the
+        queue, or mark them as failed if they have used up their attempts"""
+        with self._transaction() as connection:
+            connection.executemany(
+                """UPDATE tasks SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,
+                worker = NULL, lease_expires = NULL, error = ?
+                WHERE gene = ? AND level = ? AND worker = ? AND status = ?""",
+                [
+                    (self.max_attempts, PENDING, FAILED, error, gene_id, og_level, worker, LEASED)
+                    for gene_id, og_levels in gene_levels.items()
+                    for og_level in og_levels
+                ],
+            )
+
+    def status_counts(self) -> dict[str, int]:
+        """the number of tasks with each status"""
+        with self._transaction() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {status: 0 for status in [PENDING, LEASED, DONE, FAILED]} | dict(rows)
+
+    def n_unfinished(self) -> int:
+        """the number of tasks that are pending or leased"""
+        with self._transaction() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = ? OR status = ?", (PENDING, LEASED)
+            ).fetchone()[0]
@@ -0,0 +1,524 @@
+"""memory-mapped hash index of every external id -> odb_gene_id mapping
+
+Compiles the external ids of the genes table (source ids, gene synonyms,
+UniProt, Ensembl and NCBI ids) and of the gene_xrefs table (NCBIproteinAcc,
+NCBIgid, UniProt, ...) into one index, so that an id of any type can be
+resolved to its odb_gene_ids without a SQL query per id.
+
+Layout (every array is a `.npy` file opened with `mmap_mode="r"`):
+- `key_blob`/`key_offsets`: the unique external ids, concatenated into one utf-8 blob
+- `key_hashes`: the 64-bit FNV-1a hash of each external id
+- `slots`: open addressing hash table (linear probing, at most half full)
+  mapping a hash to the index of the external id, or -1 for an empty slot
+- `entry_offsets`/`entry_namespaces`/`entry_genes`: the (namespace, odb_gene_id)
+  entries of each external id in CSR form, in the order they appear in the
+  source files (genes table first)
+- `namespaces`/`gene_ids`: the namespace names and the sorted, interned odb_gene_ids
+
+A lookup hashes the id, probes the slots until it finds the id or an empty
+slot and returns the entries of the id, so it takes O(1) array reads no matter
+how large the index is.
+
+The index is built with `scripts-gen_SQLite_dbs/make_xref_index.py`.
+"""
+
+import csv
+import itertools
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+INDEX_ARRAYS = [
+    "namespaces",
+    "gene_ids",
+    "key_blob",
+    "key_offsets",
+    "key_hashes",
+    "slots",
+    "entry_offsets",
+    "entry_namespaces",
+    "entry_genes",
+]
+GENE_REFS_COLUMNS = [
+    "odb_gene_id",
+    "species_id",
+    "source_id",
+    "synonyms",
+    "Uniprotid",
+    "Ensemble",
+    "NCBI_id",
+    "description",
+]
+# the namespace of the id columns of the genes table. The synonyms and Ensembl
+# columns can hold several ids separated by ";"
+GENE_REFS_NAMESPACES = {
+    "source_id": "source_id",
+    "synonyms": "synonym",
+    "Uniprotid": "UniProt",
+    "Ensemble": "Ensembl",
+    "NCBI_id": "NCBI_id",
+}
+GENE_REFS_MULTI_ID_COLUMNS = ["synonyms", "Ensemble"]
+# gene_xrefs namespaces that annotate genes (each term maps to many genes)
+# rather than identify them. They are left out of the index by default
+DEFAULT_EXCLUDED_NAMESPACES = ("GOterm", "InterPro")
+
+_FNV_OFFSET = 0xCBF29CE484222325
+_FNV_PRIME = 0x100000001B3
+_MASK_64 = 2**64 - 1
+
+
+def index_exists(index_dir: str | Path) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / f"{name}.npy").exists() for name in INDEX_ARRAYS)
+
+
+def fnv1a_64(key: bytes) -> int:
+    """64-bit FNV-1a hash of a byte string"""
+    h = _FNV_OFFSET
+    for byte in key:
+        h = ((h ^ byte) * _FNV_PRIME) & _MASK_64
+    return h
+
+
+def fnv1a_64_array(keys: np.ndarray) -> np.ndarray:
+    """64-bit FNV-1a hash of each byte string in a numpy bytes ("S") array
+
+    Gives the same hashes as `fnv1a_64`
+    """
+    keys = np.asarray(keys, dtype="S")
+    hashes = np.full(len(keys), _FNV_OFFSET, dtype=np.uint64)
+    if len(keys) == 0 or keys.dtype.itemsize == 0:
+        return hashes
+    lengths = np.char.str_len(keys)
+    chars = keys.view(np.uint8).reshape(len(keys), keys.dtype.itemsize)
+    prime = np.uint64(_FNV_PRIME)
+    for i in range(keys.dtype.itemsize):
+        active = lengths > i
+        if not active.any():
+            break
+        # uint64 array multiplication wraps around, like the `& _MASK_64` in `fnv1a_64`
+        hashes[active] = (hashes[active] ^ chars[active, i]) * prime
+    return hashes
+
+
+def _read_gene_refs_entries(gene_refs_tsv: str | Path, chunksize: int):
+    """yield (external id, namespace, odb_gene_id) arrays for each chunk of the genes table"""
+    for chunk in pd.read_csv(
+        gene_refs_tsv,
+        sep="\t",
+        header=None,
+        names=GENE_REFS_COLUMNS,
+        dtype=str,
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunksize,
+    ):
+        for column, namespace in GENE_REFS_NAMESPACES.items():
+            ids = chunk[["odb_gene_id", column]]
+            if column in GENE_REFS_MULTI_ID_COLUMNS:
+                ids = ids.assign(**{column: ids[column].str.split(";")}).explode(column)
+                ids[column] = ids[column].str.strip()
+            ids = ids[ids[column] != ""]
+            yield ids[column].to_numpy(), namespace, ids["odb_gene_id"].to_numpy()
+
+
+def _read_gene_xrefs_entries(gene_xrefs_tsv: str | Path, chunksize: int, excluded_namespaces):
+    """yield (external id, namespace, odb_gene_id) arrays for each namespace of each chunk of the gene_xrefs table"""
+    for chunk in pd.read_csv(
+        gene_xrefs_tsv,
+        sep="\t",
+        header=None,
+        names=["odb_gene_id", "xref_id", "DB_name"],
+        dtype=str,
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunksize,
+    ):
+        chunk = chunk[(chunk["xref_id"] != "") & ~chunk["DB_name"].isin(excluded_namespaces)]
+        for namespace, ids in chunk.groupby("DB_name", sort=False):
+            yield ids["xref_id"].to_numpy(), namespace, ids["odb_gene_id"].to_numpy()
+
+
+def _read_entries(gene_refs_tsv: str | Path, gene_xrefs_tsv: str | Path, chunksize: int, excluded_namespaces):
+    """yield (external id, namespace, odb_gene_id) arrays of the genes table, then of the gene_xrefs table"""
+    return itertools.chain(
+        _read_gene_refs_entries(gene_refs_tsv, chunksize),
+        _read_gene_xrefs_entries(gene_xrefs_tsv, chunksize, excluded_namespaces),
+    )
+
+
+def _key_buckets(external_ids: np.ndarray, n_partitions: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """the utf-8 encoded external ids (as bytes objects), their partition and their length in bytes"""
+    keys = pd.Series(external_ids, dtype=object).str.encode("utf-8")
+    lengths = keys.str.len().to_numpy(dtype=np.int64)
+    partitions = (pd.util.hash_array(np.asarray(external_ids, dtype=object)) % np.uint64(n_partitions)).astype(np.int64)
+    return keys.to_numpy(), partitions, lengths
+
+
+def _compact_partition(
+    spill_keys: np.ndarray,
+    spill_namespaces: np.ndarray,
+    spill_genes: np.ndarray,
+    key_lengths: np.ndarray,
+    entry_starts: np.ndarray,
+    byte_starts: np.ndarray,
+) -> dict[str, np.ndarray]:
+    """the unique external ids of one partition and their unique entries
+
+    The entries of a partition are spilled in one bucket per key length (in
+    file order within a bucket), so the keys of a bucket are a fixed-width
+    block of bytes that `np.unique` can sort without any padding.
+    `key_lengths`, `entry_starts` (with the end of the last bucket) and
+    `byte_starts` are those of the buckets of the partition.
+    """
+    key_blobs = [np.zeros(0, dtype=np.uint8)]
+    unique_key_lengths = [np.zeros(0, dtype=np.int64)]
+    key_hashes = [np.zeros(0, dtype=np.uint64)]
+    key_indices = [np.zeros(0, dtype=np.int64)]
+    n_keys = 0
+    for length, entry_start, entry_end, byte_start in zip(
+        key_lengths.tolist(), entry_starts[:-1].tolist(), entry_starts[1:].tolist(), byte_starts.tolist()
+    ):
+        if entry_end == entry_start:
+            continue
+        keys = np.array(spill_keys[byte_start : byte_start + (entry_end - entry_start) * length]).view(f"S{length}")
+        unique_keys, key_index = np.unique(keys, return_inverse=True)
+        key_blobs.append(unique_keys.view(np.uint8))
+        unique_key_lengths.append(np.full(len(unique_keys), length, dtype=np.int64))
+        key_hashes.append(fnv1a_64_array(unique_keys))
+        key_indices.append(key_index.reshape(-1) + n_keys)
+        n_keys += len(unique_keys)
+    key_index = np.concatenate(key_indices)
+    entry_namespaces = np.array(spill_namespaces[entry_starts[0] : entry_starts[-1]])
+    entry_genes = np.array(spill_genes[entry_starts[0] : entry_starts[-1]])
+    # drop duplicate entries, keeping the first occurrence in file order
+    order = np.lexsort((entry_genes, entry_namespaces, key_index))
+    sorted_keys, sorted_namespaces, sorted_genes = key_index[order], entry_namespaces[order], entry_genes[order]
+    duplicated = np.zeros(len(order), dtype=bool)
+    duplicated[1:] = (
+        (sorted_keys[1:] == sorted_keys[:-1])
+        & (sorted_namespaces[1:] == sorted_namespaces[:-1])
+        & (sorted_genes[1:] == sorted_genes[:-1])
+    )
+    first_occurrence = np.sort(order[~duplicated])
+    key_index = key_index[first_occurrence]
+    order = np.argsort(key_index, kind="stable")
+    return {
+        "key_blob": np.concatenate(key_blobs),
+        "key_lengths": np.concatenate(unique_key_lengths),
+        "key_hashes": np.concatenate(key_hashes),
+        "entry_counts": np.bincount(key_index, minlength=n_keys).astype(np.int64),
+        "entry_namespaces": entry_namespaces[first_occurrence][order],
+        "entry_genes": entry_genes[first_occurrence][order],
+    }
+
+
+def _n_slots(n_keys: int) -> int:
+    """the size of the hash table: the smallest power of 2 that keeps it at most half full"""
+    n_slots = 1
+    while n_slots < 2 * max(n_keys, 1):
+        n_slots *= 2
+    return n_slots
+
+
+def _insert_keys(slots: np.ndarray, key_hashes: np.ndarray, first_key_index: int):
+    """insert keys into an open addressing table with linear probing
+
+    The keys are inserted in rounds. In each round, every key that hasn't been
+    placed tries its current slot. If the slot is empty the lowest numbered key
+    trying it takes it, and every other key moves on to the next slot. The keys
+    are numbered from `first_key_index`, so the table can be filled one part
+    of the keys at a time.
+    """
+    n_slots = len(slots)
+    pending = np.arange(len(key_hashes), dtype=np.int64)
+    positions = (key_hashes & np.uint64(n_slots - 1)).astype(np.int64)
+    while len(pending) > 0:
+        empty = np.flatnonzero(slots[positions] == -1)
+        _, first = np.unique(positions[empty], return_index=True)
+        winners = empty[first]
+        slots[positions[winners]] = pending[winners] + first_key_index
+        placed = np.zeros(len(pending), dtype=bool)
+        placed[winners] = True
+        pending = pending[~placed]
+        positions = (positions[~placed] + 1) & (n_slots - 1)
+
+
+def build_xref_index(
+    gene_refs_tsv: str | Path,
+    gene_xrefs_tsv: str | Path,
+    index_dir: str | Path,
+    excluded_namespaces: tuple[str, ...] = DEFAULT_EXCLUDED_NAMESPACES,
+    chunksize: int = 10_000_000,
+    n_partitions: int = 64,
+):
+    """build the external id index from the orthoDB genes and gene_xrefs files
+
+    The source files are read twice. The first pass counts the entries of
+    each bucket (the partition of the hash of the external id and its length
+    in bytes) and collects the odb_gene_ids. The second pass writes every
+    entry straight into its place in memory-mapped spill arrays, grouped by
+    bucket. The partitions are then compacted (unique ids and entries) one at
+    a time and copied into the memory-mapped index arrays, so only the
+    odb_gene_ids and one partition have to fit in memory. The arrays are
+    written to a temporary directory that is renamed to `index_dir` once it
+    is complete.
+
+    Parameters
+    ----------
+    gene_refs_tsv : str | Path
+        path to the orthoDB genes file (e.g. odb11v0_genes.tab)
+    gene_xrefs_tsv : str | Path
+        path to the orthoDB gene_xrefs file (e.g. odb11v0_gene_xrefs.tab)
+    index_dir : str | Path
+        directory to write the index to. It is replaced if it already exists
+    excluded_namespaces : tuple[str, ...], optional
+        gene_xrefs namespaces to leave out, by default ("GOterm", "InterPro")
+    chunksize : int, optional
+        number of lines read at a time, by default 10_000_000
+    n_partitions : int, optional
+        number of partitions the external ids are compacted in, by default 64
+    """
+    index_dir = Path(index_dir)
+    start_time = time.perf_counter()
+    print(f"building external id index from: {gene_refs_tsv} and {gene_xrefs_tsv}")
+    namespaces = []
+    gene_ids = np.zeros(0, dtype="S1")
+    # the number of entries of each (partition, key length) bucket
+    bucket_counts = np.zeros((n_partitions, 1), dtype=np.int64)
+    for external_ids, namespace, odb_gene_ids in _read_entries(
+        gene_refs_tsv, gene_xrefs_tsv, chunksize, excluded_namespaces
+    ):
+        if namespace not in namespaces:
+            namespaces.append(namespace)
+        if len(external_ids) == 0:
+            continue
+        _, partitions, lengths = _key_buckets(external_ids, n_partitions)
+        width = max(bucket_counts.shape[1], int(lengths.max()) + 1)
+        bucket_counts = np.pad(bucket_counts, ((0, 0), (0, width - bucket_counts.shape[1])))
+        bucket_counts += np.bincount(partitions * width + lengths, minlength=n_partitions * width).reshape(
+            n_partitions, width
+        )
+        gene_ids = np.union1d(gene_ids, odb_gene_ids.astype("S"))
+    width = bucket_counts.shape[1]
+    bucket_lengths = np.tile(np.arange(width, dtype=np.int64), n_partitions)
+    entry_starts = np.zeros(bucket_counts.size + 1, dtype=np.int64)
+    np.cumsum(bucket_counts.ravel(), out=entry_starts[1:])
+    byte_starts = np.zeros(bucket_counts.size + 1, dtype=np.int64)
+    np.cumsum(bucket_counts.ravel() * bucket_lengths, out=byte_starts[1:])
+    gene_dtype = np.int32 if len(gene_ids) < 2**31 else np.int64
+    print(
+        f"{entry_starts[-1]:,} (id, namespace, gene) entries of {len(gene_ids):,} genes "
+        f"in {len(namespaces)} namespaces ({time.perf_counter() - start_time:,.1f} s)"
+    )
+
+    temp_dir = index_dir.with_name(f"{index_dir.name}.tmp{os.getpid()}")
+    temp_dir.mkdir(parents=True, exist_ok=False)
+    spill_dir = temp_dir / "spill"
+    spill_dir.mkdir()
+    spill_keys = np.lib.format.open_memmap(
+        spill_dir / "keys.npy", mode="w+", dtype=np.uint8, shape=(int(byte_starts[-1]),)
+    )
+    spill_namespaces = np.lib.format.open_memmap(
+        spill_dir / "namespaces.npy", mode="w+", dtype=np.uint16, shape=(int(entry_starts[-1]),)
+    )
+    spill_genes = np.lib.format.open_memmap(
+        spill_dir / "genes.npy", mode="w+", dtype=gene_dtype, shape=(int(entry_starts[-1]),)
+    )
+    # the next free entry of each bucket. The entries of each bucket are
+    # written in file order
+    next_entry = entry_starts[:-1].copy()
+    for external_ids, namespace, odb_gene_ids in _read_entries(
+        gene_refs_tsv, gene_xrefs_tsv, chunksize, excluded_namespaces
+    ):
+        if len(external_ids) == 0:
+            continue
+        keys, partitions, lengths = _key_buckets(external_ids, n_partitions)
+        buckets = partitions * width + lengths
+        order = np.argsort(buckets, kind="stable")
+        buckets = buckets[order]
+        unique_buckets, first, counts = np.unique(buckets, return_index=True, return_counts=True)
+        rank = np.arange(len(buckets)) - np.repeat(first, counts)
+        positions = next_entry[buckets] + rank
+        spill_namespaces[positions] = namespaces.index(namespace)
+        spill_genes[positions] = np.searchsorted(gene_ids, odb_gene_ids.astype("S")[order])
+        key_bytes = np.frombuffer(b"".join(keys[order]), dtype=np.uint8)
+        chunk_byte_starts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        np.cumsum(lengths[order], out=chunk_byte_starts[1:])
+        # the keys of a bucket have the same length, so the keys of the chunk
+        # in a bucket are one block of bytes
+        for bucket, bucket_first, count in zip(unique_buckets.tolist(), first.tolist(), counts.tolist()):
+            n_bytes = count * int(bucket_lengths[bucket])
+            source = chunk_byte_starts[bucket_first]
+            target = byte_starts[bucket] + (next_entry[bucket] - entry_starts[bucket]) * bucket_lengths[bucket]
+            spill_keys[target : target + n_bytes] = key_bytes[source : source + n_bytes]
+        next_entry[unique_buckets] += counts
+    print(f"spilled {entry_starts[-1]:,} entries ({time.perf_counter() - start_time:,.1f} s)")
+
+    partition_dir = temp_dir / "partitions"
+    partition_dir.mkdir()
+    partition_sizes = []
+    for partition in range(n_partitions):
+        buckets = slice(partition * width, (partition + 1) * width)
+        compacted = _compact_partition(
+            spill_keys,
+            spill_namespaces,
+            spill_genes,
+            bucket_lengths[buckets],
+            entry_starts[partition * width : (partition + 1) * width + 1],
+            byte_starts[buckets],
+        )
+        for name, array in compacted.items():
+            np.save(partition_dir / f"{partition}_{name}.npy", array)
+        partition_sizes.append(
+            (len(compacted["key_lengths"]), len(compacted["key_blob"]), len(compacted["entry_genes"]))
+        )
+    del spill_keys, spill_namespaces, spill_genes
+    shutil.rmtree(spill_dir)
+    n_keys, n_key_bytes, n_entries = (int(size) for size in np.sum(partition_sizes, axis=0))
+    print(f"{n_keys:,} unique ids, {n_entries:,} unique entries ({time.perf_counter() - start_time:,.1f} s)")
+
+    n_slots = _n_slots(n_keys)
+    arrays = {
+        name: np.lib.format.open_memmap(temp_dir / f"{name}.npy", mode="w+", dtype=dtype, shape=(size,))
+        for name, dtype, size in [
+            ("key_blob", np.uint8, n_key_bytes),
+            ("key_offsets", np.int64, n_keys + 1),
+            ("key_hashes", np.uint64, n_keys),
+            ("slots", np.int64, n_slots),
+            ("entry_offsets", np.int64, n_keys + 1),
+            ("entry_namespaces", np.uint16, n_entries),
+            ("entry_genes", gene_dtype, n_entries),
+        ]
+    }
+    arrays["slots"][:] = -1
+    arrays["key_offsets"][0] = 0
+    arrays["entry_offsets"][0] = 0
+    key_start, byte_start, entry_start = 0, 0, 0
+    for partition, (partition_keys, partition_bytes, partition_entries) in enumerate(partition_sizes):
+        compacted = {
+            name: np.load(partition_dir / f"{partition}_{name}.npy")
+            for name in ["key_blob", "key_lengths", "key_hashes", "entry_counts", "entry_namespaces", "entry_genes"]
+        }
+        key_end = key_start + partition_keys
+        arrays["key_blob"][byte_start : byte_start + partition_bytes] = compacted["key_blob"]
+        arrays["key_offsets"][key_start + 1 : key_end + 1] = byte_start + np.cumsum(compacted["key_lengths"])
+        arrays["key_hashes"][key_start:key_end] = compacted["key_hashes"]
+        arrays["entry_offsets"][key_start + 1 : key_end + 1] = entry_start + np.cumsum(compacted["entry_counts"])
+        arrays["entry_namespaces"][entry_start : entry_start + partition_entries] = compacted["entry_namespaces"]
+        arrays["entry_genes"][entry_start : entry_start + partition_entries] = compacted["entry_genes"]
+        _insert_keys(arrays["slots"], compacted["key_hashes"], key_start)
+        key_start, byte_start, entry_start = key_end, byte_start + partition_bytes, entry_start + partition_entries
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    shutil.rmtree(partition_dir)
+    print(f"hash table with {n_slots:,} slots ({time.perf_counter() - start_time:,.1f} s)")
+
+    np.save(temp_dir / "namespaces.npy", np.array(namespaces, dtype=str))
+    np.save(temp_dir / "gene_ids.npy", gene_ids)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    temp_dir.rename(index_dir)
+    print(f"wrote external id index to {index_dir} ({time.perf_counter() - start_time:,.1f} s)")
+
+
+class XrefIndex:
+    """read-only view of an external id index built by `build_xref_index`
+
+    Parameters
+    ----------
+    index_dir : str | Path
+        directory containing the index arrays
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(self.index_dir / f"{name}.npy", mmap_mode="r"))
+        self.namespace_list = [str(namespace) for namespace in self.namespaces]
+        self._slot_mask = len(self.slots) - 1
+
+    def _key_equals(self, key_index: int, key: bytes) -> bool:
+        start, end = self.key_offsets[key_index], self.key_offsets[key_index + 1]
+        return self.key_blob[start:end].tobytes() == key
+
+    def _find_key(self, key: bytes) -> int | None:
+        key_hash = fnv1a_64(key)
+        position = key_hash & self._slot_mask
+        while True:
+            key_index = int(self.slots[position])
+            if key_index == -1:
+                return None
+            if int(self.key_hashes[key_index]) == key_hash and self._key_equals(key_index, key):
+                return key_index
+            position = (position + 1) & self._slot_mask
+
+    def _find_keys(self, keys: list[bytes]) -> np.ndarray:
+        """vectorized `_find_key`. Returns the key index of each key, or -1"""
+        key_hashes = fnv1a_64_array(np.array(keys, dtype="S")) if keys else np.zeros(0, dtype=np.uint64)
+        key_indices = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+        positions = (key_hashes & np.uint64(self._slot_mask)).astype(np.int64)
+        while len(pending) > 0:
+            candidates = self.slots[positions]
+            hash_match = np.flatnonzero(candidates != -1)
+            hash_match = hash_match[self.key_hashes[candidates[hash_match]] == key_hashes[pending[hash_match]]]
+            found = np.zeros(len(pending), dtype=bool)
+            for i in hash_match:
+                if self._key_equals(int(candidates[i]), keys[pending[i]]):
+                    found[i] = True
+                    key_indices[pending[i]] = candidates[i]
+            done = found | (candidates == -1)
+            pending = pending[~done]
+            positions = (positions[~done] + 1) & self._slot_mask
+        return key_indices
+
+    def _entries(self, key_index: int, namespaces: set[str] | None) -> list[tuple[str, str]]:
+        start, end = self.entry_offsets[key_index], self.entry_offsets[key_index + 1]
+        entries = []
+        for namespace_code, gene_index in zip(
+            self.entry_namespaces[start:end].tolist(), self.entry_genes[start:end].tolist()
+        ):
+            namespace = self.namespace_list[namespace_code]
+            if namespaces is None or namespace in namespaces:
+                entries.append((namespace, self.gene_ids[gene_index].decode()))
+        return entries
+
+    def lookup(self, external_id: str, namespaces: list[str] | None = None) -> list[tuple[str, str]]:
+        """return the (namespace, odb_gene_id) entries of an external id
+
+        Parameters
+        ----------
+        external_id : str
+            the id to look up (e.g. "P12345", "XP_046437925.1" or "ENSG00000012345")
+        namespaces : list[str] | None, optional
+            only return the entries of these namespaces (e.g. ["UniProt"]), by default None (all namespaces)
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            the entries in the order they appear in the source files. Empty if
+            the id is not in the index
+        """
+        key_index = self._find_key(external_id.encode())
+        if key_index is None:
+            return []
+        return self._entries(key_index, None if namespaces is None else set(namespaces))
+
+    def lookup_bulk(
+        self, external_ids: list[str], namespaces: list[str] | None = None
+    ) -> dict[str, list[tuple[str, str]]]:
+        """`lookup` for a list of ids at once. Ids that are not in the index map to an empty list"""
+        external_ids = list(dict.fromkeys(external_ids))
+        key_indices = self._find_keys([external_id.encode() for external_id in external_ids])
+        namespaces = None if namespaces is None else set(namespaces)
+        return {
+            external_id: [] if key_index == -1 else self._entries(int(key_index), namespaces)
+            for external_id, key_index in zip(external_ids, key_indices)
+        }
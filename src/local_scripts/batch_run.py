@@ -0,0 +1,236 @@
+"""the parts of a batch run that are shared by `pipeline_all_genes_in_species.py`,
+`pipeline_input_table.py` and `queue_worker.py`
+
+- `run_gene_group`/`multiple_genes`: run a group of genes (e.g. genes that
+  share an OG, see `og_selection.group_genes_by_og`) and record the outcome of
+  each (gene, level) in the run manifest (see `run_manifest`)
+- `run_batch`: the work list of a batch script (skip the tasks that already
+  succeeded, estimate the costs, then write a queue or run the groups on a
+  local pool) and the filemap index update at the end
+- `add_worker_arguments`/`add_batch_arguments`: the command line options of
+  the scripts
+"""
+
+import argparse
+import os
+import shutil
+from pathlib import Path
+from typing import Literal
+
+import local_config.orthodb_pipeline_parameters as conf
+import local_orthoDB_group_pipeline.filemap_index as filemap_index
+import local_orthoDB_group_pipeline.og_cache as og_cache
+import local_orthoDB_group_pipeline.run_manifest as run_manifest
+import local_orthoDB_group_pipeline.task_scheduler as task_scheduler
+import local_orthoDB_group_pipeline.thread_budget as thread_budget
+import local_orthoDB_group_pipeline.work_queue as work_queue
+import local_scripts.odb_group_pipeline as pipeline
+
+
+def run_gene_group(
+    config: conf.PipelineParams,
+    gene_levels: dict[str, list[str]],
+    id_type: Literal["odb_gene_id", "uniprot_id"] = "odb_gene_id",
+) -> list[dict]:
+    """
+    run the pipeline for a group of genes at their og_levels together, so
+    that they reuse the OG members and sequences cached by this process and
+    the LDOs of genes that share an OG are found together (see
+    `pipeline.main_pipeline_multi_query`). The outcome of each (gene, level)
+    is recorded in the run manifest (see `run_manifest`)
+
+    returns the manifest records of the tasks
+    """
+    assert id_type in ["odb_gene_id", "uniprot_id"], f"id_type must be 'odb_gene_id' or 'uniprot_id', not {id_type}"
+    manifest = run_manifest.RunManifest.from_output_folder(config.main_output_folder)
+    # genes that are resumed may be missing different levels
+    level_groups: dict[tuple[str, ...], list[str]] = {}
+    for gene_id, og_levels in gene_levels.items():
+        level_groups.setdefault(tuple(og_levels), []).append(gene_id)
+    records = []
+    for og_levels, gene_ids in level_groups.items():
+        gene_results = pipeline.main_pipeline_multi_query(config, list(og_levels), [{id_type: gene_id} for gene_id in gene_ids])
+        for gene_id, level_results in zip(gene_ids, gene_results):
+            for og_level, (_, output_dict) in level_results.items():
+                if "critical error" in output_dict:
+                    # logger.error(f"{query_geneid} - {og_level} - {err}")
+                    print(f"{gene_id} - {og_level} - {output_dict['critical error']}")
+        group_records = run_manifest.task_records(config, gene_ids, gene_results)
+        manifest.record(group_records)
+        records.extend(group_records)
+    return records
+
+
+def multiple_genes(
+    config: conf.PipelineParams,
+    gene_levels: dict[str, list[str]],
+    id_type: Literal["odb_gene_id", "uniprot_id"] = "odb_gene_id",
+) -> tuple[int, dict]:
+    """
+    `run_gene_group` in a worker of a local pool
+
+    returns the process id and the cumulative cache stats of the process
+    """
+    run_gene_group(config, gene_levels, id_type)
+    return os.getpid(), og_cache.cache_stats()
+
+
+def prepare_output_folder(config: conf.PipelineParams, overwrite=False, resume=False):
+    """remove the main_output_folder of a previous run (with `overwrite`), or
+    raise an error if it exists and the run isn't resumed"""
+    if Path(config.main_output_folder).exists() and not resume:
+        if overwrite:
+            shutil.rmtree(config.main_output_folder)
+        else:
+            raise FileExistsError(
+                f"main_output_folder already exists: {config.main_output_folder}. Use -o flag to overwrite or --resume to continue the run"
+            )
+
+
+def update_filemap_index(config: conf.PipelineParams):
+    """index the files of the finished tasks (see `filemap_index`)"""
+    if not config.write_files:
+        return
+    index = filemap_index.FileMapIndex.from_output_folder(config.main_output_folder)
+    print(f"indexed {index.update():,} new tasks in {index.index_file} ({len(index):,} in total)")
+    index.close()
+
+
+def run_batch(
+    config: conf.PipelineParams,
+    id_list: list[str],
+    gene_groups: list[list[str]],
+    og_levels: list[str],
+    id_type: Literal["odb_gene_id", "uniprot_id"] = "odb_gene_id",
+    odb_gene_id_map: dict[str, str] | None = None,
+    n_cores: int = 1,
+    multiprocess=True,
+    og_cache_mb: int | None = None,
+    resume=False,
+    max_tasks_per_child: int | None = task_scheduler.DEFAULT_MAX_TASKS_PER_CHILD,
+    n_threads: int | None = None,
+    pin_threads=False,
+    queue_file: str | None = None,
+    overwrite=False,
+):
+    """run the pipeline for every gene of a batch script at every level
+
+    Parameters
+    ----------
+    config : conf.PipelineParams
+        the pipeline parameters. The main_output_folder must be prepared
+        already (see `prepare_output_folder`)
+    id_list : list[str]
+        the ids of the genes
+    gene_groups : list[list[str]]
+        the genes of `id_list` in groups that are run together (genes that share an OG)
+    og_levels : list[str]
+        the levels to run each gene at
+    id_type : Literal["odb_gene_id", "uniprot_id"], optional
+        the type of the ids, by default "odb_gene_id"
+    odb_gene_id_map : dict[str, str] | None, optional
+        the odb_gene_id of each id, if they aren't odb_gene_ids (see
+        `task_scheduler.estimate_task_costs`), by default None
+    the other parameters are the command line options of `add_batch_arguments`
+    """
+    if og_cache_mb is not None:
+        og_cache.configure(max_sequence_bytes=og_cache_mb * 2**20)
+    manifest = run_manifest.RunManifest.from_output_folder(config.main_output_folder)
+    # the levels of each gene that haven't succeeded yet (all of them in a new run)
+    pending = manifest.pending_levels(config, id_list, og_levels)
+    if resume:
+        print(f"resuming: {len(pending)} of {len(id_list)} genes have levels left to run")
+    gene_groups = [
+        {gene_id: pending[gene_id] for gene_id in group if gene_id in pending}
+        for group in gene_groups
+    ]
+    gene_groups = [group for group in gene_groups if group]
+    # the groups with the largest OGs are started first (see `task_scheduler`)
+    costs = task_scheduler.estimate_task_costs(
+        gene_groups, config.ldo_select_params.LDO_selection_method, odb_gene_id_map
+    )
+    if queue_file is not None:
+        # the workers of `queue_worker.py` run the tasks instead of a local pool
+        work_queue.create_queue(queue_file, config, id_type, gene_groups, costs, overwrite=overwrite)
+        print(f"wrote {len(gene_groups):,} gene groups to {queue_file}. Run them with queue_worker.py -q {queue_file}")
+        return
+    if gene_groups:
+        # the external tools of all of the workers share one budget of threads
+        with thread_budget.shared_budget(n_threads, pin=pin_threads):
+            worker_stats = task_scheduler.run_tasks(
+                multiple_genes,
+                [(config, group, id_type) for group in gene_groups],
+                costs,
+                n_cores=n_cores,
+                max_tasks_per_child=max_tasks_per_child,
+                multiprocess=multiprocess,
+            )
+        # the last (cumulative) cache stats of each process
+        print(og_cache.format_stats(og_cache.combine_stats(list(dict(worker_stats).values()))))
+    update_filemap_index(config)
+
+
+def add_worker_arguments(parser: argparse.ArgumentParser, n_threads_help: str = "all of the workers"):
+    """the options of the worker processes: the OG cache size and the thread budget"""
+    parser.add_argument(
+        "--og_cache_mb",
+        type=int,
+        metavar="<int>",
+        default=og_cache.DEFAULT_MAX_SEQUENCE_BYTES // 2**20,
+        help="""size limit (MiB) of the OG sequence cache of each worker""",
+    )
+    parser.add_argument(
+        "--n_threads",
+        type=int,
+        metavar="<int>",
+        default=None,
+        help=f"""total number of threads that the mafft and cd-hit runs of {n_threads_help} can use at once (default: the number of CPUs)""",
+    )
+    parser.add_argument(
+        "--pin_threads",
+        action="store_true",
+        help="""pin each mafft/cd-hit run to the CPUs of the threads it was granted (Linux only)""",
+    )
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser):
+    """the options of the batch scripts that are passed on to `run_batch` (see `batch_kwargs`)"""
+    add_worker_arguments(parser)
+    parser.add_argument(
+        "--max_tasks_per_child",
+        type=int,
+        metavar="<int>",
+        default=task_scheduler.DEFAULT_MAX_TASKS_PER_CHILD,
+        help="""number of gene groups each worker process runs before it is replaced by a new one (bounds the memory growth of the workers)""",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        metavar="<file>",
+        default=None,
+        help="""instead of running the pipeline, write the tasks to a queue file that workers on any number of hosts run (see queue_worker.py). The queue file and the main_output_folder must be on a filesystem that all of the hosts share""",
+    )
+    parser.add_argument(
+        "-o",
+        "--overwrite",
+        action="store_true",
+        help="""if flag is provided and the main_output_folder exists, it will be removed and overwritten by the new files. Otherwise, an error will be raised if the folder exists""",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="""continue a run in an existing main_output_folder. The (gene, level) tasks that succeeded with the same parameters (see the manifest.jsonl file in the main_output_folder) are skipped and failed tasks are retried""",
+    )
+
+
+def batch_kwargs(args: argparse.Namespace) -> dict:
+    """the values of the `add_batch_arguments` options, as keyword arguments of the `main` of a batch script"""
+    return {
+        "og_cache_mb": args.og_cache_mb,
+        "n_threads": args.n_threads,
+        "pin_threads": args.pin_threads,
+        "max_tasks_per_child": args.max_tasks_per_child,
+        "queue_file": args.queue,
+        "overwrite": args.overwrite,
+        "resume": args.resume,
+    }
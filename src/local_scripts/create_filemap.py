@@ -16,41 +16,41 @@ will create a file looking like:
     },
     ...
 }
+
+The map is read from the filemap index of the output folder (see
+`filemap_index`), which is updated with the tasks recorded in the run manifest
+since the last update, so the info json files aren't read again. If a gene
+was run at a level more than once, its latest files are used. For lookups of
+single genes, use `filemap_index.FileMapIndex` directly instead of the json file
 '''
 
 import argparse
 import json
 from pathlib import Path
 
-
-def get_json_file_list(json_dir: str|Path) -> list[Path]:
-    json_dir = Path(json_dir)
-    json_files = list(json_dir.glob('*.json'))
-    return json_files
+from local_orthoDB_group_pipeline.filemap_index import FileMapIndex
 
 
-def get_map_info_from_json(json_file: str|Path) -> tuple[str, str, str]:
-    with open(json_file, 'r') as f:
-        json_data = json.load(f)
-    aln_file = json_data['alignment_clustered_ldos_file']
-    level = json_data['oglevel']
-    odb_gene_id = json_data['query_odb_gene_id']
-    return odb_gene_id, aln_file, level
+def update_filemap_index(main_output_folder: str|Path) -> FileMapIndex:
+    """bring the filemap index of the output folder (`filemap.sqlite`) up to date.
+    The records added to the run manifest since the last update are indexed.
+    An output folder without a manifest (e.g. from `odb_group_pipeline.py`) is
+    indexed from its info json files instead
+    """
+    index = FileMapIndex.from_output_folder(main_output_folder)
+    if index.manifest.manifest_file.exists():
+        index.update()
+    else:
+        index.index_info_jsons(Path(main_output_folder) / 'info_jsons')
+    return index
 
 
 def create_filemap(main_output_folder: str|Path, output_file: str|Path):
-    json_dir = Path(main_output_folder) / 'info_jsons'
-    json_files = get_json_file_list(json_dir)
-    file_map = {}
-    for json_file in json_files:
-        odb_gene_id, aln_file, level = get_map_info_from_json(json_file)
-        if odb_gene_id not in file_map:
-            file_map[odb_gene_id] = {}
-        if level in file_map[odb_gene_id]:
-            raise ValueError(f'level {level} already in file map for gene {odb_gene_id}')
-        file_map[odb_gene_id][level] = {}
-        file_map[odb_gene_id][level]['alignment_file'] = aln_file
-        file_map[odb_gene_id][level]['info_file'] = str(json_file.resolve())
+    index = update_filemap_index(main_output_folder)
+    try:
+        file_map = index.to_dict()
+    finally:
+        index.close()
     with open(output_file, 'w') as f:
         json.dump(file_map, f, indent=4)
 
@@ -59,6 +59,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='''
 run this after the pipeline to create a single json file that maps the gene ids to the files output by the pipeline
+updates the filemap index of the output folder (`filemap.sqlite`) and
 creates a json file mapping odb gene ids to the files output by the pipeline
 will create a file looking like:
 {
@@ -80,7 +81,7 @@ will create a file looking like:
     parser.add_argument(
         '--main_output_folder',
         required=True,
-        help='The main pipeline output folder. The folder should contain the folder `info_jsons/`, where it will look for the json files.'
+        help='The main pipeline output folder. The files are looked up in its run manifest (`manifest.jsonl`), or in the folder `info_jsons/` if there is no manifest.'
     )
     parser.add_argument(
         '--output_file',
@@ -0,0 +1,46 @@
+'''
+run this after a pipeline run with `results_sink: sqlite` to write the results
+in the results database (`main_output_folder/results.sqlite`) to info json
+files, in the same layout as the default `json` results sink:
+
+main_output_folder/
+    ├── info_jsons/
+    │   ├── {odb_gene_id}_{og_level}_{og_id}_info.json
+    │   ├── ...
+    │   ├── failures/
+    │   │   ├── {query}_{og_level}_info.json
+'''
+
+import argparse
+
+from local_orthoDB_group_pipeline.results_store import ResultsStore
+
+
+def export_results_json(main_output_folder: str, output_folder: str | None = None) -> int:
+    store = ResultsStore(main_output_folder)
+    try:
+        return store.export_json(output_folder)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='''
+write the results in the results database of a run with `results_sink: sqlite`
+to info json files (`info_jsons/` in the output folder)''',
+        formatter_class = argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '--main_output_folder',
+        required=True,
+        help='The main pipeline output folder. The folder should contain the results database `results.sqlite`.'
+    )
+    parser.add_argument(
+        '--output_folder',
+        default=None,
+        help='the folder to write `info_jsons/` into (default: the main output folder)'
+    )
+    args = parser.parse_args()
+    n_files = export_results_json(args.main_output_folder, args.output_folder)
+    print(f'wrote {n_files:,} info json files')
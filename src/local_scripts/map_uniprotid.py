@@ -6,6 +6,24 @@ import pandas as pd
 from local_orthoDB_group_pipeline import uniprotid_search
 
 
+def map_uniprot_id_bulk(
+    table: pd.DataFrame,
+    uniprotid_column_name: str = 'uniprot_id',
+    duplicate_action: str = 'longest',
+) -> pd.DataFrame:
+    """map all of the uniprot ids in a table at once (see `uniprotid_search.map_uniprotids_bulk`)
+
+    adds a `gene_id` column and a `gene_id_unmapped_reason` column that says
+    why an id could not be mapped
+    """
+    uniprot_ids = list(table[uniprotid_column_name].unique())
+    map_df = uniprotid_search.map_uniprotids_bulk(uniprot_ids, duplicate_action=duplicate_action)
+    map_df = map_df.set_index('uniprot_id')
+    table['gene_id'] = table[uniprotid_column_name].map(map_df['odb_gene_id'])
+    table['gene_id_unmapped_reason'] = table[uniprotid_column_name].map(map_df['unmapped_reason'])
+    return table
+
+
 def map_uniprot_id(table: pd.DataFrame, uniprotid_column_name: str = 'uniprot_id') -> pd.DataFrame:
     uniprot_ids = list(table[uniprotid_column_name].unique())
     id_map = {}
@@ -18,7 +36,13 @@ def map_uniprot_id(table: pd.DataFrame, uniprotid_column_name: str = 'uniprot_id
     return table
 
 
-def main(input_file: str, uniprotid_column_name: str = 'uniprot_id', output_file: str|None = None):
+def main(
+    input_file: str,
+    uniprotid_column_name: str = 'uniprot_id',
+    output_file: str|None = None,
+    one_at_a_time: bool = False,
+    duplicate_action: str = 'longest',
+):
     input_file = Path(input_file)
     if output_file is None:
         output_file = input_file.parent / f'{input_file.stem}_mapped_odbgeneid{input_file.suffix}'
@@ -30,14 +54,18 @@ def main(input_file: str, uniprotid_column_name: str = 'uniprot_id', output_file
     table[uniprotid_column_name+'_stripped'] = table[uniprotid_column_name].str.strip()
     # strip isoform information from uniprot ids.
     table[uniprotid_column_name+'_stripped'] = table[uniprotid_column_name+'_stripped'].str.replace(r'-\d+$', '', regex=True)
-    table = map_uniprot_id(table, uniprotid_column_name)
+    if one_at_a_time:
+        table = map_uniprot_id(table, uniprotid_column_name)
+    else:
+        table = map_uniprot_id_bulk(table, uniprotid_column_name, duplicate_action)
     table.to_csv(output_file, index=False)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='''maps a column of uniprot ids in a table to orthoDB gene ids.
-exports a copy of the table with a new column containing the orthoDB gene ids.\n
+exports a copy of the table with a new column containing the orthoDB gene ids
+and a column with the reason that any ids could not be mapped.\n
 if the uniprot ids have isoform information, e.g. "P12345-1", the isoform 
 information will be stripped before mapping, e.g. "P12345-1" -> "P12345".''',
         formatter_class = argparse.RawTextHelpFormatter
@@ -65,6 +93,19 @@ information will be stripped before mapping, e.g. "P12345-1" -> "P12345".''',
         metavar="<file>",
         help='''output file name. Default: input file name + "_mapped_odbgeneid"'''
     )
+    parser.add_argument(
+        '--duplicate_action',
+        type=str,
+        default='longest',
+        choices=['longest', 'first'],
+        help='''which gene id to choose when a uniprot id maps to more than one. Default: longest'''
+    )
+    parser.add_argument(
+        '--one_at_a_time',
+        action='store_true',
+        help='''map the ids one at a time instead of in bulk. Much slower. The output has no
+gene_id_unmapped_reason column and --duplicate_action is ignored (always "longest")'''
+    )
     args = parser.parse_args()
-    main(args.input, args.uni_column, args.output)
+    main(args.input, args.uni_column, args.output, args.one_at_a_time, args.duplicate_action)
 
@@ -1,22 +1,24 @@
 #!/usr/bin/env python
 
 import argparse
-import copy
-import json
+import collections
+import contextlib
 from pathlib import Path
 
 import yaml
-from attrs import asdict
+from attrs import asdict, evolve
 from Bio import SeqIO
 
 import local_env_variables.env_variables as env
 import local_seqtools.cli_wrappers as cli_wrappers
 from local_config import orthodb_pipeline_parameters
 from local_orthoDB_group_pipeline import (cluster, filters, find_LDOs,
-                                          og_selection, sql_queries,
+                                          og_cache, og_selection,
+                                          results_store, sequence_search,
+                                          sql_queries, thread_budget,
                                           uniprotid_search)
 
-ODB_DATABASE = env.orthoDB_database()
+ODB_DATABASE = env.get_orthoDB_database()
 
 def load_config(config_file: str | None) -> orthodb_pipeline_parameters.PipelineParams:
     if config_file is None:
@@ -28,9 +30,9 @@ def load_config(config_file: str | None) -> orthodb_pipeline_parameters.Pipeline
     return config
 
 def generate_species_map(odb_gene_id_list: list[str]):
+    species_id_dict = sql_queries.odb_gene_id_list_2_species_id_dict(odb_gene_id_list)
     species_map = {}
-    for odb_gene_id in odb_gene_id_list:
-        species_id = sql_queries.odb_gene_id_2_species_id(odb_gene_id)
+    for odb_gene_id, species_id in species_id_dict.items():
         species_map[odb_gene_id] = ODB_DATABASE.data_species_dict[species_id]
     return species_map
 
@@ -44,16 +46,10 @@ def filter_sequences(min_fraction_shorter_than_query, query_seqrecord, sequence_
         min_length=min_length,
     )
     if query_seqrecord.id not in filtered_sequence_dict:
-        filtered_sequence_dict[query_seqrecord.id] = copy.deepcopy(query_seqrecord)
+        filtered_sequence_dict[query_seqrecord.id] = query_seqrecord
     return filtered_sequence_dict
 
 
-def save_info_json(output_dict: dict, output_file: str|Path):
-    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
-    with open(output_file, 'w') as f:
-        json.dump(output_dict, f, indent=4)
-
-
 def _pipeline(config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: str) -> dict:
     """runs the pipeline for a odb_gene_id. This isn't meant to be called directly,
     Instead, use pipeline_from_uniprot_id or pipeline_from_odb_gene_id.
@@ -80,68 +76,333 @@ def _pipeline(config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: s
         results_dict['critical error'] = str(e)
         return results_dict
     
-    group_members = sql_queries.ogid_2_odb_gene_id_list(ogid)
-    sequence_dict = ODB_DATABASE.get_sequences_from_list_of_seq_ids(group_members)
-    query_seqrecord = sequence_dict[odb_gene_id]
-
-    filtered_sequence_dict = filter_sequences(
-        config.filter_params.min_fraction_shorter_than_query,
-        query_seqrecord,
-        sequence_dict,
+    group_members = og_cache.get_og_members(ogid)
+    try:
+        group_members = _filter_group_members(config, odb_gene_id, group_members)
+    except ValueError as e:
+        results_dict['critical error'] = str(e)
+        return results_dict
+    sequence_dict = og_cache.get_og_sequences(ogid, group_members)
+    return _og_stages(config, odb_gene_id, ogid, oglevel, sequence_dict)
+
+
+def _filter_group_members(
+    config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: str, group_members: list[str]
+) -> list[str]:
+    """apply the species filters of the config to the OG members (see `filters.filter_odb_gene_ids_by_species`)"""
+    return filters.filter_odb_gene_ids_by_species(
+        group_members,
+        level_name=config.filter_params.species_level_name,
+        include=config.filter_params.species_include,
+        exclude=config.filter_params.species_exclude,
+        keep=[odb_gene_id],
     )
 
-    pid_df, ldos = find_LDOs.find_LDOs_main(
-        seqrecord_dict = filtered_sequence_dict,
-        query_seqrecord = query_seqrecord,
-        pid_method = config.ldo_select_params.LDO_selection_method,
-        n_align_threads = config.ldo_select_params.LDO_mafft_threads,
-        mafft_executable = config.ldo_select_params._LDO_mafft_exe,
-        extra_args = config.ldo_select_params._LDO_mafft_additional_args,
-    )
-    ldo_seqrecord_dict = ODB_DATABASE.get_sequences_from_list_of_seq_ids(ldos)
 
-    cdhit_command, clustered_ldo_seqrec_dict = cluster.cdhit_main(
-        ldo_seqrecord_dict,
-        odb_gene_id,
-        cd_hit_executable=config._cd_hit_exe,
-        extra_args=config._cd_hit_additional_args
+def _og_stages(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    odb_gene_id: str,
+    ogid: str,
+    oglevel: str,
+    sequence_dict: dict,
+) -> dict:
+    """run the filtering, LDO selection and clustering stages for the selected
+    OG, given the sequences of its (species filtered) members"""
+    return _og_stages_multi_query(config, ogid, oglevel, {odb_gene_id: sequence_dict})[odb_gene_id]
+
+
+def _largest_alignment(ldo_selection_method: str, sequence_dicts: dict[str, dict]) -> int:
+    """the number of sequences of the largest mafft alignment of the LDO
+    selection step (the whole group for `msa`, the paralogs of one organism
+    and the query for `msa_by_organism`)"""
+    if ldo_selection_method == "msa":
+        return max(len(sequence_dict) for sequence_dict in sequence_dicts.values())
+    return max(
+        max(collections.Counter(seq.species_id for seq in sequence_dict.values()).values()) + 1
+        for sequence_dict in sequence_dicts.values()
     )
 
-    results_dict['query_odb_gene_id'] = odb_gene_id
-    results_dict['query_sequence_str'] = str(query_seqrecord.seq)
-    results_dict['ogid'] = ogid
-    results_dict['oglevel'] = oglevel
-    results_dict['sequences'] = list(sequence_dict.keys())
-    results_dict['sequences_filtered'] = list(filtered_sequence_dict.keys())
-    results_dict['sequences_ldos'] = list(ldo_seqrecord_dict.keys())
-    results_dict['sequences_clustered_ldos'] = clustered_ldo_seqrec_dict
-    results_dict['cdhit_command'] = cdhit_command
-    results_dict['species_map'] = generate_species_map(list(clustered_ldo_seqrec_dict.keys()))
-    return results_dict
 
+def _og_stages_multi_query(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    ogid: str,
+    oglevel: str,
+    query_sequence_dicts: dict[str, dict],
+) -> dict[str, dict]:
+    """`_og_stages` for several queries that selected the same OG. The LDOs of
+    all of the queries are found together (see `find_LDOs.find_LDOs_multi_query`)
 
-def pipeline_from_uniprot_id(config: orthodb_pipeline_parameters.PipelineParams, uniprot_id: str):
-    try:
-        odb_gene_id = uniprotid_search.uniprotid_2_odb_gene_id(uniprot_id)
-    except ValueError as e:
-        output_dict = {}
-        output_dict['query_uniprot_id'] = uniprot_id
-        output_dict['critical error'] = str(e)
-        return output_dict
+    Parameters
+    ----------
+    query_sequence_dicts : dict[str, dict]
+        for each query odb_gene_id, the sequences of the (species filtered) OG members
+
+    Returns
+    -------
+    dict[str, dict]
+        the results of each query
+    """
+    filtered_sequence_dicts = {
+        odb_gene_id: filter_sequences(
+            config.filter_params.min_fraction_shorter_than_query,
+            sequence_dict[odb_gene_id],
+            sequence_dict,
+        )
+        for odb_gene_id, sequence_dict in query_sequence_dicts.items()
+    }
+    # mafft only runs in the msa methods, so only they take threads from the budget
+    ldo_uses_mafft = config.ldo_select_params.LDO_selection_method in ["msa", "msa_by_organism"]
+    if ldo_uses_mafft:
+        ldo_threads_context = thread_budget.threads(
+            config.ldo_select_params.LDO_mafft_threads,
+            _largest_alignment(config.ldo_select_params.LDO_selection_method, filtered_sequence_dicts),
+        )
+    else:
+        ldo_threads_context = contextlib.nullcontext(config.ldo_select_params.LDO_mafft_threads)
+    with ldo_threads_context as n_align_threads:
+        ldo_results = find_LDOs.find_LDOs_multi_query(
+            filtered_sequence_dicts,
+            pid_method = config.ldo_select_params.LDO_selection_method,
+            n_align_threads = n_align_threads,
+            mafft_executable = config.ldo_select_params._LDO_mafft_exe,
+            extra_args = config.ldo_select_params._LDO_mafft_additional_args,
+        )
+    ldo_mafft_threads = n_align_threads if ldo_uses_mafft else None
+
+    query_results = {}
+    for odb_gene_id, sequence_dict in query_sequence_dicts.items():
+        results_dict = {}
+        query_seqrecord = sequence_dict[odb_gene_id]
+        filtered_sequence_dict = filtered_sequence_dicts[odb_gene_id]
+        _, ldos = ldo_results[odb_gene_id]
+        ldo_seqrecord_dict = {ldo: filtered_sequence_dict[ldo] for ldo in ldos}
+
+        # cd-hit gets its threads from the budget only when there is one, and
+        # otherwise runs with the threads of its extra args
+        if thread_budget.get_budget() is not None:
+            cd_hit_threads_context = thread_budget.threads(thread_budget.CD_HIT_THREADS, len(ldo_seqrecord_dict))
+        else:
+            cd_hit_threads_context = contextlib.nullcontext(None)
+        with cd_hit_threads_context as cd_hit_threads:
+            cdhit_command, clustered_ldo_seqrec_dict = cluster.cdhit_main(
+                ldo_seqrecord_dict,
+                odb_gene_id,
+                cd_hit_executable=config._cd_hit_exe,
+                extra_args=config._cd_hit_additional_args,
+                n_threads=cd_hit_threads,
+            )
+
+        results_dict['query_odb_gene_id'] = odb_gene_id
+        results_dict['query_sequence_str'] = query_seqrecord.seq
+        results_dict['ogid'] = ogid
+        results_dict['oglevel'] = oglevel
+        results_dict['sequences'] = list(sequence_dict.keys())
+        results_dict['sequences_filtered'] = list(filtered_sequence_dict.keys())
+        results_dict['sequences_ldos'] = list(ldo_seqrecord_dict.keys())
+        results_dict['sequences_clustered_ldos'] = clustered_ldo_seqrec_dict
+        results_dict['cdhit_command'] = cdhit_command
+        results_dict['species_map'] = generate_species_map(list(clustered_ldo_seqrec_dict.keys()))
+        if thread_budget.get_budget() is not None:
+            results_dict['granted_threads'] = {'LDO_mafft': ldo_mafft_threads, 'cd_hit': cd_hit_threads}
+        query_results[odb_gene_id] = results_dict
+    return query_results
+
+
+def _resolve_query(
+    uniprot_id: str | None = None,
+    odb_gene_id: str | None = None,
+    query_id: str | None = None,
+    query_id_type: str | None = None,
+    query_sequence: str | None = None,
+    query_species_id: str | None = None,
+    min_score: float = 0.5,
+) -> tuple[str | None, dict]:
+    """resolve the query to an odb_gene_id (see `main_pipeline` for the arguments)
+
+    Returns
+    -------
+    str | None
+        the odb_gene_id of the query, or None if it couldn't be resolved
+    dict
+        the query information that is added to the pipeline results. If the
+        query couldn't be resolved, it holds the "critical error"
+
+    Raises
+    ------
+    ValueError
+        raises a ValueError if none of `uniprot_id`, `odb_gene_id`, `query_id` or `query_sequence` are provided
+    """
+    query_info = {}
+    if odb_gene_id is not None:
+        query_info['query_uniprot_id'] = sql_queries.odb_gene_id_2_uniprotid(odb_gene_id)
+        return odb_gene_id, query_info
+    if uniprot_id is not None:
+        query_info['query_uniprot_id'] = uniprot_id
+        try:
+            odb_gene_id = uniprotid_search.uniprotid_2_odb_gene_id(uniprot_id)
+        except ValueError as e:
+            query_info['critical error'] = str(e)
+            return None, query_info
+        return odb_gene_id, query_info
+    if query_id is not None:
+        namespaces = None if query_id_type is None else [query_id_type]
+        try:
+            odb_gene_id = uniprotid_search.query_id_2_odb_gene_id(query_id, namespaces)
+        except ValueError as e:
+            query_info['query_id'] = query_id
+            query_info['critical error'] = str(e)
+            return None, query_info
+        query_info['query_uniprot_id'] = sql_queries.odb_gene_id_2_uniprotid(odb_gene_id)
+        query_info['query_id'] = query_id
+        return odb_gene_id, query_info
+    if query_sequence is not None:
+        try:
+            odb_gene_id, match, score, exact_hits = sequence_search.sequence_2_odb_gene_id(
+                query_sequence, min_score, species_id=query_species_id
+            )
+        except ValueError as e:
+            query_info['query_sequence_input'] = query_sequence
+            query_info['critical error'] = str(e)
+            return None, query_info
+        query_info['query_uniprot_id'] = sql_queries.odb_gene_id_2_uniprotid(odb_gene_id)
+        query_info['query_sequence_input'] = query_sequence
+        query_info['query_sequence_match'] = match
+        query_info['query_sequence_match_score'] = score
+        query_info['query_sequence_exact_hits'] = exact_hits
+        return odb_gene_id, query_info
+    raise ValueError('one of uniprot_id, odb_gene_id, query_id or query_sequence must be provided')
+
+
+def _query_failure_name(
+    uniprot_id: str | None = None,
+    odb_gene_id: str | None = None,
+    query_id: str | None = None,
+    query_sequence: str | None = None,
+) -> str:
+    """name of the info json that is written to the failures folder if the pipeline fails"""
+    if odb_gene_id is None and uniprot_id is None:
+        if query_id is not None:
+            return query_id
+        if query_sequence is not None:
+            return f'sequence_{sequence_search.sequence_md5(sequence_search.normalize_sequence(query_sequence))}'
+    return f'{uniprot_id}{odb_gene_id}'
+
+
+def _pipeline_from_query(config: orthodb_pipeline_parameters.PipelineParams, **query) -> dict:
+    odb_gene_id, query_info = _resolve_query(**query)
+    if odb_gene_id is None:
+        return query_info
     output_dict = _pipeline(config, odb_gene_id)
-    output_dict['query_uniprot_id'] = uniprot_id
+    output_dict.update(query_info)
     return output_dict
 
 
+def pipeline_from_uniprot_id(config: orthodb_pipeline_parameters.PipelineParams, uniprot_id: str):
+    return _pipeline_from_query(config, uniprot_id=uniprot_id)
+
+
+def pipeline_from_query_id(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    query_id: str,
+    query_id_type: str | None = None,
+):
+    """run the pipeline for an id of any type that is in the orthoDB gene or
+    xref tables (see `uniprotid_search.map_query_ids_bulk`)"""
+    return _pipeline_from_query(config, query_id=query_id, query_id_type=query_id_type)
+
+
+def pipeline_from_query_sequence(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    query_sequence: str,
+    min_score: float = 0.5,
+    query_species_id: str | None = None,
+):
+    """run the pipeline for the orthoDB gene (of `query_species_id`, if given)
+    with a sequence identical or similar to `query_sequence` (see
+    `sequence_search.sequence_2_odb_gene_id`)"""
+    return _pipeline_from_query(
+        config, query_sequence=query_sequence, query_species_id=query_species_id, min_score=min_score
+    )
+
+
 def pipeline_from_odb_gene_id(config: orthodb_pipeline_parameters.PipelineParams, odb_gene_id: str):
-    query_uniprot_id = sql_queries.odb_gene_id_2_uniprotid(odb_gene_id)
-    output_dict = _pipeline(config, odb_gene_id)
-    output_dict['query_uniprot_id'] = query_uniprot_id
-    return output_dict
+    return _pipeline_from_query(config, odb_gene_id=odb_gene_id)
+
+
+def _save_outputs(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    output_dict: dict,
+    failure_name: str,
+    query_failure: bool = False,
+) -> Path:
+    """align the clustered LDOs (if `config.align_params.align`) and write the
+    info json (if `config.write_files`). A result with a "critical error" is
+    written to the failures folder as `<failure_name>_info.json` instead.
+    The info json is written by the results sink of the config (see
+    `results_store`), which may buffer it until `results_store.flush` is called.
+    With `query_failure` (the query couldn't be resolved to an orthoDB gene,
+    whatever the level), the result isn't stored under the OG level of the config
+
+    Returns
+    -------
+    Path
+        the info json file (for the `sqlite` sink, the key of the result in
+        the results database and the file it is exported to)
+    """
+    og_info_json_folder = Path(config.main_output_folder) / 'info_jsons'
+    og_info_failure_folder = og_info_json_folder / 'failures'
+
+    if 'critical error' in output_dict:
+        og_info_json_file = og_info_failure_folder / f'{failure_name}_info.json'
+        if config.write_files:
+            og_level = None if query_failure else config.og_select_params.OG_level_name
+            results_store.get_sink(config).write(output_dict, og_info_json_file, og_level)
+        return og_info_json_file
+
+    output_file_prefix = f'{output_dict["query_odb_gene_id"].replace(":", "_")}_{output_dict["oglevel"]}_{output_dict["ogid"]}'
+
+    if config.align_params.align:
+        with thread_budget.threads(
+            config.align_params.n_align_threads, len(output_dict['sequences_clustered_ldos'])
+        ) as n_align_threads:
+            mafft_command, aln = cli_wrappers.mafft_align_wrapper(
+                list(output_dict['sequences_clustered_ldos'].values()),
+                n_align_threads=n_align_threads,
+                mafft_executable=config.align_params._mafft_exe,
+                extra_args=config.align_params._mafft_additional_args,
+                output_format = "list",
+            )
+        if thread_budget.get_budget() is not None:
+            output_dict['granted_threads'] = {**output_dict.get('granted_threads', {}), 'alignment_mafft': n_align_threads}
+        if config.write_files:
+            alignment_folder = Path(config.main_output_folder) / 'alignments'
+            alignment_folder.mkdir(parents=True, exist_ok=True)
+            alignment_output_file = alignment_folder / f'{output_file_prefix}_clustered_ldos_aln.fasta'
+            with open(alignment_output_file, 'w') as f:
+                SeqIO.write(aln, f, 'fasta')
+            output_dict['alignment_clustered_ldos_file'] = str(alignment_output_file.resolve())
+            # output_dict['alignment_clustered_ldos_file_relative'] = str(alignment_output_file.resolve().relative_to(Path.cwd()))
+            output_dict['alignment_clustered_ldos_command'] = mafft_command
 
+    output_dict['sequences_clustered_ldos'] = list(output_dict['sequences_clustered_ldos'].keys())
+    og_info_json_file = og_info_json_folder / f'{output_file_prefix}_info.json'
+    if config.write_files:
+        results_store.get_sink(config).write(
+            output_dict, og_info_json_file, config.og_select_params.OG_level_name
+        )
+    return og_info_json_file
 
-def main_pipeline(config: orthodb_pipeline_parameters.PipelineParams, uniprot_id: str | None = None, odb_gene_id: str | None = None):
-    """run the main pipeline for a single gene. Either uniprot_id or odb_gene_id must be provided
+
+def main_pipeline(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    uniprot_id: str | None = None,
+    odb_gene_id: str | None = None,
+    query_id: str | None = None,
+    query_id_type: str | None = None,
+    query_sequence: str | None = None,
+    query_species_id: str | None = None,
+):
+    """run the main pipeline for a single gene. One of uniprot_id, odb_gene_id, query_id or query_sequence must be provided
 
     Parameters
     ----------
@@ -151,6 +412,23 @@ def main_pipeline(config: orthodb_pipeline_parameters.PipelineParams, uniprot_id
         uniprot id of the query protein. If not provided, then `odb_gene_id` must be provided, by default None
     odb_gene_id : str | None, optional
         orthoDB gene id of the query protein. If not provided, then `uniprot_id` must be provided, by default None
+    query_id : str | None, optional
+        id of any type that is in the orthoDB gene or xref tables (e.g. a gene
+        name, NCBI protein accession or Ensembl id), used if neither
+        `uniprot_id` nor `odb_gene_id` are provided, by default None
+    query_id_type : str | None, optional
+        the namespace of `query_id` (e.g. "NCBIproteinAcc"). If None, the id is
+        matched in every namespace, by default None
+    query_sequence : str | None, optional
+        protein sequence of the query, used if no id is provided. It is
+        resolved to the orthoDB gene with an identical sequence, or else to
+        the most similar one in the k-mer index (see `sequence_search`), by default None
+    query_species_id : str | None, optional
+        orthoDB species id of `query_sequence` (e.g. "9606_0"). If given, the
+        sequence is only resolved to a gene of this species. Otherwise,
+        identical sequences in several species resolve to the first
+        odb_gene_id, with a warning. The ids of all of the genes with an
+        identical sequence are in the results (`query_sequence_exact_hits`), by default None
 
     Returns
     -------
@@ -160,54 +438,241 @@ def main_pipeline(config: orthodb_pipeline_parameters.PipelineParams, uniprot_id
     Raises
     ------
     ValueError
-        raises a ValueError if neither `uniprot_id` nor `odb_gene_id` are provided
+        raises a ValueError if none of `uniprot_id`, `odb_gene_id`, `query_id` or `query_sequence` are provided
     ValueError
         raises a ValueError if there is a "critical error" in the pipeline
         When the pipeline is run, errors are stored in the output dictionary under the key "critical error". This error is raised if it exists
     """    
-    if odb_gene_id is not None:
-        output_dict = pipeline_from_odb_gene_id(config, odb_gene_id) # type: ignore
-    elif uniprot_id is not None:
-        output_dict = pipeline_from_uniprot_id(config, uniprot_id) # type: ignore
-    else:
-        raise ValueError('either uniprot_id or odb_gene_id must be provided')
-    
+    output_dict = _pipeline_from_query(
+        config,
+        uniprot_id=uniprot_id,
+        odb_gene_id=odb_gene_id,
+        query_id=query_id,
+        query_id_type=query_id_type,
+        query_sequence=query_sequence,
+        query_species_id=query_species_id,
+    )
     output_dict['processing params'] = asdict(config)
-    og_info_json_folder = Path(config.main_output_folder) / 'info_jsons'
-    og_info_failure_folder = og_info_json_folder / 'failures'
-    
+    og_info_json_file = _save_outputs(
+        config, output_dict, _query_failure_name(uniprot_id, odb_gene_id, query_id, query_sequence)
+    )
+    results_store.flush()
     if 'critical error' in output_dict:
-        if config.write_files:
-            og_info_failure_folder.mkdir(parents=True, exist_ok=True)
-            og_info_json_file = og_info_failure_folder / f'{uniprot_id}{odb_gene_id}_info.json'
-            save_info_json(output_dict, og_info_json_file)
         raise ValueError(output_dict['critical error'])
-    
-    output_file_prefix = f'{output_dict["query_odb_gene_id"].replace(":", "_")}_{output_dict["oglevel"]}_{output_dict["ogid"]}'
-    
-    if config.align_params.align:
-        mafft_command, aln = cli_wrappers.mafft_align_wrapper(
-            list(output_dict['sequences_clustered_ldos'].values()),
-            n_align_threads=config.align_params.n_align_threads,
-            mafft_executable=config.align_params._mafft_exe,
-            extra_args=config.align_params._mafft_additional_args,
-            output_format = "list",
+    return og_info_json_file, output_dict
+
+
+def _level_config(
+    config: orthodb_pipeline_parameters.PipelineParams, og_level: str
+) -> orthodb_pipeline_parameters.PipelineParams:
+    """copy of the config with the OG level name set to `og_level`"""
+    return evolve(config, og_select_params=evolve(config.og_select_params, OG_level_name=og_level))
+
+
+def main_pipeline_multi_level(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    og_levels: list[str],
+    uniprot_id: str | None = None,
+    odb_gene_id: str | None = None,
+    query_id: str | None = None,
+    query_id_type: str | None = None,
+    query_sequence: str | None = None,
+    query_species_id: str | None = None,
+) -> dict[str, tuple[Path, dict]]:
+    """run the main pipeline for a single gene at several OG levels
+
+    Gives the same results as calling `main_pipeline` once per level (with
+    `config.og_select_params.OG_level_name` set to the level), but the query
+    is resolved and the OGs of the gene are looked up only once, and the
+    sequences of the members of all of the selected OGs that aren't already
+    cached (see `og_cache`) are fetched in one bulk read. `config` itself is
+    not modified.
+
+    Parameters
+    ----------
+    config : conf.PipelineParams
+        pipeline parameters in a PipelineParams object. `og_select_params.OG_level_name` is ignored
+    og_levels : list[str]
+        the level names to run the pipeline for (e.g. ["Vertebrata", "Mammalia"])
+    uniprot_id, odb_gene_id, query_id, query_id_type, query_sequence, query_species_id
+        the query, see `main_pipeline`
+
+    Returns
+    -------
+    dict[str, tuple[Path, dict]]
+        the info json file and the results of each level, in the order of
+        `og_levels`. A level that failed has a "critical error" in its results,
+        which are written to the failures folder as `<query>_<level>_info.json`
+
+    Raises
+    ------
+    ValueError
+        raises a ValueError if none of `uniprot_id`, `odb_gene_id`, `query_id` or `query_sequence` are provided
+    ValueError
+        raises a ValueError if the query can't be resolved to an orthoDB gene
+        (the error is written to the failures folder, like in `main_pipeline`)
+    """
+    failure_name = _query_failure_name(uniprot_id, odb_gene_id, query_id, query_sequence)
+    resolved_odb_gene_id, query_info = _resolve_query(
+        uniprot_id=uniprot_id,
+        odb_gene_id=odb_gene_id,
+        query_id=query_id,
+        query_id_type=query_id_type,
+        query_sequence=query_sequence,
+        query_species_id=query_species_id,
+    )
+    if resolved_odb_gene_id is None:
+        query_info['processing params'] = asdict(config)
+        _save_outputs(config, query_info, failure_name, query_failure=True)
+        results_store.flush()
+        raise ValueError(query_info['critical error'])
+    level_results = _run_levels(config, og_levels, [(resolved_odb_gene_id, query_info, failure_name)])[0]
+    results_store.flush()
+    return level_results
+
+
+def main_pipeline_multi_query(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    og_levels: list[str],
+    queries: list[dict],
+) -> list[dict[str, tuple[Path, dict]]]:
+    """run the main pipeline for several genes at several OG levels
+
+    Gives the same results as calling `main_pipeline_multi_level` once per
+    query, but the OG members and sequences of all of the queries are read at
+    once, and the LDOs of the queries that select the same OG at a level are
+    found together (see `find_LDOs.find_LDOs_multi_query`), which is faster
+    for queries that share OGs (e.g. paralogs, see `og_selection.group_genes_by_og`)
+
+    Parameters
+    ----------
+    config : conf.PipelineParams
+        pipeline parameters in a PipelineParams object. `og_select_params.OG_level_name` is ignored
+    og_levels : list[str]
+        the level names to run the pipeline for (e.g. ["Vertebrata", "Mammalia"])
+    queries : list[dict]
+        the keyword arguments of each query (`uniprot_id`, `odb_gene_id`,
+        `query_id`, `query_id_type` or `query_sequence` and
+        `query_species_id`, see `main_pipeline`),
+        e.g. [{"odb_gene_id": "9606_0:002f40"}, {"uniprot_id": "Q8TC90"}]
+
+    Returns
+    -------
+    list[dict[str, tuple[Path, dict]]]
+        for each query, the info json file and the results of each level (see
+        `main_pipeline_multi_level`). If a query can't be resolved to an
+        orthoDB gene, the error is written to the failures folder as
+        `<query>_info.json` and every level of the query has the query
+        results with the "critical error"
+    """
+    og_levels = list(dict.fromkeys(og_levels))
+    results = [None] * len(queries)
+    resolved_queries = []
+    resolved_positions = []
+    for i, query in enumerate(queries):
+        failure_name = _query_failure_name(
+            query.get('uniprot_id'), query.get('odb_gene_id'), query.get('query_id'), query.get('query_sequence')
         )
-        if config.write_files:
-            alignment_folder = Path(config.main_output_folder) / 'alignments'
-            alignment_folder.mkdir(parents=True, exist_ok=True)
-            alignment_output_file = alignment_folder / f'{output_file_prefix}_clustered_ldos_aln.fasta'
-            with open(alignment_output_file, 'w') as f:
-                SeqIO.write(aln, f, 'fasta')
-            output_dict['alignment_clustered_ldos_file'] = str(alignment_output_file.resolve())
-            # output_dict['alignment_clustered_ldos_file_relative'] = str(alignment_output_file.resolve().relative_to(Path.cwd()))
-            output_dict['alignment_clustered_ldos_command'] = mafft_command
+        resolved_odb_gene_id, query_info = _resolve_query(**query)
+        if resolved_odb_gene_id is None:
+            query_info['processing params'] = asdict(config)
+            og_info_json_file = _save_outputs(config, query_info, failure_name, query_failure=True)
+            results[i] = {og_level: (og_info_json_file, query_info) for og_level in og_levels}
+            continue
+        resolved_queries.append((resolved_odb_gene_id, query_info, failure_name))
+        resolved_positions.append(i)
+    for i, level_results in zip(resolved_positions, _run_levels(config, og_levels, resolved_queries)):
+        results[i] = level_results
+    # the results of all of the queries are written together
+    results_store.flush()
+    return results
+
+
+def _run_levels(
+    config: orthodb_pipeline_parameters.PipelineParams,
+    og_levels: list[str],
+    queries: list[tuple[str, dict, str]],
+) -> list[dict[str, tuple[Path, dict]]]:
+    """run the pipeline stages after query resolution for resolved queries at several levels
 
-    output_dict['sequences_clustered_ldos'] = list(output_dict['sequences_clustered_ldos'].keys())
-    og_info_json_file = og_info_json_folder / f'{output_file_prefix}_info.json'
-    if config.write_files:
-        save_info_json(output_dict, og_info_json_file)
-    return og_info_json_file, output_dict
+    Parameters
+    ----------
+    queries : list[tuple[str, dict, str]]
+        the odb_gene_id, query information (see `_resolve_query`) and failure
+        name (see `_query_failure_name`) of each query
+
+    Returns
+    -------
+    list[dict[str, tuple[Path, dict]]]
+        for each query, the info json file and the results of each level
+    """
+    og_levels = list(dict.fromkeys(og_levels))
+    odb_gene_ids = list(dict.fromkeys(odb_gene_id for odb_gene_id, _, _ in queries))
+    # critical errors and selected OGs, by (odb_gene_id, level)
+    errors = {}
+    selected_ogs = {}
+    for odb_gene_id in odb_gene_ids:
+        try:
+            gene_levels = og_selection.get_gene_levels(odb_gene_id)
+        except ValueError as e:
+            for og_level in og_levels:
+                errors[(odb_gene_id, og_level)] = str(e)
+            continue
+        for og_level in og_levels:
+            try:
+                selected_ogs[(odb_gene_id, og_level)] = og_selection.select_OG_from_gene_levels(
+                    odb_gene_id, gene_levels, og_level
+                )
+            except ValueError as e:
+                errors[(odb_gene_id, og_level)] = str(e)
+
+    og_members = og_cache.get_og_members_bulk([ogid for ogid, _ in selected_ogs.values()])
+    level_members = {}
+    for (odb_gene_id, og_level), (ogid, _) in selected_ogs.items():
+        try:
+            level_members[(odb_gene_id, og_level)] = _filter_group_members(
+                _level_config(config, og_level), odb_gene_id, og_members[ogid]
+            )
+        except ValueError as e:
+            errors[(odb_gene_id, og_level)] = str(e)
+    # the sequences of every OG that aren't cached yet, read at once
+    og_requests = {}
+    for key, members in level_members.items():
+        og_requests.setdefault(selected_ogs[key][0], {}).update(dict.fromkeys(members))
+    og_sequences = og_cache.get_og_sequences_bulk(
+        {ogid: list(members) for ogid, members in og_requests.items()}
+    )
+
+    # the queries that selected the same OG at a level go through the stages together
+    stage_groups = {}
+    for (odb_gene_id, og_level), members in level_members.items():
+        ogid = selected_ogs[(odb_gene_id, og_level)][0]
+        stage_groups.setdefault((og_level, ogid), {})[odb_gene_id] = {
+            member: og_sequences[ogid][member] for member in members
+        }
+    stage_outputs = {}
+    for (og_level, ogid), query_sequence_dicts in stage_groups.items():
+        oglevel = selected_ogs[(next(iter(query_sequence_dicts)), og_level)][1]
+        og_outputs = _og_stages_multi_query(_level_config(config, og_level), ogid, oglevel, query_sequence_dicts)
+        for odb_gene_id, output_dict in og_outputs.items():
+            stage_outputs[(odb_gene_id, og_level)] = output_dict
+
+    results = []
+    for odb_gene_id, query_info, failure_name in queries:
+        level_results = {}
+        for og_level in og_levels:
+            level_config = _level_config(config, og_level)
+            if (odb_gene_id, og_level) in errors:
+                output_dict = {'critical error': errors[(odb_gene_id, og_level)]}
+            else:
+                # copied, in case more than one query resolved to the same gene
+                output_dict = dict(stage_outputs[(odb_gene_id, og_level)])
+            output_dict.update(query_info)
+            output_dict['processing params'] = asdict(level_config)
+            og_info_json_file = _save_outputs(level_config, output_dict, f'{failure_name}_{og_level}')
+            level_results[og_level] = (og_info_json_file, output_dict)
+        results.append(level_results)
+    return results
 
 
 if __name__ == "__main__":
@@ -244,6 +709,36 @@ if __name__ == "__main__":
         metavar='<str>',
         help='the odb gene id of the gene of interest (e.g. "9606_0:001c7b")'
     )
+    group.add_argument(
+        '-qid',
+        '--query_id',
+        type=str,
+        metavar='<str>',
+        help='an id of any type in the orthoDB gene or xref tables (e.g. a gene name or "XP_046437925.1")'
+    )
+    group.add_argument(
+        '-seq',
+        '--query_sequence',
+        type=str,
+        metavar='<str>',
+        help='the protein sequence of the gene of interest. It is matched to the orthoDB gene with an identical or the most similar sequence'
+    )
+    parser.add_argument(
+        '--query_id_type',
+        type=str,
+        metavar='<str>',
+        default=None,
+        help='''the namespace of --query_id (e.g. "NCBIproteinAcc", "Ensembl", "synonym").
+default=None (match the id in every namespace)'''
+    )
+    parser.add_argument(
+        '--query_species_id',
+        type=str,
+        metavar='<str>',
+        default=None,
+        help='''the orthoDB species id of --query_sequence (e.g. "9606_0"). If given, the sequence is only matched to genes of this species.
+default=None (match genes of any species)'''
+    )
     parser.add_argument(
         '-c',
         '--config',
@@ -254,4 +749,12 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
     config = load_config(args.config)
-    main_pipeline(config, args.uniprot_id, args.odb_gene_id)
+    main_pipeline(
+        config,
+        args.uniprot_id,
+        args.odb_gene_id,
+        args.query_id,
+        args.query_id_type,
+        args.query_sequence,
+        args.query_species_id,
+    )
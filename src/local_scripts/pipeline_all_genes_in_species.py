@@ -1,11 +1,11 @@
 import argparse
 import multiprocessing
-import shutil
-import traceback
-from pathlib import Path
 
 import local_config.orthodb_pipeline_parameters as conf
+import local_orthoDB_group_pipeline.og_selection as og_selection
 import local_orthoDB_group_pipeline.sql_queries as sql_queries
+import local_orthoDB_group_pipeline.task_scheduler as task_scheduler
+import local_scripts.batch_run as batch_run
 # import local_scripts.create_filemap as create_filemap
 import local_scripts.odb_group_pipeline as pipeline
 
@@ -13,22 +13,6 @@ SPECIES_ID = "9606_0"
 N_CORES = multiprocessing.cpu_count() - 2
 
 
-def multiple_levels(
-    config: conf.PipelineParams, query_odb_gene_id: str, og_levels: list
-):
-    """
-    run the pipeline for a single odb_gene_id for multiple og_levels
-    """
-    for og_level in og_levels:
-        config.og_select_params.OG_level_name = og_level
-        try:
-            pipeline.main_pipeline(config, odb_gene_id=query_odb_gene_id)
-        except ValueError as err:
-            traceback.print_exc()
-            # logger.error(f"{query_geneid} - {og_level} - {err}")
-            print(f"{query_odb_gene_id} - {og_level} - {err}")
-
-
 def main(
     config: conf.PipelineParams,
     og_levels: list,
@@ -36,24 +20,33 @@ def main(
     species_id=SPECIES_ID,
     n_cores=N_CORES,
     overwrite=False,
+    og_cache_mb: int | None = None,
+    resume=False,
+    max_tasks_per_child: int | None = task_scheduler.DEFAULT_MAX_TASKS_PER_CHILD,
+    n_threads: int | None = None,
+    pin_threads=False,
+    queue_file: str | None = None,
 ):
     odbgeneid_list = sql_queries.get_all_odb_gene_ids_from_species_id(species_id)
-    if Path(config.main_output_folder).exists():
-        if overwrite:
-            shutil.rmtree(config.main_output_folder)
-        else:
-            raise FileExistsError(
-                f"main_output_folder already exists: {config.main_output_folder}. Use -o flag to overwrite"
-            )
-    if multiprocess:
-        p = multiprocessing.Pool(n_cores)
-        f_args = [(config, i, og_levels) for i in odbgeneid_list]
-        p.starmap(multiple_levels, f_args)
-        p.close()
-        p.join()
-    else:
-        for i in odbgeneid_list:
-            multiple_levels(config, i, og_levels)
+    # genes that share an OG are run back to back by the same worker
+    gene_groups = og_selection.group_genes_by_og(odbgeneid_list, og_levels)
+    batch_run.prepare_output_folder(config, overwrite=overwrite, resume=resume)
+    batch_run.run_batch(
+        config,
+        odbgeneid_list,
+        gene_groups,
+        og_levels,
+        id_type="odb_gene_id",
+        n_cores=n_cores,
+        multiprocess=multiprocess,
+        og_cache_mb=og_cache_mb,
+        resume=resume,
+        max_tasks_per_child=max_tasks_per_child,
+        n_threads=n_threads,
+        pin_threads=pin_threads,
+        queue_file=queue_file,
+        overwrite=overwrite,
+    )
 
 
 if __name__ == "__main__":
@@ -86,12 +79,7 @@ if __name__ == "__main__":
         default=SPECIES_ID,
         help=f"""species id to use""",
     )
-    parser.add_argument(
-        "-o",
-        "--overwrite",
-        action="store_true",
-        help="""if flag is provided and the main_output_folder exists, it will be removed and overwritten by the new files. Otherwise, an error will be raised if the folder exists""",
-    )
+    batch_run.add_batch_arguments(parser)
     args = parser.parse_args()
     config = pipeline.load_config(args.config)
     main(
@@ -100,7 +88,7 @@ if __name__ == "__main__":
         multiprocess=True,
         species_id=args.species_id,
         n_cores=args.n_cores,
-        overwrite=args.overwrite,
+        **batch_run.batch_kwargs(args),
     )
     # create_filemap.create_filemap(
     #     config.main_output_folder,
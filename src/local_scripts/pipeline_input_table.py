@@ -1,14 +1,14 @@
 import argparse
 import multiprocessing
-import shutil
-import traceback
-from pathlib import Path
 from typing import Literal
 
 import pandas as pd
 
 import local_config.orthodb_pipeline_parameters as conf
-import local_orthoDB_group_pipeline.sql_queries as sql_queries
+import local_orthoDB_group_pipeline.og_selection as og_selection
+import local_orthoDB_group_pipeline.task_scheduler as task_scheduler
+import local_orthoDB_group_pipeline.uniprotid_search as uniprotid_search
+import local_scripts.batch_run as batch_run
 # import local_scripts.create_filemap as create_filemap
 import local_scripts.odb_group_pipeline as pipeline
 
@@ -16,32 +16,46 @@ N_CORES = multiprocessing.cpu_count() - 2
 OG_LEVELS = ["Eukaryota", "Mammalia", "Metazoa", "Tetrapoda", "Vertebrata"]
 
 
-def multiple_levels(
-    config: conf.PipelineParams,
-    gene_id: str,
+def map_ids_2_odb_gene_ids(
+    id_list: list[str], id_type: Literal["odb_gene_id", "uniprot_id"]
+) -> dict[str, str]:
+    """the odb_gene_id of each id. uniprot ids are mapped in bulk
+    (`uniprotid_search.map_uniprotids_bulk`), and ids that can't be mapped are left out
+    """
+    if id_type == "odb_gene_id":
+        return {gene_id: gene_id for gene_id in id_list}
+    map_df = uniprotid_search.map_uniprotids_bulk(id_list)
+    mapped_df = map_df.dropna(subset=["odb_gene_id"])
+    return dict(zip(mapped_df["uniprot_id"], mapped_df["odb_gene_id"]))
+
+
+def group_ids_by_og(
+    id_list: list[str],
     og_levels: list,
     id_type: Literal["odb_gene_id", "uniprot_id"],
-):
-    """
-    run the pipeline for a single odb_gene_id for multiple og_levels
+    odb_gene_id_map: dict[str, str] | None = None,
+) -> list[list[str]]:
+    """group the ids of genes that share an OG (see `og_selection.group_genes_by_og`)
+
+    uniprot ids are mapped to odb_gene_ids in bulk (or taken from
+    `odb_gene_id_map`, see `map_ids_2_odb_gene_ids`) just to group them; the
+    pipeline is still run with the uniprot ids. Ids that can't be mapped are
+    in a group of their own
     """
-    assert id_type in ["odb_gene_id", "uniprot_id"], f"id_type must be 'odb_gene_id' or 'uniprot_id', not {id_type}"
-    for og_level in og_levels:
-        config.og_select_params.OG_level_name = og_level
-        if id_type == "odb_gene_id":
-            try:
-                pipeline.main_pipeline(config, odb_gene_id=gene_id)
-            except ValueError as err:
-                traceback.print_exc()
-                # logger.error(f"{query_geneid} - {og_level} - {err}")
-                print(f"{gene_id} - {og_level} - {err}")
-        else:
-            try:
-                pipeline.main_pipeline(config, uniprot_id=gene_id)
-            except ValueError as err:
-                traceback.print_exc()
-                # logger.error(f"{query_geneid} - {og_level} - {err}")
-                print(f"{gene_id} - {og_level} - {err}")
+    if id_type == "odb_gene_id":
+        return og_selection.group_genes_by_og(id_list, og_levels)
+    if odb_gene_id_map is None:
+        odb_gene_id_map = map_ids_2_odb_gene_ids(id_list, id_type)
+    odb_2_uniprot_ids: dict[str, list[str]] = {}
+    for uniprot_id in id_list:
+        if uniprot_id in odb_gene_id_map:
+            odb_2_uniprot_ids.setdefault(odb_gene_id_map[uniprot_id], []).append(uniprot_id)
+    gene_groups = [
+        [uniprot_id for odb_gene_id in group for uniprot_id in odb_2_uniprot_ids[odb_gene_id]]
+        for group in og_selection.group_genes_by_og(list(odb_2_uniprot_ids), og_levels)
+    ]
+    gene_groups.extend([uniprot_id] for uniprot_id in id_list if uniprot_id not in odb_gene_id_map)
+    return gene_groups
 
 
 def main(
@@ -50,18 +64,20 @@ def main(
     og_levels: list,
     odb_gene_id_column: str | None = None,
     uniprot_id_column: str | None = None,
+    query_id_column: str | None = None,
+    query_id_type: str | None = None,
     n_cores=N_CORES,
     overwrite=False,
     multiprocess=True,
+    og_cache_mb: int | None = None,
+    resume=False,
+    max_tasks_per_child: int | None = task_scheduler.DEFAULT_MAX_TASKS_PER_CHILD,
+    n_threads: int | None = None,
+    pin_threads=False,
+    queue_file: str | None = None,
 ):
     table = pd.read_csv(table_file)
-    if Path(config.main_output_folder).exists():
-        if overwrite:
-            shutil.rmtree(config.main_output_folder)
-        else:
-            raise FileExistsError(
-                f"main_output_folder already exists: {config.main_output_folder}. Use -o flag to overwrite"
-            )
+    batch_run.prepare_output_folder(config, overwrite=overwrite, resume=resume)
 
     if odb_gene_id_column is not None:
         table = table.dropna(subset=[odb_gene_id_column])
@@ -71,25 +87,47 @@ def main(
         table = table.dropna(subset=[uniprot_id_column])
         id_list = list(table[uniprot_id_column].unique())
         id_type = "uniprot_id"
+    elif query_id_column is not None:
+        # resolve all of the ids to odb_gene_ids up front, in bulk
+        table = table.dropna(subset=[query_id_column])
+        map_df = uniprotid_search.map_query_ids_bulk(
+            list(table[query_id_column].unique()),
+            namespaces=None if query_id_type is None else [query_id_type],
+        )
+        unmapped = map_df[map_df["odb_gene_id"].isna()]
+        for query_id, reason in zip(unmapped["query_id"], unmapped["unmapped_reason"]):
+            print(f"{query_id} - {reason}")
+        id_list = list(map_df["odb_gene_id"].dropna().unique())
+        id_type = "odb_gene_id"
     else:
         raise ValueError(
-            "either odb_gene_id_column or uniprot_id_column must be provided"
+            "one of odb_gene_id_column, uniprot_id_column or query_id_column must be provided"
         )
-    if multiprocess:
-        p = multiprocessing.Pool(n_cores)
-        f_args = [(config, i, og_levels, id_type) for i in id_list]
-        p.starmap(multiple_levels, f_args)
-        p.close()
-        p.join()
-    else:
-        for i in id_list:
-            print(i)
-            multiple_levels(config, i, og_levels, id_type)
+    odb_gene_id_map = map_ids_2_odb_gene_ids(id_list, id_type)
+    # genes that share an OG are run back to back by the same worker
+    gene_groups = group_ids_by_og(id_list, og_levels, id_type, odb_gene_id_map)
+    batch_run.run_batch(
+        config,
+        id_list,
+        gene_groups,
+        og_levels,
+        id_type=id_type,
+        odb_gene_id_map=odb_gene_id_map,
+        n_cores=n_cores,
+        multiprocess=multiprocess,
+        og_cache_mb=og_cache_mb,
+        resume=resume,
+        max_tasks_per_child=max_tasks_per_child,
+        n_threads=n_threads,
+        pin_threads=pin_threads,
+        queue_file=queue_file,
+        overwrite=overwrite,
+    )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="run the pipeline for all odb_gene_ids in an input table",
+        description="run the pipeline for all genes in an input table",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     parser.add_argument(
@@ -129,12 +167,20 @@ if __name__ == "__main__":
         metavar="<str>",
         help="the name of the column in the input table containing the odb_gene_ids",
     )
+    group.add_argument(
+        "--query_id_column",
+        type=str,
+        metavar="<str>",
+        help="the name of a column in the input table containing ids of any type in the orthoDB gene or xref tables (e.g. gene names or NCBI protein accessions)",
+    )
     parser.add_argument(
-        "-o",
-        "--overwrite",
-        action="store_true",
-        help="""if flag is provided and the main_output_folder exists, it will be removed and overwritten by the new files. Otherwise, an error will be raised if the folder exists""",
+        "--query_id_type",
+        type=str,
+        metavar="<str>",
+        default=None,
+        help='the namespace of the ids in --query_id_column (e.g. "NCBIproteinAcc"). By default, the ids are matched in every namespace',
     )
+    batch_run.add_batch_arguments(parser)
     args = parser.parse_args()
     config = pipeline.load_config(args.config)
     main(
@@ -143,9 +189,11 @@ if __name__ == "__main__":
         og_levels=OG_LEVELS,
         odb_gene_id_column=args.odb_gene_id_column,
         uniprot_id_column=args.uniprot_id_column,
+        query_id_column=args.query_id_column,
+        query_id_type=args.query_id_type,
         n_cores=args.n_cores,
-        overwrite=args.overwrite,
         multiprocess=True,
+        **batch_run.batch_kwargs(args),
     )
     # create_filemap.create_filemap(
     #     config.main_output_folder,
@@ -0,0 +1,124 @@
+import argparse
+import multiprocessing
+import time
+import traceback
+
+import local_orthoDB_group_pipeline.og_cache as og_cache
+import local_orthoDB_group_pipeline.thread_budget as thread_budget
+import local_orthoDB_group_pipeline.work_queue as work_queue
+import local_scripts.batch_run as batch_run
+
+N_CORES = multiprocessing.cpu_count() - 2
+POLL_SECONDS = 30
+
+
+def worker(
+    queue_file: str,
+    lease_seconds: float = work_queue.DEFAULT_LEASE_SECONDS,
+    poll_seconds: float = POLL_SECONDS,
+) -> tuple[int, int]:
+    """
+    claim and run groups of tasks from the queue until every task is done or failed
+
+    A group that raises an error is returned to the queue (see `work_queue.WorkQueue.release`)
+
+    returns the number of groups that were run and that raised an error
+    """
+    queue = work_queue.WorkQueue(queue_file, lease_seconds=lease_seconds)
+    config = queue.get_config()
+    id_type = queue.get_id_type()
+    me = work_queue.worker_id()
+    n_groups, n_errors = 0, 0
+    while True:
+        gene_levels = queue.claim(me)
+        if gene_levels is None:
+            if queue.n_unfinished() == 0:
+                return n_groups, n_errors
+            # the remaining tasks are leased by other workers. Wait for them
+            # to finish, or for their leases to expire
+            time.sleep(poll_seconds)
+            continue
+        try:
+            with queue.heartbeat(me):
+                records = batch_run.run_gene_group(config, gene_levels, id_type)
+        except Exception:
+            traceback.print_exc()
+            queue.release(me, gene_levels, traceback.format_exc())
+            n_errors += 1
+            continue
+        queue.complete(me, records)
+        n_groups += 1
+
+
+def main(
+    queue_file: str,
+    n_workers=N_CORES,
+    lease_seconds: float = work_queue.DEFAULT_LEASE_SECONDS,
+    poll_seconds: float = POLL_SECONDS,
+    og_cache_mb: int | None = None,
+    n_threads: int | None = None,
+    pin_threads=False,
+):
+    if og_cache_mb is not None:
+        og_cache.configure(max_sequence_bytes=og_cache_mb * 2**20)
+    # the external tools of the workers on this host share one budget of threads
+    with thread_budget.shared_budget(n_threads, pin=pin_threads):
+        with multiprocessing.Pool(n_workers) as p:
+            worker_counts = p.starmap(worker, [(queue_file, lease_seconds, poll_seconds)] * n_workers)
+    print(
+        f"ran {sum(n for n, _ in worker_counts):,} groups on {n_workers} workers "
+        f"({sum(n for _, n in worker_counts):,} raised an error)"
+    )
+    queue = work_queue.WorkQueue(queue_file)
+    print(queue.status_counts())
+    batch_run.update_filemap_index(queue.get_config())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="""run pipeline tasks from a shared queue until it is empty.
+    The queue is created by pipeline_all_genes_in_species.py or pipeline_input_table.py with --queue.
+    Start this script on as many hosts as you want, with the same queue file""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-q",
+        "--queue",
+        type=str,
+        metavar="<file>",
+        required=True,
+        help="""path to the queue file (on a filesystem shared by all of the hosts)""",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_workers",
+        type=int,
+        metavar="<int>",
+        default=N_CORES,
+        help="""number of worker processes to start on this host""",
+    )
+    parser.add_argument(
+        "--lease_seconds",
+        type=float,
+        metavar="<float>",
+        default=work_queue.DEFAULT_LEASE_SECONDS,
+        help="""how long a claimed group stays claimed without a heartbeat from its worker. The groups of workers that die are run again after this""",
+    )
+    parser.add_argument(
+        "--poll_seconds",
+        type=float,
+        metavar="<float>",
+        default=POLL_SECONDS,
+        help="""how long an idle worker waits before checking the queue again""",
+    )
+    batch_run.add_worker_arguments(parser, n_threads_help="the workers on this host")
+    args = parser.parse_args()
+    main(
+        args.queue,
+        n_workers=args.n_workers,
+        lease_seconds=args.lease_seconds,
+        poll_seconds=args.poll_seconds,
+        og_cache_mb=args.og_cache_mb,
+        n_threads=args.n_threads,
+        pin_threads=args.pin_threads,
+    )
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import argparse
+
+import pandas as pd
+
+from local_orthoDB_group_pipeline import gene_search
+
+
+def main(query: str, species: list[str] | None = None, limit: int = 20, prefix: bool = False, output_file: str | None = None):
+    results_df = gene_search.search_genes(query, species=species, limit=limit, prefix=prefix)
+    if output_file is not None:
+        results_df.to_csv(output_file, index=False)
+        return
+    with pd.option_context("display.max_rows", None, "display.max_colwidth", 60, "display.width", 200):
+        print(results_df.drop(columns=["score"]).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='''search the orthoDB genes by gene name, id or description and print the matching odb_gene_ids.
+example: search_genes.py PPT2 -s "Homo sapiens"''',
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        'query',
+        type=str,
+        nargs='+',
+        help='''words to search for. genes must match all of the words''',
+    )
+    parser.add_argument(
+        '-s',
+        '--species',
+        type=str,
+        metavar='<str>',
+        action='append',
+        default=None,
+        help='''only search genes from this species. A species id ("9606_0"), NCBI taxonomy id ("9606")
+or species name ("Homo sapiens"). Can be given more than once. Default: all species''',
+    )
+    parser.add_argument(
+        '-n',
+        '--limit',
+        type=int,
+        metavar='<int>',
+        default=20,
+        help='''maximum number of genes to return. Default: 20''',
+    )
+    parser.add_argument(
+        '-p',
+        '--prefix',
+        action='store_true',
+        help='''also match words that start with the query words (e.g. "PPT" matches "PPT2")''',
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=str,
+        metavar='<file>',
+        default=None,
+        help='''write the results to this csv file instead of printing them''',
+    )
+    args = parser.parse_args()
+    main(' '.join(args.query), args.species, args.limit, args.prefix, args.output)
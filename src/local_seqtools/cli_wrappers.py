@@ -23,7 +23,7 @@ def mafft_align_wrapper(
     # create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
     # write seqrecords to temporary file
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(tools.to_seqrecord_list(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     # run mafft
     alignment_filename = f"{temp_file.name}-mafft.fa"
@@ -45,12 +45,14 @@ def cd_hit_wrapper(
     input_seqrecord_list: list[SeqIO.SeqRecord],
     cd_hit_executable: str = env.CD_HIT_EXECUTABLE,
     extra_args: str = env.CD_HIT_ADDITIONAL_ARGUMENTS,
+    n_threads: int | None = None,
 ) -> tuple[str, dict[str, SeqIO.SeqRecord], dict[str, dict[str, list[str]]]]:
+    # if n_threads is given, it overrides any `-T` in extra_args
 
     # create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
     # write seqrecords to temporary file
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(tools.to_seqrecord_list(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     clustered_seqs_filename = f"{temp_file.name}-cdhit.fa"
     # raise an error if the alignment file already exists. (it won't but just in case)
@@ -59,6 +61,8 @@ def cd_hit_wrapper(
 
     clustered_seqs_clusters_filename = clustered_seqs_filename + ".clstr"
     command = f"{cd_hit_executable} -i {temp_file.name} -o {clustered_seqs_filename} -M 0 -d 0 -g 1 {extra_args}"
+    if n_threads is not None:
+        command += f" -T {n_threads}"
     subprocess.run(command, shell=True, check=True)
 
     output_clstrs_dict = cdhit_tools.cd_hit_clstr_parser(
@@ -89,7 +93,7 @@ def clustal_align_wrapper(
     # create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
     # write seqrecords to temporary file
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(tools.to_seqrecord_list(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     alignment_filename = f"{temp_file.name}-clustal.fa"
     # raise an error if the alignment file already exists. (it won't but just in case)
@@ -129,7 +133,7 @@ def muscle_align_wrapper(
     ], f'`output_type` must be one of ["list", "dict", "alignment"]'
 
     temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
-    SeqIO.write(input_seqrecord_list, temp_file, "fasta")
+    SeqIO.write(tools.to_seqrecord_list(input_seqrecord_list), temp_file, "fasta")
     temp_file.close()
     alignment_filename = f"{temp_file.name}-muscle.fa"
     # raise an error if the alignment file already exists. (it won't but just in case)
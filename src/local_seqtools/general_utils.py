@@ -31,6 +31,17 @@ def import_fasta(fasta_path, output_format='list') -> list[SeqRecord]|dict[str,
     return seqs
 
 
+def to_seqrecord_list(records) -> list[SeqRecord]:
+    """convert a list of sequence records to Biopython SeqRecords for writing to fasta
+
+    SeqRecords are passed through unchanged. Any other record is converted with
+    its `to_seqrecord` method (e.g. `local_orthoDB_group_pipeline.sequence_record.SequenceRecord`)
+    """
+    return [
+        record if isinstance(record, SeqRecord) else record.to_seqrecord()
+        for record in records
+    ]
+
 
 class FastaImporter:
     """import fasta file and return seqrecord objects in various formats